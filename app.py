@@ -1,8 +1,25 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
 from my_funasr.funasr_pipeline import FunASRPipeline
-from task_manager import TaskManager
+from my_funasr.audio_preprocess import estimate_duration
+from my_funasr.upload import spool_multipart, extract_zip, is_zip_upload, discard_payload, UploadTooLargeError, TooManyFilesError, InvalidUploadError
+from my_funasr.streaming import StreamingSession, StreamingStats
+from my_funasr.process_pool import ProcessPoolRunner
+from my_funasr.stage_pipeline import StagePipeline, parse_stage_workers
+from my_funasr.result_cache import ResultCache, result_key
+from my_funasr.metrics import metrics, SUBMISSIONS
+from task_manager import TaskManager, FINISHED_STATUSES
+from task_store import SQLiteTaskStore
+from job_scheduler import JobScheduler, QueueFullError, SchedulerClosedError, PRIORITY_CLASSES
 import uuid, asyncio
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+import json
+import threading
+import zipfile
+import math
+import tempfile
 import os
 import torch
 
@@ -25,8 +42,24 @@ device = detect_device()
 app = FastAPI(title="FunASR Async Service", description="ASR with punctuation & diarization", version="2.0")
 
 # 初始化任务管理器与模型管线
-task_manager = TaskManager()
-asr_pipeline = FunASRPipeline(
+# 保留策略：结束后释放音频负载；已结束任务 TTL 后删除；payload 超出内存预算时落盘为 memmap
+# 任务表后端：memory = 进程内字典（默认）；sqlite = TASK_DB_PATH 处的 SQLite（WAL）+ 旁边的 payload 文件目录，
+# 多个 uvicorn worker / 同机副本共享任务状态与排队队列，重启后任务不丢失
+TASK_STORE = os.environ.get("TASK_STORE", "memory")
+if TASK_STORE == "sqlite":
+    task_manager = SQLiteTaskStore(
+        os.environ.get("TASK_DB_PATH", os.path.join(tempfile.gettempdir(), "funasr_tasks", "tasks.db")),
+        payload_dir=os.environ.get("TASK_PAYLOAD_DIR") or None,
+        ttl_seconds=float(os.environ.get("TASK_TTL_S", "3600")),
+    )
+else:
+    task_manager = TaskManager(
+        ttl_seconds=float(os.environ.get("TASK_TTL_S", "3600")),
+        max_memory_bytes=int(float(os.environ.get("TASK_MEMORY_MB", "2048")) * 1024 * 1024),
+        spill_dir=os.environ.get("TASK_SPILL_DIR", os.path.join(tempfile.gettempdir(), "funasr_spill")),
+    )
+task_manager.start_janitor()
+PIPELINE_CONFIG = dict(
     # 主线 ASR 改为 SenseVoiceSmall
     asr_model_dir="/Users/minichen/Downloads/Models/funasr-python/funasr-2/models/SenseVoiceSmall",
     # 可选：外部标点模型（一般不需要）
@@ -38,11 +71,171 @@ asr_pipeline = FunASRPipeline(
     use_diarization=False,
     # 关闭独立 SenseSmallVoice，避免重复加载
     sense_model_dir=None,
-    # 官方 VAD 暂不启用
+    # 官方 VAD 暂不启用（使用内置能量 VAD 分段）
     vad_model_dir=None,
     # 增强模型使用 ModelScope ID，确保加载正确的管线
     enhance_model_dir="dengcunqin/speech_mossformer2_noise_reduction_16k",
+    # 跨任务 ASR 微批：单批最大分段数 / 最长等待窗口（毫秒）
+    asr_batch_size=int(os.environ.get("ASR_BATCH_SIZE", "8")),
+    asr_batch_wait_ms=float(os.environ.get("ASR_BATCH_WAIT_MS", "20")),
+    # 波形缓存字节预算（解码结果 + 增强音频 + VAD 分段）
+    audio_cache_bytes=int(float(os.environ.get("AUDIO_CACHE_MB", "1024")) * 1024 * 1024),
+    # 分段上限与重叠：长录音切成有界分段后批量识别
+    max_segment_s=float(os.environ.get("ASR_MAX_SEGMENT_S", "30")),
+    segment_overlap_s=float(os.environ.get("ASR_SEGMENT_OVERLAP_S", "1.0")),
+    # 并行加载模型的线程数
+    model_load_workers=int(os.environ.get("MODEL_LOAD_WORKERS", "4")),
 )
+asr_pipeline = FunASRPipeline(**PIPELINE_CONFIG)
+if TASK_STORE != "sqlite":
+    # payload 落盘为 memmap 时一并移除波形缓存中的同一数组，内存才真正释放
+    task_manager.on_spill = lambda payload, field, value: asr_pipeline.audio_cache.discard_value(payload.get("audio_hash"), value)
+# 模型加载方式：background = 启动后后台并行加载；lazy = 各阶段首次使用时才加载
+# （lazy 下 /ready 在模型登记完成即返回 200，首个请求承担加载耗时）
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "background")
+
+# 执行方式：thread = 推理在本进程线程中运行；process = 全流程任务交给独立的 worker 进程
+# （每个进程一份模型，torch 线程数 = ASR_TORCH_THREADS，缺省为 CPU 核数 / worker 数），
+# 解码后的波形经共享内存交给 worker，结果回写 TaskManager；
+# stage = 全流程拆成 decode/enhance/segment/diarization/asr/combine 阶段流水线，不同任务在不同模型上重叠执行。
+# 批量任务同样走所选执行方式；跨文件按时长统一排序分段只在 thread 模式下进行
+ASR_EXEC_MODE = os.environ.get("ASR_EXEC_MODE", "thread")
+process_pool = None
+stage_pipeline = None
+if ASR_EXEC_MODE == "stage":
+    # 各阶段 worker 数，如 STAGE_WORKERS="decode=2,enhance=1,asr=4"；阶段间队列长度 STAGE_QUEUE_SIZE
+    stage_pipeline = StagePipeline(
+        asr_pipeline, task_manager,
+        workers=parse_stage_workers(os.environ.get("STAGE_WORKERS", "")),
+        queue_size=int(os.environ.get("STAGE_QUEUE_SIZE", "8")),
+    )
+# 调度器 worker 数；stage 模式下即流水线中同时在途的任务数，缺省为各阶段 worker 数之和
+ASR_WORKERS = int(os.environ.get("ASR_WORKERS") or (sum(stage_pipeline.workers.values()) if stage_pipeline else 2))
+if ASR_EXEC_MODE == "process":
+    process_pool = ProcessPoolRunner(
+        asr_pipeline, PIPELINE_CONFIG, task_manager,
+        num_workers=ASR_WORKERS,
+        torch_threads=int(os.environ["ASR_TORCH_THREADS"]) if os.environ.get("ASR_TORCH_THREADS") else None,
+        # 单任务超时 = max(ASR_MIN_TASK_TIMEOUT_S, 音频时长 × ASR_TASK_TIMEOUT_FACTOR)，超时杀掉并重启 worker
+        task_timeout_factor=float(os.environ.get("ASR_TASK_TIMEOUT_FACTOR", "5")),
+        min_task_timeout_s=float(os.environ.get("ASR_MIN_TASK_TIMEOUT_S", "120")),
+        # 等待 worker 领取的上限（秒）：调度线程最多阻塞 ASR_POOL_QUEUE_WAIT_S + 单任务超时
+        max_queue_wait_s=float(os.environ.get("ASR_POOL_QUEUE_WAIT_S", "600")),
+    )
+
+# 结果缓存：键为音频内容哈希 + 管线配置；内存 LRU + 磁盘 JSON，均带 TTL（RESULT_CACHE_DIR 置空则只用内存）
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", "1024")),
+    ttl_seconds=float(os.environ.get("RESULT_CACHE_TTL_S", "86400")),
+    cache_dir=os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "funasr_results")),
+    max_disk_entries=int(os.environ.get("RESULT_CACHE_DISK_ENTRIES", "10000")),
+)
+# 在途去重：结果键 -> 正在处理的 task_id，相同音频的重复提交直接挂到已有任务上
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _finish_inflight(task_id):
+    """全流程结束：成功结果写入结果缓存，并解除在途登记"""
+    task = task_manager.get_task(task_id)
+    key = ((task or {}).get("payload") or {}).get("result_key")
+    if not key:
+        return
+    if task.get("status") == "done" and task.get("result") is not None:
+        result_cache.put(key, task["result"])
+    with _inflight_lock:
+        if _inflight.get(key) == task_id:
+            del _inflight[key]
+
+# 有界推理调度：固定 worker 数 + 优先级等待队列，队列满时拒绝新任务
+def _run_full_job(task_id):
+    payload = task_manager.get_payload(task_id)
+    try:
+        if process_pool is not None:
+            process_pool.run_full(task_id, asr_pipeline._payload_source(payload))
+        elif stage_pipeline is not None:
+            stage_pipeline.run_full(task_id, asr_pipeline._payload_source(payload))
+        else:
+            asr_pipeline._run_full_sync(task_id, asr_pipeline._payload_source(payload), task_manager)
+    finally:
+        _finish_inflight(task_id)
+
+job_scheduler = JobScheduler(
+    handlers={
+        "full": _run_full_job,
+        "batch": lambda batch_id: _run_batch_job(batch_id),
+        "enhanced": lambda task_id: asr_pipeline._enhanced_sync(task_id, task_manager),
+        "vad": lambda task_id: asr_pipeline._vad_sync(task_id, task_manager),
+        "transformer": lambda task_id: asr_pipeline._transformer_sync(task_id, task_manager),
+    },
+    num_workers=ASR_WORKERS,
+    max_queue=int(os.environ.get("ASR_MAX_QUEUE", "64")),
+    short_clip_s=float(os.environ.get("ASR_SHORT_CLIP_S", "60")),
+    long_clip_s=float(os.environ.get("ASR_LONG_CLIP_S", "600")),
+    # sqlite 任务表：各进程从共享的 jobs 表领取作业
+    job_store=task_manager if TASK_STORE == "sqlite" else None,
+)
+
+def _enqueue(task_id, kind, priority=None, est_duration=None):
+    """提交到调度器；队列满返回 429，调度器关闭返回 503。
+
+    共享队列下会访问数据库，async 路由需经 run_in_threadpool 调用，避免阻塞事件循环
+    """
+    try:
+        return job_scheduler.submit(task_id, kind, priority=priority, est_duration=est_duration)
+    except QueueFullError as e:
+        retry_after = str(max(1, math.ceil(e.retry_after or 1)))
+        raise HTTPException(status_code=429, detail="Too many pending jobs, retry later", headers={"Retry-After": retry_after})
+    except SchedulerClosedError:
+        raise HTTPException(status_code=503, detail="Service is shutting down")
+
+def _task_duration(task):
+    payload = task.get("payload") or {}
+    if payload.get("duration") is not None:
+        return payload["duration"]
+    source = asr_pipeline._payload_source(payload)
+    if source is not None:
+        return estimate_duration(source)
+    return None
+
+# 上传限制：超过 MAX_UPLOAD_MB 直接 413；超过 UPLOAD_SPOOL_MB 的上传落盘而不常驻内存
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", "512")) * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(float(os.environ.get("UPLOAD_SPOOL_MB", "4")) * 1024 * 1024)
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "funasr_uploads"))
+# 批量上传：整个请求体上限、单批文件数上限；批量任务按约 BATCH_WINDOW_AUDIO_S 秒音频为一窗统一调度分段
+MAX_BATCH_UPLOAD_BYTES = int(float(os.environ.get("MAX_BATCH_UPLOAD_MB", "4096")) * 1024 * 1024)
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "1000"))
+# 单次批量请求解压出的音频总字节上限（zip 炸弹防护）
+MAX_BATCH_EXTRACTED_BYTES = int(float(os.environ.get("MAX_BATCH_EXTRACTED_MB", "8192")) * 1024 * 1024)
+BATCH_WINDOW_AUDIO_S = float(os.environ.get("BATCH_WINDOW_AUDIO_S", "600"))
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """在读取请求体之前按 Content-Length 拒绝超限上传（分块传输的请求由 spool_multipart 在接收过程中限制）"""
+    if request.method == "POST" and request.url.path.startswith(("/asr/submit", "/asr/batch")):
+        limit = MAX_BATCH_UPLOAD_BYTES if request.url.path.startswith("/asr/batch") else MAX_UPLOAD_BYTES
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > limit:
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds {limit} bytes"})
+    return await call_next(request)
+
+@app.on_event("startup")
+def preload_models():
+    # 不阻塞启动：/health 立即可用，加载进度见 /ready；进程池模式下模型由各 worker 进程加载
+    if process_pool is not None:
+        process_pool.start()
+    elif MODEL_LOAD_MODE != "lazy":
+        asr_pipeline.preload_models()
+    if TASK_STORE == "sqlite":
+        # 共享队列里可能已有其他进程提交或重启前遗留的作业，不等本进程收到提交就开始领取
+        job_scheduler.start()
+
+@app.on_event("shutdown")
+def shutdown_scheduler():
+    job_scheduler.shutdown(wait=False)
+    if process_pool is not None:
+        process_pool.shutdown()
+    if stage_pipeline is not None:
+        stage_pipeline.shutdown()
 
 @app.get("/env")
 def env():
@@ -53,53 +246,367 @@ def env():
         "matmul_precision": "high",
     }
 
-@app.post("/asr/submit")
-async def submit_asr(file: UploadFile = File(...)):
-    """接收音频文件并启动异步识别任务（增强->VAD分段/分离->ASR）"""
-    if file.content_type not in ["audio/wav", "audio/x-wav", "audio/mpeg", "audio/mp3"]:
-        raise HTTPException(status_code=400, detail="Unsupported audio format")
+def _multipart_schema(file_field, multiple=False):
+    """上传接口自行解析请求体，在 OpenAPI 中补上表单结构"""
+    file_schema = {"type": "string", "format": "binary"}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [file_field],
+        "properties": {
+            file_field: {"type": "array", "items": file_schema} if multiple else file_schema,
+            "priority": {"type": "string", "enum": list(PRIORITY_CLASSES)},
+        },
+    }}}}}
+
+async def _read_upload_form(request, **limits):
+    """流式解析上传表单：小文件留在内存，大文件直接落盘（只写一次）；同时计算内容哈希并在接收过程中检查大小上限"""
+    try:
+        return await spool_multipart(request.headers, request.stream(), spool_dir=UPLOAD_DIR, memory_limit=UPLOAD_SPOOL_BYTES, **limits)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {e.limit} bytes")
+    except TooManyFilesError as e:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {e.limit} files")
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}")
+
+def _check_priority(priority):
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority, expected one of {list(PRIORITY_CLASSES)}")
 
-    audio_bytes = await file.read()
+@app.post("/asr/submit", openapi_extra=_multipart_schema("file"))
+async def submit_asr(request: Request):
+    """接收音频文件（表单字段 file）并启动异步识别任务（增强->VAD分段/分离->ASR）；priority 可选 high/normal/low，缺省按时长自动分级"""
+    fields, files = await _read_upload_form(request, max_file_bytes=MAX_UPLOAD_BYTES, max_body_bytes=MAX_UPLOAD_BYTES, max_files=1)
+    try:
+        if not files or files[0].field != "file":
+            raise HTTPException(status_code=400, detail="Missing form field: file")
+        if files[0].content_type not in ["audio/wav", "audio/x-wav", "audio/mpeg", "audio/mp3"]:
+            raise HTTPException(status_code=400, detail="Unsupported audio format")
+        priority = fields.get("priority") or None
+        _check_priority(priority)
+    except HTTPException:
+        for part in files:
+            discard_payload(part.payload)
+        raise
+    payload = files[0].payload
+    # 任务表（sqlite 时为数据库事务 + payload 文件）与调度器的同步调用放到线程池，不阻塞事件循环
+    return await run_in_threadpool(_register_submission, payload, priority)
+
+def _register_submission(payload, priority):
+    """登记单文件任务：结果缓存命中直接完成，相同音频在途则合并，否则排队"""
     task_id = str(uuid.uuid4())
+    key = result_key(payload["audio_hash"], asr_pipeline.result_config())
+    payload["result_key"] = key
+
+    # 结果缓存命中：直接生成已完成的任务（上传的音频随之释放）
+    cached = result_cache.get(key)
+    if cached is not None:
+        task_manager.create_task(task_id, status="queued", payload=payload, cache_hit=True)
+        task_manager.update_task(task_id, status="done", result=cached, progress=1.0, message="done (result cache hit)")
+        SUBMISSIONS.inc(outcome="cache_hit")
+        return {"task_id": task_id, "status": "done", "cache_hit": True}
+
+    # 注册任务 + 缓存原始音频（字节或落盘路径）
+    task_manager.create_task(task_id, status="queued", payload=payload)
+
+    # 相同音频已在处理中：撤销新任务，返回已有任务
+    with _inflight_lock:
+        existing = _inflight.get(key)
+        existing_task = task_manager.get_task(existing) if existing else None
+        if existing_task is not None and existing_task.get("status") not in FINISHED_STATUSES:
+            coalesced = True
+        else:
+            coalesced = False
+            _inflight[key] = task_id
+    if coalesced:
+        task_manager.delete_task(task_id)
+        SUBMISSIONS.inc(outcome="coalesced")
+        return {"task_id": existing, "status": "processing", "cache_hit": False, "coalesced": True,
+                "queue": job_scheduler.queue_info(existing)}
+
+    # 交给调度器排队（全流程）；被拒绝时撤销任务
+    est_duration = estimate_duration(asr_pipeline._payload_source(payload))
+    try:
+        queue = _enqueue(task_id, "full", priority=priority, est_duration=est_duration)
+    except HTTPException:
+        with _inflight_lock:
+            if _inflight.get(key) == task_id:
+                del _inflight[key]
+        task_manager.delete_task(task_id)
+        raise
 
-    # 注册任务 + 缓存原始音频
-    task_manager.create_task(task_id, status="pending", payload={"audio_bytes": audio_bytes})
+    SUBMISSIONS.inc(outcome="new")
+    return {"task_id": task_id, "status": "processing", "cache_hit": False, "queue": queue}
 
-    # 启动后台任务（全流程）
-    asyncio.create_task(asr_pipeline.run_full_task(task_id, audio_bytes, task_manager))
+# ===== 批量任务：一次提交多个文件（multipart 列表或 zip），父任务 + 子任务 =====
+def _batch_children(parent):
+    return ((parent or {}).get("result") or {}).get("children")
 
-    return {"task_id": task_id, "status": "processing"}
+def _on_batch_child_finished(batch_id, task_id):
+    """子任务结束：写入结果缓存，更新父任务计数与进度"""
+    _finish_inflight(task_id)
+    parent = task_manager.get_task(batch_id)
+    child = task_manager.get_task(task_id)
+    if parent is None or child is None:
+        return
+    summary = dict(parent["result"])
+    summary["completed" if child["status"] == "done" else "failed"] += 1
+    finished = summary["completed"] + summary["failed"]
+    task_manager.update_task(batch_id, result=summary, progress=finished / max(1, summary["total"]), message=f"batch: {finished}/{summary['total']} files finished")
+
+def _run_batch_job(batch_id):
+    parent = task_manager.get_task(batch_id)
+    pending = (task_manager.get_payload(batch_id) or {}).get("pending", [])
+    if parent is None:
+        return
+    task_manager.update_task(batch_id, status="running", message=f"batch: processing {len(pending)} files")
+    children = []
+    for task_id in pending:
+        task_manager.update_task(task_id, status="running")
+        children.append((task_id, asr_pipeline._payload_source(task_manager.get_payload(task_id))))
+    try:
+        _run_batch_children(batch_id, children)
+    finally:
+        summary = (task_manager.get_task(batch_id) or {}).get("result") or {}
+        task_manager.update_task(batch_id, status="done", progress=1.0, message=f"batch: {summary.get('completed', 0)} done, {summary.get('failed', 0)} failed")
+
+def _run_batch_children(batch_id, children):
+    """按执行方式处理批量子任务：thread 模式跨文件统一排序分段凑批；process / stage 模式交给进程池 / 阶段流水线，
+    父进程不加载模型（分段仍经各自的微批调度器与其他任务凑批，但不做跨文件排序）"""
+    on_finished = lambda task_id: _on_batch_child_finished(batch_id, task_id)
+    if process_pool is not None:
+        # 并发数与 worker 进程数一致，更多的子任务在本线程池中排队
+        def run_child(task_id, source):
+            try:
+                process_pool.run_full(task_id, source)
+            finally:
+                on_finished(task_id)
+        with ThreadPoolExecutor(max_workers=process_pool.num_workers, thread_name_prefix="batch-child") as executor:
+            for task_id, source in children:
+                executor.submit(run_child, task_id, source)
+    elif stage_pipeline is not None:
+        # 逐个进入 decode 队列（队列满时阻塞），与其他任务共享各阶段 worker
+        futures = []
+        for task_id, source in children:
+            try:
+                future = stage_pipeline.submit(task_id, source)
+            except Exception as e:
+                task_manager.update_task(task_id, status="error", error=str(e), message="pipeline error")
+                on_finished(task_id)
+                continue
+            future.add_done_callback(lambda _f, task_id=task_id: on_finished(task_id))
+            futures.append(future)
+        wait_futures(futures)
+    else:
+        asr_pipeline._run_batch_sync(children, task_manager, on_child_finished=on_finished, window_audio_s=BATCH_WINDOW_AUDIO_S)
+
+async def _collect_batch_files(files):
+    """展开已落盘的 multipart 文件列表（zip 逐个解压出音频），返回 [(文件名, payload), ...]；zip 包本身解压后删除"""
+    collected = []
+    try:
+        for i, upload in enumerate(files):
+            if is_zip_upload(upload):
+                archive = upload.payload
+                try:
+                    members = await asyncio.to_thread(extract_zip, asr_pipeline._payload_source(archive), max_member_bytes=MAX_UPLOAD_BYTES,
+                                                      spool_dir=UPLOAD_DIR, memory_limit=UPLOAD_SPOOL_BYTES, max_members=MAX_BATCH_FILES - len(collected),
+                                                      max_total_bytes=MAX_BATCH_EXTRACTED_BYTES,
+                                                      extracted_bytes=sum(p.get("upload_size", 0) for _, p in collected))
+                finally:
+                    discard_payload(archive)
+                collected.extend(members)
+            else:
+                if not (upload.content_type or "").startswith("audio/"):
+                    raise HTTPException(status_code=400, detail=f"Unsupported file in batch: {upload.filename}")
+                if len(collected) >= MAX_BATCH_FILES:
+                    raise TooManyFilesError(MAX_BATCH_FILES)
+                collected.append((upload.filename, upload.payload))
+    except BaseException:
+        for _, payload in collected:
+            discard_payload(payload)
+        # 当前及尚未处理的上传一并删除
+        for upload in files[i:]:
+            discard_payload(upload.payload)
+        raise
+    return collected
+
+@app.post("/asr/batch", openapi_extra=_multipart_schema("files", multiple=True))
+async def submit_batch(request: Request):
+    """批量提交：multipart 多文件（表单字段 files）或 zip 包，生成父任务与逐文件子任务；所有文件的分段统一按时长排序凑批识别。
+
+    结果缓存命中的文件直接完成；进度见 /asr/batch/{batch_id}/status，结果以 JSONL 流式下载：/asr/batch/{batch_id}/results
+    """
+    # zip 包按整批上限、单个音频按单文件上限，均在接收过程中检查
+    fields, files = await _read_upload_form(
+        request, max_file_bytes=lambda part: MAX_BATCH_UPLOAD_BYTES if is_zip_upload(part) else MAX_UPLOAD_BYTES,
+        max_body_bytes=MAX_BATCH_UPLOAD_BYTES, max_files=MAX_BATCH_FILES,
+    )
+    priority = fields.get("priority", "low") or None
+    try:
+        if not files:
+            raise HTTPException(status_code=400, detail="Missing form field: files")
+        _check_priority(priority)
+    except HTTPException:
+        for part in files:
+            discard_payload(part.payload)
+        raise
+    try:
+        collected = await _collect_batch_files(files)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {e.limit} bytes")
+    except TooManyFilesError as e:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {e.limit} files")
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    if not collected:
+        raise HTTPException(status_code=400, detail="No audio files in batch")
+    return await run_in_threadpool(_register_batch, collected, priority)
+
+def _register_batch(collected, priority):
+    """登记批量任务"""
+    # 先建子任务（结果缓存命中的直接完成），再建父任务；父任务 result 记录子任务列表与计数
+    batch_id = str(uuid.uuid4())
+    config = asr_pipeline.result_config()
+    children, pending, completed, est_duration = [], [], 0, 0.0
+    for filename, payload in collected:
+        task_id = str(uuid.uuid4())
+        key = result_key(payload["audio_hash"], config)
+        payload["result_key"] = key
+        children.append({"task_id": task_id, "filename": filename})
+        cached = result_cache.get(key)
+        if cached is not None:
+            task_manager.create_task(task_id, status="queued", payload=payload, cache_hit=True)
+            task_manager.update_task(task_id, status="done", result=cached, progress=1.0, message="done (result cache hit)")
+            completed += 1
+            SUBMISSIONS.inc(outcome="cache_hit")
+            continue
+        task_manager.create_task(task_id, status="queued", payload=payload)
+        pending.append(task_id)
+        est_duration += estimate_duration(asr_pipeline._payload_source(payload))
+        SUBMISSIONS.inc(outcome="new")
+
+    summary = {"batch": True, "children": children, "total": len(children), "completed": completed, "failed": 0}
+    task_manager.create_task(batch_id, status="queued", payload={"pending": pending})
+    if not pending:
+        task_manager.update_task(batch_id, status="done", result=summary, progress=1.0, message="batch: all results from cache")
+        return {"batch_id": batch_id, "status": "done", "files": children}
+    task_manager.update_task(batch_id, result=summary, progress=completed / len(children), message=f"batch: {len(pending)} files queued")
+    try:
+        queue = _enqueue(batch_id, "batch", priority=priority, est_duration=est_duration)
+    except HTTPException:
+        for child in children:
+            task_manager.delete_task(child["task_id"])
+        task_manager.delete_task(batch_id)
+        raise
+    return {"batch_id": batch_id, "status": "processing", "files": children, "queue": queue}
+
+@app.get("/asr/batch/{batch_id}/status")
+def batch_status(batch_id: str):
+    """批量任务汇总：总数、完成/失败数、进度与各子任务状态"""
+    parent = task_manager.get_task(batch_id)
+    children = _batch_children(parent)
+    if children is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    summary = parent["result"]
+    files = []
+    for child in children:
+        task = task_manager.get_task(child["task_id"]) or {}
+        files.append({**child, "status": task.get("status", "expired"), "progress": task.get("progress"), "cache_hit": task.get("cache_hit", False)})
+    return {"batch_id": batch_id, "status": parent["status"], "version": parent["version"], "progress": parent["progress"],
+            "total": summary["total"], "completed": summary["completed"], "failed": summary["failed"], "files": files,
+            "queue": job_scheduler.queue_info(batch_id) if parent["status"] not in FINISHED_STATUSES else None}
+
+def _batch_new_lines(batch_id, emitted):
+    """读取父任务与尚未输出的子任务，返回 (父任务版本, 新完成的 JSONL 行, 是否全部结束)；父任务不存在时版本为 None"""
+    parent = task_manager.get_task(batch_id)
+    children = _batch_children(parent)
+    if children is None:
+        return None, [], True
+    lines = []
+    for child in children:
+        if child["task_id"] in emitted:
+            continue
+        task = task_manager.get_task(child["task_id"])
+        if task is not None and task["status"] not in FINISHED_STATUSES:
+            continue
+        emitted.add(child["task_id"])
+        line = {"type": "file", **child, "status": task["status"] if task else "expired"}
+        if task is not None and task["status"] == "done":
+            line.update(cache_hit=task.get("cache_hit", False), result=task.get("result"))
+        elif task is not None:
+            line["error"] = task.get("error")
+        lines.append(json.dumps(line, ensure_ascii=False) + "\n")
+    finished = len(emitted) == len(children)
+    if finished:
+        summary = parent["result"]
+        lines.append(json.dumps({"type": "summary", "batch_id": batch_id, "total": summary["total"], "completed": summary["completed"],
+                                 "failed": summary["failed"]}, ensure_ascii=False) + "\n")
+    return parent["version"], lines, finished
+
+@app.get("/asr/batch/{batch_id}/results")
+async def batch_results(batch_id: str):
+    """以 JSONL 流式下载批量结果：每个文件完成时输出一行，全部结束后输出一行汇总（type=summary）"""
+    if _batch_children(await run_in_threadpool(task_manager.get_task, batch_id)) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    async def stream():
+        emitted = set()
+        while True:
+            version, lines, finished = await run_in_threadpool(_batch_new_lines, batch_id, emitted)
+            for line in lines:
+                yield line
+            if finished:
+                return
+            await task_manager.wait_for_version(batch_id, version, timeout=SSE_HEARTBEAT_S)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/asr/enhanced/{task_id}")
-async def run_enhanced(task_id: str):
+def run_enhanced(task_id: str):
     """仅运行增强模型，结果写入 task.stages.enhanced"""
     task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    asyncio.create_task(asr_pipeline.run_enhanced_task(task_id, task_manager))
-    return {"task_id": task_id, "stage": "enhanced", "status": "processing"}
+    queue = _enqueue(task_id, "enhanced", est_duration=_task_duration(task))
+    return {"task_id": task_id, "stage": "enhanced", "status": "processing", "queue": queue}
 
 @app.post("/asr/diarization/{task_id}")
-async def run_diarization(task_id: str):
+def run_diarization(task_id: str):
     """仅运行官方 VAD 分段，结果写入 task.stages.diarization"""
     task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    asyncio.create_task(asr_pipeline.run_vad_task(task_id, task_manager))
-    return {"task_id": task_id, "stage": "diarization", "status": "processing"}
+    queue = _enqueue(task_id, "vad", est_duration=_task_duration(task))
+    return {"task_id": task_id, "stage": "diarization", "status": "processing", "queue": queue}
 
 @app.post("/asr/transformer/{task_id}")
-async def run_transformer(task_id: str):
+def run_transformer(task_id: str):
     """使用 SenseSmallVoice 进行识别，结果写入 task.stages.transformer"""
     task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    asyncio.create_task(asr_pipeline.run_transformer_task(task_id, task_manager))
-    return {"task_id": task_id, "stage": "transformer", "status": "processing"}
+    queue = _enqueue(task_id, "transformer", est_duration=_task_duration(task))
+    return {"task_id": task_id, "stage": "transformer", "status": "processing", "queue": queue}
+
+# 长轮询 / SSE：单次等待上限与 SSE 心跳间隔（秒）
+LONG_POLL_MAX_S = float(os.environ.get("LONG_POLL_MAX_S", "60"))
+SSE_HEARTBEAT_S = float(os.environ.get("SSE_HEARTBEAT_S", "15"))
 
 @app.get("/asr/status/{task_id}")
-def check_status(task_id: str):
-    """查询任务状态：返回正在进行的进度与信息，完成时返回结果，错误时返回错误详情"""
+async def check_status(task_id: str, wait_for_version: Optional[int] = None, timeout: float = 30.0):
+    """查询任务状态：返回正在进行的进度与信息，完成时返回结果，错误时返回错误详情。
+
+    带 wait_for_version 时为长轮询：任务版本超过该值（或超时）才返回，且只返回该版本之后变化的字段与阶段。
+    """
+    if wait_for_version is not None:
+        version = await task_manager.wait_for_version(task_id, wait_for_version, timeout=max(0.0, min(timeout, LONG_POLL_MAX_S)))
+        changes = await run_in_threadpool(task_manager.changes_since, task_id, wait_for_version) if version is not None else None
+        if changes is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        changes["changed"] = changes["version"] > wait_for_version
+        return changes
+    return await run_in_threadpool(_status_view, task_id)
+
+def _status_view(task_id):
     task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -108,12 +615,15 @@ def check_status(task_id: str):
     if status == "done":
         return {
             "status": "done",
+            "version": task.get("version"),
+            "cache_hit": task.get("cache_hit", False),
             "result": task.get("result"),
             "stages": task.get("stages")
         }
     elif status == "error":
         return {
             "status": "error",
+            "version": task.get("version"),
             "error": task.get("error"),
             "message": task.get("message"),
             "stages": task.get("stages")
@@ -121,11 +631,146 @@ def check_status(task_id: str):
     else:
         return {
             "status": status,
+            "version": task.get("version"),
+            "cache_hit": task.get("cache_hit", False),
             "progress": task.get("progress"),
             "message": task.get("message"),
-            "stages": task.get("stages")
+            "stages": task.get("stages"),
+            # 排队位置与预计开始时间（已开始或未排队时为运行态/None）
+            "queue": job_scheduler.queue_info(task_id),
         }
 
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/asr/events/{task_id}")
+async def task_events(task_id: str, request: Request, since: int = 0):
+    """SSE 推送任务进度：版本变化时只发送变化的字段与阶段（event: update），结束时发送 event: done 后关闭。
+
+    事件 id 为任务版本号，断线重连时按 Last-Event-ID 续传。
+    """
+    if await run_in_threadpool(task_manager.get_task, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def stream():
+        version = since
+        while True:
+            changes = await run_in_threadpool(task_manager.changes_since, task_id, version)
+            if changes is None:
+                yield _sse("gone", {"task_id": task_id})
+                return
+            if changes["version"] > version:
+                version = changes["version"]
+                if changes["status"] in FINISHED_STATUSES:
+                    yield _sse("done", changes, version)
+                    return
+                yield _sse("update", changes, version)
+            if await request.is_disconnected():
+                return
+            current = await task_manager.wait_for_version(task_id, version, timeout=SSE_HEARTBEAT_S)
+            if current == version:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 流式识别：并发连接上限，超出时以 1013 (try again later) 关闭
+MAX_STREAMS = int(os.environ.get("ASR_MAX_STREAMS", "32"))
+stream_stats = StreamingStats()
+
+@app.websocket("/asr/stream")
+async def asr_stream(websocket: WebSocket, dtype: str = "int16", sample_rate: int = 16000):
+    """WebSocket 流式识别：接收 16kHz 单声道 PCM 帧，分段闭合时返回 partial/final 结果与时间戳"""
+    await websocket.accept()
+    if sample_rate != 16000 or dtype not in ("int16", "float32"):
+        await websocket.close(code=1003, reason="expect 16kHz mono PCM int16/float32")
+        return
+    if stream_stats.active >= MAX_STREAMS:
+        stream_stats.rejected += 1
+        await websocket.close(code=1013, reason="too many streams")
+        return
+    session = StreamingSession(websocket, asr_pipeline.batch_scheduler, stats=stream_stats, sample_rate=sample_rate, dtype=dtype)
+    await session.run()
+    try:
+        await websocket.close()
+    except Exception:
+        pass
+
+@app.get("/asr/stream/stats")
+def stream_stats_view():
+    """流式识别统计：活跃连接数、音频时长与音频到文本延迟分布"""
+    return stream_stats.snapshot()
+
+@app.get("/asr/scheduler/stats")
+def scheduler_stats():
+    """推理调度器统计：worker 数、各优先级排队数、拒绝次数"""
+    return job_scheduler.stats()
+
+@app.get("/asr/microbatch/stats")
+def microbatch_stats():
+    """ASR 微批调度统计：批大小分布与排队等待时间，用于权衡吞吐与延迟"""
+    return asr_pipeline.batch_scheduler.stats()
+
+@app.get("/asr/stages/stats")
+def stage_stats():
+    """阶段流水线统计（仅 stage 模式）：各阶段 worker 数、队列深度、忙碌 worker 数与累计处理量"""
+    if stage_pipeline is None:
+        return {"exec_mode": ASR_EXEC_MODE, "stages": {}}
+    return {"exec_mode": ASR_EXEC_MODE, **stage_pipeline.stats()}
+
+@app.get("/asr/cache/stats")
+def cache_stats():
+    """波形缓存统计：命中/未命中次数（按产物区分）、占用字节与淘汰次数"""
+    return asr_pipeline.audio_cache.stats()
+
+@app.get("/asr/result-cache/stats")
+def result_cache_stats():
+    """结果缓存统计：内存条目数、命中（含磁盘命中）/未命中、写入与过期次数，以及在途去重登记数"""
+    with _inflight_lock:
+        inflight = len(_inflight)
+    return {**result_cache.stats(), "inflight": inflight}
+
+@app.get("/asr/tasks/stats")
+def task_stats():
+    """任务表内存占用：常驻 payload 字节、落盘字节与过期/释放计数"""
+    return task_manager.memory_usage()
+
+# /metrics：直方图由各阶段计时累积，其余在抓取时从各组件读取
+metrics.gauge("funasr_inflight_jobs", "Jobs currently running on inference workers", lambda: job_scheduler.stats()["running"])
+metrics.gauge("funasr_queue_depth", "Jobs waiting in the scheduler queue", lambda: job_scheduler.stats()["queued_by_priority"], ("priority",))
+metrics.gauge("funasr_tasks", "Tasks held by TaskManager", lambda: task_manager.memory_usage()["tasks"])
+metrics.gauge("funasr_task_payload_resident_bytes", "Task payload bytes resident in memory", lambda: task_manager.memory_usage()["resident_bytes"])
+metrics.callback_counter("funasr_task_payload_spilled_bytes_total", "Task payload bytes spilled to disk", lambda: task_manager.memory_usage()["spilled_bytes"])
+metrics.gauge("funasr_asr_batch_pending", "Segments waiting for an ASR micro-batch", lambda: asr_pipeline.batch_scheduler.stats()["pending"])
+metrics.callback_counter("funasr_asr_batches_total", "ASR micro-batches executed", lambda: asr_pipeline.batch_scheduler.stats()["batches"])
+metrics.callback_counter("funasr_asr_batch_items_total", "Segments processed through ASR micro-batches", lambda: asr_pipeline.batch_scheduler.stats()["items"])
+metrics.gauge("funasr_stage_queue_depth", "Tasks waiting in each pipeline stage queue (stage mode)", lambda: {(k,): v["queued"] for k, v in stage_pipeline.stats()["stages"].items()} if stage_pipeline else None, ("stage",))
+metrics.gauge("funasr_stage_busy_workers", "Busy workers in each pipeline stage (stage mode)", lambda: {(k,): v["busy"] for k, v in stage_pipeline.stats()["stages"].items()} if stage_pipeline else None, ("stage",))
+metrics.gauge("funasr_audio_cache_bytes", "Bytes held by the waveform cache", lambda: asr_pipeline.audio_cache.stats()["bytes"])
+metrics.callback_counter("funasr_audio_cache_lookups_total", "Waveform cache lookups", lambda: {(k,): v for k, v in asr_pipeline.audio_cache.stats().items() if k in ("hits", "misses")}, ("result",))
+metrics.callback_counter("funasr_result_cache_lookups_total", "Result cache lookups", lambda: {(k,): v for k, v in result_cache.stats().items() if k in ("hits", "misses")}, ("result",))
+metrics.gauge("funasr_model_ready", "Whether each registered model has finished loading", lambda: {(name, m["state"]): 1 for name, m in asr_pipeline.models.status().items()}, ("model", "state"))
+metrics.gauge("funasr_stream_active", "Active WebSocket recognition streams", lambda: stream_stats.active)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus 文本格式指标：阶段耗时直方图、RTF、排队等待、在途任务与内存占用"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """就绪检查：必需模型全部加载完成返回 200，否则 503（lazy 模式下已登记且未失败即就绪）；附各模型加载状态与耗时"""
+    if process_pool is not None:
+        is_ready = process_pool.ready()
+        body = {"ready": is_ready, "exec_mode": ASR_EXEC_MODE, **process_pool.status()}
+    else:
+        is_ready = asr_pipeline.models.ready(lazy=MODEL_LOAD_MODE == "lazy")
+        body = {"ready": is_ready, "exec_mode": ASR_EXEC_MODE, "load_mode": MODEL_LOAD_MODE, "models": asr_pipeline.models.status()}
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
@@ -0,0 +1,344 @@
+"""管线基准与压测：使用确定性桩模型（benchmarks/stub_models.py），无需真实模型权重。
+
+用法：
+    python benchmarks/bench_pipeline.py [--durations 10 60 300] [--formats wav16k_mono mp3_44k]
+        [--concurrency 1 2 4 8 16] [--requests 32] [--sections decode stages rss load] [--json out.json]
+
+测量项（均写入 --json 指定的文件，可用 benchmarks/compare.py 对比两次提交的结果）：
+    decode  各样本 load_audio 耗时（多次取最小）与解码倍速
+    stages  单任务串行执行全流程，各阶段耗时（decode/enhance/vad/asr/combine）与 RTF
+    rss     每个样本在独立子进程中跑一次全流程，采样任务期间的峰值 RSS 及相对任务开始前的增量
+    load    进程内直接驱动 FastAPI app（httpx ASGITransport），逐级提高并发提交 + 轮询，
+            统计端到端延迟分位数、吞吐（任务/秒、音频秒/秒）与 429 拒绝次数
+
+load 需要 app.py 的全部依赖（torch、fastapi、httpx 等）；其余部分只依赖 my_funasr。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_models  # noqa: E402
+
+stub_models.install()
+
+from fixtures import FORMATS, make_fixtures  # noqa: E402
+from my_funasr.audio_preprocess import load_audio  # noqa: E402
+
+SECTIONS = ("decode", "stages", "rss", "load")
+STAGES = ("decode", "enhanced", "diarization", "speaker_diarization", "asr", "combine")
+
+
+def build_pipeline(**kwargs):
+    """与 app.py 相同的模型组合（增强 + ASR，内置能量 VAD），模型为桩实现"""
+    from my_funasr.funasr_pipeline import FunASRPipeline
+    return FunASRPipeline(
+        asr_model_dir="stub/SenseVoiceSmall",
+        enhance_model_dir="stub/speech_mossformer2_noise_reduction_16k",
+        use_external_punc=False,
+        use_diarization=False,
+        **kwargs,
+    )
+
+
+def percentiles(values, ps=(50, 90, 95, 99)):
+    if not values:
+        return {f"p{p}": None for p in ps}
+    arr = np.asarray(values, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(arr, p)), 6) for p in ps}
+
+
+def max_rss_bytes():
+    """本进程历史峰值 RSS；Linux 上 ru_maxrss 单位为 KB，macOS 为字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def current_rss_bytes():
+    """当前 RSS（Linux 读 /proc/self/statm）；其他平台退回历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return max_rss_bytes()
+
+
+class RssSampler:
+    """后台线程按固定间隔采样 RSS，记录区间内的峰值"""
+
+    def __init__(self, interval_s=0.002):
+        self.interval_s = interval_s
+        self.baseline = current_rss_bytes()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval_s)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+# ===== decode =====
+def bench_decode(fixtures, repeat):
+    rows = []
+    print(f"\n{'fixture':<28}{'bytes':>12}{'decode_s':>12}{'x realtime':>12}")
+    for fx in fixtures:
+        with open(fx["path"], "rb") as f:
+            data = f.read()
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            load_audio(data)
+            best = min(best, time.perf_counter() - t0)
+        row = {"fixture": fx["name"], "bytes": fx["bytes"], "duration": fx["duration"], "decode_s": round(best, 6),
+               "x_realtime": round(fx["duration"] / best, 1) if best > 0 else None}
+        rows.append(row)
+        print(f"{fx['name']:<28}{fx['bytes']:>12}{best:>12.4f}{row['x_realtime']:>12}")
+    return rows
+
+
+# ===== stages =====
+def _run_once(pipeline, task_manager, task_id, data):
+    from my_funasr.audio_cache import audio_digest
+    key = audio_digest(data)
+    # 每次运行前清掉该音频的缓存，测的是冷路径
+    pipeline.audio_cache.invalidate(key)
+    task_manager.create_task(task_id, status="queued", payload={"audio_bytes": data, "audio_hash": key, "upload_size": len(data)})
+    pipeline._run_full_sync(task_id, data, task_manager)
+    return task_manager.get_task(task_id)
+
+
+def bench_stages(fixtures, repeat):
+    from task_manager import TaskManager
+    pipeline = build_pipeline()
+    task_manager = TaskManager(release_payload_on_finish=True)
+    rows = []
+    print(f"\n{'fixture':<28}{'total_s':>10}{'rtf':>8}  stages (s)")
+    for fx in fixtures:
+        with open(fx["path"], "rb") as f:
+            data = f.read()
+        runs = []
+        for i in range(repeat):
+            task = _run_once(pipeline, task_manager, f"{fx['name']}-{i}", data)
+            if task["status"] != "done":
+                raise RuntimeError(f"{fx['name']}: pipeline failed: {task.get('error')}")
+            runs.append(task)
+        # 取总耗时最小的一次，避免被偶发调度抖动干扰
+        best = min(runs, key=lambda t: t["result"]["elapsed_s"])
+        stages = {name: best["stages"][name].get("elapsed_s") for name in STAGES if name in best["stages"]}
+        row = {"fixture": fx["name"], "duration": fx["duration"], "total_s": best["result"]["elapsed_s"], "rtf": best["result"]["rtf"],
+               "segments": len(best["result"]["segments"]), "stages": stages}
+        rows.append(row)
+        stage_txt = " ".join(f"{k}={v:.4f}" for k, v in stages.items() if v is not None)
+        print(f"{fx['name']:<28}{row['total_s']:>10.3f}{row['rtf']:>8.3f}  {stage_txt}")
+    pipeline.batch_scheduler.shutdown()
+    return rows
+
+
+# ===== rss =====
+def _rss_child(path):
+    """子进程入口：构建管线并读入样本后记录基线 RSS，跑一次全流程期间采样峰值，输出一行 JSON"""
+    from task_manager import TaskManager
+    pipeline = build_pipeline()
+    task_manager = TaskManager()
+    with open(path, "rb") as f:
+        data = f.read()
+    with RssSampler() as sampler:
+        task = _run_once(pipeline, task_manager, "rss", data)
+    pipeline.batch_scheduler.shutdown()
+    print(json.dumps({"status": task["status"], "baseline_rss_bytes": sampler.baseline, "peak_rss_bytes": sampler.peak,
+                      "max_rss_bytes": max_rss_bytes()}))
+
+
+def bench_rss(fixtures):
+    rows = []
+    print(f"\n{'fixture':<28}{'baseline_MB':>14}{'peak_MB':>10}{'delta_MB':>10}")
+    for fx in fixtures:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--rss-child", fx["path"]],
+                             capture_output=True, text=True, timeout=600)
+        lines = [ln for ln in out.stdout.splitlines() if ln.startswith("{")]
+        if out.returncode != 0 or not lines:
+            print(f"[rss] {fx['name']} failed: {out.stderr.strip()[-500:]}")
+            continue
+        child = json.loads(lines[-1])
+        row = {"fixture": fx["name"], "duration": fx["duration"], **child,
+               "delta_rss_bytes": child["peak_rss_bytes"] - child["baseline_rss_bytes"]}
+        rows.append(row)
+        mb = 1024.0 * 1024.0
+        print(f"{fx['name']:<28}{child['baseline_rss_bytes'] / mb:>14.1f}{child['peak_rss_bytes'] / mb:>10.1f}{row['delta_rss_bytes'] / mb:>10.1f}")
+    return rows
+
+
+# ===== load =====
+def _unique_variant(data, i):
+    """PCM WAV 改写最后一个采样，使每次上传内容哈希不同，避免命中波形缓存"""
+    if data[:4] != b"RIFF" or len(data) < 48:
+        return data
+    buf = bytearray(data)
+    buf[-2:] = (i % 65536).to_bytes(2, "little")
+    return bytes(buf)
+
+
+async def _client(client, fixture, data, counter, n_requests, latencies, errors, poll_s):
+    rejected = 0
+    while True:
+        i = counter[0]
+        if i >= n_requests:
+            return rejected
+        counter[0] += 1
+        body = _unique_variant(data, i)
+        started = time.perf_counter()
+        while True:
+            files = {"file": (os.path.basename(fixture["path"]), body, fixture["content_type"])}
+            resp = await client.post("/asr/submit", files=files)
+            if resp.status_code != 429:
+                break
+            rejected += 1
+            await asyncio.sleep(float(resp.headers.get("Retry-After", "1")) * 0.1)
+        if resp.status_code != 200:
+            errors.append(f"submit {resp.status_code}: {resp.text[:200]}")
+            continue
+        task_id = resp.json()["task_id"]
+        while True:
+            status = (await client.get(f"/asr/status/{task_id}")).json()
+            if status.get("status") in ("done", "error"):
+                break
+            await asyncio.sleep(poll_s)
+        if status["status"] == "done":
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(f"task error: {status.get('error')}")
+
+
+async def _load_level(app_module, fixture, data, concurrency, n_requests, poll_s):
+    import httpx
+    latencies, errors, counter = [], [], [0]
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        before = (await client.get("/asr/microbatch/stats")).json()
+        started = time.perf_counter()
+        rejected = await asyncio.gather(*[
+            _client(client, fixture, data, counter, n_requests, latencies, errors, poll_s) for _ in range(concurrency)
+        ])
+        wall = time.perf_counter() - started
+        after = (await client.get("/asr/microbatch/stats")).json()
+    done = len(latencies)
+    batches, items = after["batches"] - before["batches"], after["items"] - before["items"]
+    return {
+        "concurrency": concurrency, "requests": n_requests, "completed": done, "errors": len(errors), "rejected_429": sum(rejected),
+        "wall_s": round(wall, 4), "throughput_tasks_s": round(done / wall, 3) if wall > 0 else None,
+        "throughput_audio_s_per_s": round(done * fixture["duration"] / wall, 2) if wall > 0 else None,
+        "latency_s": {"mean": round(float(np.mean(latencies)), 6) if latencies else None, **percentiles(latencies)},
+        "asr_batch": {"batches": batches, "items": items, "avg_batch_size": round(items / batches, 3) if batches else None},
+        "error_samples": errors[:3],
+    }
+
+
+def bench_load(fixture, levels, n_requests, poll_s):
+    import app as app_module
+    with open(fixture["path"], "rb") as f:
+        data = f.read()
+    rows = []
+    print(f"\nload fixture={fixture['name']} requests/level={n_requests} workers={app_module.job_scheduler.stats().get('workers')}")
+    print(f"{'conc':>6}{'done':>6}{'429':>6}{'tasks/s':>10}{'audio_s/s':>11}{'p50':>9}{'p90':>9}{'p99':>9}")
+    try:
+        for c in levels:
+            row = asyncio.run(_load_level(app_module, fixture, data, c, n_requests, poll_s))
+            rows.append(row)
+            lat = row["latency_s"]
+            fmt = lambda v: f"{v:>9.3f}" if v is not None else f"{'-':>9}"  # noqa: E731
+            print(f"{c:>6}{row['completed']:>6}{row['rejected_429']:>6}{row['throughput_tasks_s'] or 0:>10.2f}"
+                  f"{row['throughput_audio_s_per_s'] or 0:>11.1f}{fmt(lat['p50'])}{fmt(lat['p90'])}{fmt(lat['p99'])}")
+    finally:
+        app_module.job_scheduler.shutdown(wait=False)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 60, 300])
+    parser.add_argument("--formats", nargs="+", default=["wav16k_mono", "wav44k_stereo", "mp3_44k"], choices=list(FORMATS))
+    parser.add_argument("--fixtures-dir", default=os.path.join(ROOT, "bench_fixtures"))
+    parser.add_argument("--sections", nargs="+", default=list(SECTIONS), choices=SECTIONS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32, help="tasks submitted per concurrency level")
+    parser.add_argument("--load-fixture", default="wav16k_mono_10s", help="fixture used for the load test")
+    parser.add_argument("--poll-ms", type=float, default=5.0)
+    parser.add_argument("--spin", action="store_true", help="stub models burn CPU instead of sleeping")
+    parser.add_argument("--asr-ms-per-s", type=float, help="stub ASR cost per audio second (ms)")
+    parser.add_argument("--json", help="write results as JSON to this path")
+    parser.add_argument("--rss-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    costs = {"asr": {"per_audio_s_ms": args.asr_ms_per_s}} if args.asr_ms_per_s is not None else None
+    stub_models.configure(costs=costs, spin=args.spin)
+    if args.rss_child:
+        _rss_child(args.rss_child)
+        return
+
+    durations = [int(d) if float(d).is_integer() else d for d in args.durations]
+    fixtures = make_fixtures(durations, args.formats, out_dir=args.fixtures_dir)
+    report = {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"durations": durations, "formats": args.formats, "repeat": args.repeat, "concurrency": args.concurrency,
+                   "requests": args.requests, "load_fixture": args.load_fixture, "stub_costs": stub_models._config["costs"],
+                   "stub_spin": args.spin},
+        "fixtures": [{k: fx[k] for k in ("name", "format", "duration", "bytes")} for fx in fixtures],
+    }
+    if "decode" in args.sections:
+        report["decode"] = bench_decode(fixtures, args.repeat)
+    if "stages" in args.sections:
+        report["stages"] = bench_stages(fixtures, args.repeat)
+    if "rss" in args.sections:
+        report["rss"] = bench_rss(fixtures)
+    if "load" in args.sections:
+        load_fixture = next((fx for fx in fixtures if fx["name"] == args.load_fixture), None)
+        if load_fixture is None:
+            print(f"[load] fixture {args.load_fixture} not generated; pick one of {[fx['name'] for fx in fixtures]}")
+        else:
+            report["load"] = bench_load(load_fixture, args.concurrency, args.requests, args.poll_ms / 1000.0)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nresults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
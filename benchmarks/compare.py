@@ -0,0 +1,87 @@
+"""对比两次 bench_pipeline.py 的 JSON 结果，标出超过阈值的退化。
+
+用法：
+    python benchmarks/compare.py base.json new.json [--threshold 0.10]
+
+耗时、延迟、内存越小越好，吞吐越大越好；任一指标退化超过阈值时退出码为 1。
+绝对变化小于噪声下限（耗时 2ms、内存 1MB）的指标不参与判定。
+"""
+import argparse
+import json
+import sys
+
+
+# 指标名后缀 -> 绝对变化噪声下限
+NOISE_FLOOR = {"_s": 0.002, "_bytes": 1 << 20}
+
+
+def _below_noise(name, old, cur):
+    for suffix, floor in NOISE_FLOOR.items():
+        if name.endswith(suffix):
+            return abs(cur - old) < floor
+    return False
+
+
+def _index(rows, key):
+    return {row[key]: row for row in rows or []}
+
+
+def collect(report):
+    """把报告展开为 {指标名: (数值, 越大越好)}"""
+    out = {}
+    for fixture, row in _index(report.get("decode"), "fixture").items():
+        out[f"decode/{fixture}/decode_s"] = (row.get("decode_s"), False)
+    for fixture, row in _index(report.get("stages"), "fixture").items():
+        out[f"stages/{fixture}/total_s"] = (row.get("total_s"), False)
+        for stage, v in (row.get("stages") or {}).items():
+            out[f"stages/{fixture}/{stage}_s"] = (v, False)
+    for fixture, row in _index(report.get("rss"), "fixture").items():
+        out[f"rss/{fixture}/delta_rss_bytes"] = (row.get("delta_rss_bytes"), False)
+    for conc, row in _index(report.get("load"), "concurrency").items():
+        out[f"load/c{conc}/throughput_tasks_s"] = (row.get("throughput_tasks_s"), True)
+        for p in ("p50", "p90", "p99"):
+            out[f"load/c{conc}/latency_{p}_s"] = ((row.get("latency_s") or {}).get(p), False)
+    return out
+
+
+def compare(base, new, threshold):
+    base_m, new_m = collect(base), collect(new)
+    rows, regressions = [], 0
+    for name in sorted(set(base_m) & set(new_m)):
+        (old, higher_better), (cur, _) = base_m[name], new_m[name]
+        if not old or cur is None:
+            continue
+        change = (cur - old) / abs(old)
+        worse = -change if higher_better else change
+        if _below_noise(name, old, cur):
+            flag = ""
+        else:
+            flag = "REGRESSION" if worse > threshold else ("improved" if worse < -threshold else "")
+        regressions += flag == "REGRESSION"
+        rows.append((name, old, cur, change, flag))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change treated as significant")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base {base.get('commit') or '?'}  ->  new {new.get('commit') or '?'}")
+    rows, regressions = compare(base, new, args.threshold)
+    width = max([len(r[0]) for r in rows] + [6])
+    print(f"{'metric':<{width}}{'base':>14}{'new':>14}{'change':>10}")
+    for name, old, cur, change, flag in rows:
+        print(f"{name:<{width}}{old:>14.6g}{cur:>14.6g}{change:>+9.1%} {flag}")
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""基准测试用的合成音频样本：语音状的调幅多频信号与静音交替，能被能量 VAD 分段。
+
+样本按 (时长, 格式) 生成并缓存到目录中，同一参数多次生成内容完全一致（固定随机种子）。
+"""
+import os
+
+import numpy as np
+import soundfile as sf
+
+# 格式名 -> (采样率, 声道数, soundfile 格式, 子类型, 扩展名, 上传 content-type)
+FORMATS = {
+    "wav16k_mono": (16000, 1, "WAV", "PCM_16", "wav", "audio/wav"),
+    "wav44k_stereo": (44100, 2, "WAV", "PCM_16", "wav", "audio/wav"),
+    "flac16k_mono": (16000, 1, "FLAC", "PCM_16", "flac", "audio/wav"),
+    "mp3_44k": (44100, 1, "MP3", None, "mp3", "audio/mpeg"),
+}
+DEFAULT_FORMATS = ("wav16k_mono", "wav44k_stereo", "mp3_44k")
+
+
+def synth_speech(duration, sr, seed=0, utterance_s=(1.5, 6.0), pause_s=(0.3, 1.2)):
+    """语音状信号：每段“发声”为基频 + 谐波并做音节级调幅，段间为低电平噪声"""
+    rng = np.random.default_rng(seed)
+    n = int(round(duration * sr))
+    y = (0.003 * rng.standard_normal(n)).astype(np.float32)
+    pos = int(rng.uniform(*pause_s) * sr)
+    while pos < n:
+        length = min(n - pos, int(rng.uniform(*utterance_s) * sr))
+        t = np.arange(length, dtype=np.float32) / sr
+        f0 = rng.uniform(110, 240)
+        voiced = sum((0.25 / k) * np.sin(2 * np.pi * f0 * k * t + rng.uniform(0, np.pi)) for k in range(1, 5))
+        envelope = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)
+        y[pos:pos + length] += (voiced * envelope).astype(np.float32)
+        pos += length + int(rng.uniform(*pause_s) * sr)
+    np.clip(y, -1.0, 1.0, out=y)
+    return y
+
+
+def fixture_name(duration, fmt):
+    d = int(duration) if float(duration).is_integer() else duration
+    return f"{fmt}_{d}s"
+
+
+def make_fixture(duration, fmt, out_dir, seed=0):
+    """生成（或复用已缓存的）样本文件，返回 dict(name, path, format, duration, content_type, bytes)"""
+    sr, channels, sf_format, subtype, ext, content_type = FORMATS[fmt]
+    name = fixture_name(duration, fmt)
+    path = os.path.join(out_dir, f"{name}.{ext}")
+    if not os.path.exists(path):
+        os.makedirs(out_dir, exist_ok=True)
+        y = synth_speech(duration, sr, seed=seed)
+        if channels > 1:
+            # 右声道略作衰减，避免下混退化为单声道直通
+            y = np.stack([y, 0.8 * y], axis=1)
+        tmp = f"{path}.tmp"
+        sf.write(tmp, y, sr, format=sf_format, subtype=subtype)
+        os.replace(tmp, path)
+    return {"name": name, "path": path, "format": fmt, "duration": float(duration),
+            "content_type": content_type, "bytes": os.path.getsize(path)}
+
+
+def make_fixtures(durations, formats=DEFAULT_FORMATS, out_dir="bench_fixtures", seed=0):
+    """按时长 x 格式生成样本；当前 libsndfile 不支持的格式（如旧版本写 MP3）跳过"""
+    fixtures = []
+    for fmt in formats:
+        for d in durations:
+            try:
+                fixtures.append(make_fixture(d, fmt, out_dir, seed=seed))
+            except Exception as e:
+                print(f"[fixtures] skip {fixture_name(d, fmt)}: {e}")
+    return fixtures
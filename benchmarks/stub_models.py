@@ -0,0 +1,129 @@
+"""基准测试用的确定性桩模型：替代 funasr.AutoModel，耗时随输入音频长度线性增长。
+
+install() 把一个只含 AutoModel 的假 funasr 模块放进 sys.modules，之后再导入
+my_funasr.funasr_pipeline / app 即使用桩模型，不需要 SenseVoice、mossformer 等权重。
+
+按模型目录名区分行为（与 app.py 中的配置一致）：
+    mossformer / enhance  -> 增强：返回原音频副本
+    vad                   -> 官方 VAD：按固定窗口切分
+    diar / campplus       -> 说话人分离：返回带 speaker 的固定窗口分段
+    其余                  -> ASR：返回由长度决定的确定性文本
+
+耗时模型：cost = fixed_ms + per_audio_s_ms * 音频秒数，批量调用只付一次 fixed_ms，
+用 time.sleep 模拟（与真实推理一样释放 GIL）；spin=True 时改为忙等占用 CPU。
+"""
+import sys
+import time
+import types
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# 各类模型的默认耗时参数（毫秒）：固定开销 / 每秒音频
+DEFAULT_COSTS = {
+    "asr": {"fixed_ms": 15.0, "per_audio_s_ms": 4.0},
+    "enhance": {"fixed_ms": 5.0, "per_audio_s_ms": 2.0},
+    "vad": {"fixed_ms": 2.0, "per_audio_s_ms": 0.5},
+    "diarization": {"fixed_ms": 5.0, "per_audio_s_ms": 1.0},
+}
+
+_config = {"costs": {k: dict(v) for k, v in DEFAULT_COSTS.items()}, "spin": False}
+_calls = {}
+
+_TEXT_ALPHABET = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+
+
+def configure(costs=None, spin=None):
+    """覆盖耗时参数，costs 形如 {"asr": {"fixed_ms": 10, "per_audio_s_ms": 3}}"""
+    for kind, cost in (costs or {}).items():
+        _config["costs"].setdefault(kind, {}).update(cost)
+    if spin is not None:
+        _config["spin"] = bool(spin)
+
+
+def call_counts():
+    return dict(_calls)
+
+
+def reset_call_counts():
+    _calls.clear()
+
+
+def _model_kind(model_dir):
+    name = str(model_dir).lower()
+    if "mossformer" in name or "enhance" in name:
+        return "enhance"
+    if "diar" in name or "campplus" in name:
+        return "diarization"
+    if "vad" in name:
+        return "vad"
+    return "asr"
+
+
+def _burn(seconds):
+    if seconds <= 0:
+        return
+    if not _config["spin"]:
+        time.sleep(seconds)
+        return
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _fake_text(n_samples, sample_rate):
+    """每秒约 4 个字，字序由长度决定，保证同一输入结果可复现"""
+    n_chars = max(1, int(round(n_samples / float(sample_rate) * 4)))
+    offset = n_samples % len(_TEXT_ALPHABET)
+    return "".join(_TEXT_ALPHABET[(offset + i) % len(_TEXT_ALPHABET)] for i in range(n_chars))
+
+
+def _windows(duration, window_s, speaker=False):
+    segments, start, i = [], 0.0, 0
+    while start < duration:
+        end = min(duration, start + window_s)
+        seg = {"start": round(start, 3), "end": round(end, 3)}
+        if speaker:
+            seg["speaker"] = f"spk{i % 2}"
+        segments.append(seg)
+        start, i = end, i + 1
+    return segments
+
+
+class AutoModel:
+    """funasr.AutoModel 的桩实现，只支持本服务用到的 generate 调用形式"""
+
+    def __init__(self, model=None, device="cpu", **kwargs):
+        self.model = model
+        self.device = device
+        self.kind = _model_kind(model)
+
+    def generate(self, input=None, sample_rate=SAMPLE_RATE, key=None, batch_size=1, **kwargs):
+        inputs = input if isinstance(input, list) else [input]
+        lengths = [len(x) for x in inputs]
+        cost = _config["costs"].get(self.kind, DEFAULT_COSTS["asr"])
+        audio_s = sum(lengths) / float(sample_rate)
+        _burn((cost["fixed_ms"] + cost["per_audio_s_ms"] * audio_s) / 1000.0)
+        _calls[self.kind] = _calls.get(self.kind, 0) + 1
+
+        if self.kind == "enhance":
+            return {"audio": np.array(inputs[0], dtype=np.float32, copy=True)}
+        if self.kind == "vad":
+            return {"segments": _windows(lengths[0] / float(sample_rate), 10.0)}
+        if self.kind == "diarization":
+            return {"segments": _windows(lengths[0] / float(sample_rate), 8.0, speaker=True)}
+        keys = key or [f"k{i}" for i in range(len(inputs))]
+        return [{"key": k, "text": _fake_text(n, sample_rate)} for k, n in zip(keys, lengths)]
+
+
+def install():
+    """注册假 funasr 模块；须在导入 my_funasr.funasr_pipeline / app 之前调用"""
+    module = sys.modules.get("funasr")
+    if module is not None and getattr(module, "AutoModel", None) is AutoModel:
+        return module
+    module = types.ModuleType("funasr")
+    module.AutoModel = AutoModel
+    module.__stub__ = True
+    sys.modules["funasr"] = module
+    return module
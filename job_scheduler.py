@@ -0,0 +1,310 @@
+import heapq
+import itertools
+import threading
+import time
+
+from my_funasr.metrics import QUEUE_WAIT_SECONDS
+
+# 优先级类别：数值越小越先执行
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+
+
+class QueueFullError(Exception):
+    """等待队列已满，调用方应返回 429 并让客户端稍后重试"""
+
+    def __init__(self, queue_size, retry_after=None):
+        super().__init__(f"job queue is full ({queue_size} waiting)")
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+
+
+class SchedulerClosedError(Exception):
+    """调度器已关闭，不再接受新任务"""
+
+
+class _Job:
+    __slots__ = ("task_id", "kind", "priority", "est_duration", "submitted_at", "started_at", "job_id")
+
+    def __init__(self, task_id, kind, priority, est_duration, submitted_at=None, started_at=None, job_id=None):
+        self.task_id = task_id
+        self.kind = kind
+        self.priority = priority
+        self.est_duration = est_duration
+        self.submitted_at = time.time() if submitted_at is None else submitted_at
+        self.started_at = started_at
+        self.job_id = job_id
+
+
+class _HeapQueue:
+    """进程内等待队列（默认）：(优先级, 提交序号) 小顶堆，自带锁"""
+
+    shared = False
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, job, max_queue):
+        with self._lock:
+            if len(self._heap) >= max_queue:
+                return False
+            heapq.heappush(self._heap, (PRIORITY_CLASSES[job.priority], next(self._seq), job))
+            return True
+
+    def pop(self):
+        with self._lock:
+            return heapq.heappop(self._heap)[2] if self._heap else None
+
+    def ordered(self):
+        with self._lock:
+            return [item[2] for item in sorted(self._heap)]
+
+    def running(self, local):
+        return list(local)
+
+    def finish(self, job):
+        pass
+
+
+class _StoreQueue:
+    """共享等待队列：作业存放在持久化任务表（如 SQLiteTaskStore）的 jobs 表中，多个进程的 worker 原子领取。
+
+    每个方法都是一次数据库访问，调用方不应持有调度器的锁。
+    """
+
+    shared = True
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _job(row):
+        return _Job(row["task_id"], row["kind"], row["priority"], row["est_duration"], submitted_at=row["submitted_at"],
+                    started_at=row["started_at"], job_id=row["job_id"])
+
+    def __len__(self):
+        return len(self.store.list_jobs("queued"))
+
+    def push(self, job, max_queue):
+        job.job_id = self.store.enqueue_job(job.task_id, job.kind, job.priority, PRIORITY_CLASSES[job.priority], job.est_duration, job.submitted_at, max_queue)
+        return job.job_id is not None
+
+    def pop(self):
+        try:
+            row = self.store.claim_job()
+        except Exception as e:
+            # 数据库暂时繁忙等错误：本轮视为无作业，下次轮询重试
+            print(f"[scheduler] claim job failed: {e}")
+            return None
+        return self._job(row) if row is not None else None
+
+    def ordered(self):
+        return [self._job(row) for row in self.store.list_jobs("queued")]
+
+    def running(self, local):
+        # 包括其他进程正在执行的作业
+        return [self._job(row) for row in self.store.list_jobs("running")]
+
+    def finish(self, job):
+        try:
+            self.store.finish_job(job.job_id)
+        except Exception as e:
+            print(f"[scheduler] finish job {job.job_id} failed: {e}")
+
+
+class JobScheduler:
+    """有界推理任务调度器：固定数量的推理 worker + 带优先级的有界等待队列。
+
+    handlers 为 {kind: callable(task_id)}，在 worker 线程中同步执行。
+    队列满时 submit 抛出 QueueFullError；排队位置与预计开始时间可通过
+    queue_info 查询。传入 job_store（如 SQLiteTaskStore）时等待队列改为共享的
+    jobs 表：多个进程的 worker 从同一队列原子领取，空闲时按 poll_interval 轮询。
+    队列的读写（包括数据库访问）都在 _cond 之外进行，_cond 只保护本进程的
+    _running、计数与估计值。
+    """
+
+    def __init__(self, handlers, num_workers=2, max_queue=64, short_clip_s=60.0, long_clip_s=600.0, default_rtf=0.3, default_job_s=10.0, job_store=None, poll_interval=0.2):
+        self.handlers = dict(handlers)
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.short_clip_s = short_clip_s
+        self.long_clip_s = long_clip_s
+
+        self._queue = _StoreQueue(job_store) if job_store is not None else _HeapQueue()
+        self.poll_interval = poll_interval
+        self._running = {}  # id(job) -> _Job，同一 task 可能同时有多个阶段任务
+        self._cond = threading.Condition()
+        self._submitted = 0  # 提交计数：worker 领取为空后据此判断等待期间是否有新提交
+        self._closed = False
+        self._workers = []
+
+        # 处理耗时估计：实时率（处理秒数 / 音频秒数）的指数滑动平均
+        self._rtf = default_rtf
+        self._job_s = default_job_s
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+
+    # ===== 生命周期 =====
+    def start(self):
+        with self._cond:
+            if self._workers:
+                return
+            if self._queue.shared:
+                # 上次运行中途退出的进程留下的作业重新排队
+                self._queue.store.requeue_orphaned_jobs()
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker_loop, name=f"asr-worker-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join(timeout=5)
+
+    # ===== 提交 =====
+    def classify(self, est_duration):
+        """按音频时长划分优先级：短音频优先，长录音靠后"""
+        if est_duration is None:
+            return "normal"
+        if est_duration <= self.short_clip_s:
+            return "high"
+        if est_duration >= self.long_clip_s:
+            return "low"
+        return "normal"
+
+    def submit(self, task_id, kind, priority=None, est_duration=None):
+        """提交任务；返回排队信息。队列满时抛出 QueueFullError"""
+        if kind not in self.handlers:
+            raise ValueError(f"unknown job kind: {kind}")
+        if priority is None:
+            priority = self.classify(est_duration)
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"unknown priority: {priority}")
+        job = _Job(task_id, kind, priority, est_duration)
+        if self._closed:
+            raise SchedulerClosedError("scheduler is shut down")
+        if not self._queue.push(job, self.max_queue):
+            with self._cond:
+                self._rejected += 1
+            running, ordered = self._snapshot()
+            raise QueueFullError(len(ordered), retry_after=self._estimate_wait(len(ordered), running, ordered))
+        with self._cond:
+            self._submitted += 1
+            self._cond.notify()
+        self.start()
+        return self.queue_info(task_id)
+
+    # ===== 排队信息 =====
+    def _job_cost(self, job):
+        if job.est_duration:
+            return job.est_duration * self._rtf
+        return self._job_s
+
+    def _snapshot(self):
+        """返回 (在途作业, 按执行顺序排列的排队作业)；队列读取在锁外进行"""
+        with self._cond:
+            local = list(self._running.values())
+        return self._queue.running(local), self._queue.ordered()
+
+    def _estimate_wait(self, ahead, running, ordered):
+        """估计前方 ahead 个排队任务 + 在途任务完成前需等待的秒数"""
+        now = time.time()
+        # 在途任务的剩余耗时
+        busy = [max(0.0, self._job_cost(j) - (now - j.started_at)) for j in running]
+        free_slots = self.num_workers - len(busy)
+        queued = ordered[:ahead]
+        total = sum(busy) + sum(self._job_cost(j) for j in queued)
+        if free_slots > 0 and not queued:
+            return 0.0
+        return total / self.num_workers
+
+    def queue_info(self, task_id):
+        """返回 task 的排队状态；不在队列中时返回 None"""
+        running, ordered = self._snapshot()
+        for job in running:
+            if job.task_id == task_id:
+                return {"state": "running", "kind": job.kind, "priority": job.priority, "started_at": job.started_at}
+        for pos, job in enumerate(ordered):
+            if job.task_id == task_id:
+                wait_s = self._estimate_wait(pos, running, ordered)
+                return {
+                    "state": "queued",
+                    "kind": job.kind,
+                    "priority": job.priority,
+                    "position": pos + 1,
+                    "queue_size": len(ordered),
+                    "estimated_start_in_s": round(wait_s, 2),
+                    "estimated_start_at": time.time() + wait_s,
+                }
+        return None
+
+    def stats(self):
+        by_priority = {name: 0 for name in PRIORITY_CLASSES}
+        queued = self._queue.ordered()
+        for job in queued:
+            by_priority[job.priority] += 1
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "max_queue": self.max_queue,
+                "shared_queue": self._queue.shared,
+                "queued": len(queued),
+                "queued_by_priority": by_priority,
+                "running": len(self._running),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "rtf_estimate": round(self._rtf, 4),
+            }
+
+    # ===== worker =====
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                seen = self._submitted
+            # 领取（共享队列为一次数据库事务）不持有 _cond
+            job = self._queue.pop()
+            if job is None:
+                with self._cond:
+                    # 领取期间没有新提交才等待；共享队列的作业可能由其他进程提交，不会唤醒本进程，需定期轮询
+                    if not self._closed and self._submitted == seen:
+                        self._cond.wait(self.poll_interval if self._queue.shared else None)
+                continue
+            if job.started_at is None:
+                job.started_at = time.time()
+            with self._cond:
+                self._running[id(job)] = job
+            QUEUE_WAIT_SECONDS.observe(job.started_at - job.submitted_at, kind=job.kind)
+            ok = True
+            try:
+                self.handlers[job.kind](job.task_id)
+            except Exception as e:
+                ok = False
+                print(f"[scheduler] job {job.kind}:{job.task_id} failed: {e}")
+            finally:
+                self._finish(job, ok)
+
+    def _finish(self, job, ok):
+        elapsed = time.time() - job.started_at
+        self._queue.finish(job)
+        with self._cond:
+            self._running.pop(id(job), None)
+            if ok:
+                self._completed += 1
+            else:
+                self._failed += 1
+            # 更新耗时估计
+            if job.est_duration:
+                self._rtf = 0.8 * self._rtf + 0.2 * (elapsed / job.est_duration)
+            self._job_s = 0.8 * self._job_s + 0.2 * elapsed
@@ -0,0 +1,159 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def audio_digest(audio_bytes):
+    """音频内容哈希：相同字节的上传共享同一份解码结果"""
+    return hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+
+
+def new_audio_hasher():
+    """增量哈希器，与 audio_digest 结果一致（用于分块读取时边读边算）"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """按块读取文件计算哈希，与 audio_digest(文件内容) 一致"""
+    hasher = new_audio_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _sizeof(value):
+    """粗略估计缓存值占用的字节数；以 ndarray 为主，其余结构按小对象计"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return 64 + sum(_sizeof(v) for v in value.values())
+    return 64
+
+
+class WaveformCache:
+    """按音频内容哈希寻址的波形缓存，带字节预算与 LRU 淘汰。
+
+    条目键为 (digest, artifact)：artifact="audio" 保存解码结果
+    (audio, sr, duration)，其余如 "enhanced"、"vad@raw" 保存派生产物。
+    get_or_compute 保证同一条目并发请求只计算一次。
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()  # (digest, artifact) -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # (digest, artifact) -> {"event": Event, "value": ...}
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+
+    def get(self, digest, artifact="audio"):
+        key = (digest, artifact)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses[artifact] = self._misses.get(artifact, 0) + 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits[artifact] = self._hits.get(artifact, 0) + 1
+            return entry[0]
+
+    def peek(self, digest, artifact="audio"):
+        """读取但不计入命中统计、不调整 LRU 顺序"""
+        with self._lock:
+            entry = self._entries.get((digest, artifact))
+            return entry[0] if entry is not None else None
+
+    def put(self, digest, artifact, value):
+        key = (digest, artifact)
+        nbytes = _sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # 超过整体预算的单个条目不缓存
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
+
+    def get_or_compute(self, digest, artifact, compute):
+        """命中直接返回；未命中时由一个线程计算，其余并发请求等待并复用其结果"""
+        key = (digest, artifact)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._hits[artifact] = self._hits.get(artifact, 0) + 1
+                    return entry[0]
+                flight = self._inflight.get(key)
+                owner = flight is None
+                if owner:
+                    flight = {"event": threading.Event()}
+                    self._inflight[key] = flight
+                    self._misses[artifact] = self._misses.get(artifact, 0) + 1
+            if not owner:
+                flight["event"].wait()
+                if "value" in flight:
+                    return flight["value"]
+                # 计算方失败：重新竞争
+                continue
+            try:
+                value = compute()
+                flight["value"] = value
+                self.put(digest, artifact, value)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                flight["event"].set()
+
+    def invalidate(self, digest):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == digest]:
+                _, nbytes = self._entries.pop(key)
+                self._bytes -= nbytes
+
+    def discard_value(self, digest, value):
+        """删除该音频下持有 value 这个数组的条目（解码结果为 (audio, sr, duration) 元组），返回释放的字节数。
+
+        任务 payload 落盘为 memmap 时调用，否则缓存仍引用原数组，内存并不会真正释放。
+        """
+        freed = 0
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == digest]:
+                cached = self._entries[key][0]
+                if cached is value or (isinstance(cached, tuple) and cached and cached[0] is value):
+                    _, nbytes = self._entries.pop(key)
+                    self._bytes -= nbytes
+                    freed += nbytes
+        return freed
+
+    def stats(self):
+        with self._lock:
+            artifacts = sorted(set(self._hits) | set(self._misses))
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": (hits / (hits + misses)) if (hits + misses) else 0.0,
+                "by_artifact": {a: {"hits": self._hits.get(a, 0), "misses": self._misses.get(a, 0)} for a in artifacts},
+            }
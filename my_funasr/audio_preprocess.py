@@ -1,15 +1,200 @@
-import librosa
+import soundfile as sf
+import numpy as np
 import io
+import os
+import struct
+
+TARGET_SR = 16000
+DECODE_BLOCK_FRAMES = 1 << 16
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
 # 现有的简单处理：返回统一采样率的单段
 def process(audio_bytes: bytes):
     # 加载并重采样到 16kHz
-    y, sr = librosa.load(io.BytesIO(audio_bytes), sr=16000, mono=True)
-    duration = len(y) / sr
+    y, sr, duration = load_audio(audio_bytes)
     return [{"audio": y, "sample_rate": sr, "duration": duration}]
 
+def _open_source(source):
+    """音频来源可以是字节（bytes/memmap）或磁盘路径"""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    return io.BytesIO(source)
+
+# ===== WAV 头解析：只认 PCM int16 / float32，其余格式交给 soundfile =====
+def parse_wav_header(f):
+    """从文件对象读取 RIFF/WAVE 头，返回格式信息 dict；非 WAV 或不支持的编码返回 None"""
+    head = f.read(12)
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"fmt ":
+            body = f.read(size)
+            if len(body) < 16:
+                return None
+            tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                tag = struct.unpack("<H", body[24:26])[0]
+            fmt = {"format": tag, "channels": channels, "sample_rate": sample_rate, "bits": bits}
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            if fmt["format"] == WAVE_FORMAT_PCM and fmt["bits"] == 16:
+                dtype = np.dtype("<i2")
+            elif fmt["format"] == WAVE_FORMAT_IEEE_FLOAT and fmt["bits"] == 32:
+                dtype = np.dtype("<f4")
+            else:
+                return None
+            offset = f.tell()
+            frame_bytes = dtype.itemsize * fmt["channels"]
+            # 流式写出的 WAV 可能把 data 大小写成 0 或 0xFFFFFFFF，按实际剩余长度截断
+            f.seek(0, io.SEEK_END)
+            available = f.tell() - offset
+            if size == 0 or size > available:
+                size = available
+            fmt.update(dtype=dtype, offset=offset, frames=size // frame_bytes)
+            return fmt
+        else:
+            # RIFF 块按偶数字节对齐
+            f.seek(size + (size & 1), io.SEEK_CUR)
+
+def _wav_samples(source, info):
+    """返回 WAV 数据区的只读视图（字节来源用 frombuffer，路径来源用 memmap），不拷贝"""
+    count = info["frames"] * info["channels"]
+    if isinstance(source, (str, os.PathLike)):
+        data = np.memmap(source, dtype=info["dtype"], mode="r", offset=info["offset"], shape=(count,))
+    else:
+        data = np.frombuffer(source, dtype=info["dtype"], count=count, offset=info["offset"])
+    return data.reshape(-1, info["channels"]) if info["channels"] > 1 else data
+
+def _to_float32_mono(data):
+    if data.ndim == 2:
+        # 下混时顺带完成 int16 -> float32
+        mono = data.mean(axis=1, dtype=np.float32)
+        if data.dtype == np.int16:
+            mono *= 1.0 / 32768.0
+        return mono
+    if data.dtype == np.float32:
+        return data
+    mono = data.astype(np.float32)
+    mono *= 1.0 / 32768.0
+    return mono
+
+def resample(y, orig_sr, target_sr=TARGET_SR):
+    """高质量快速重采样：优先 soxr，其次 scipy 多相滤波，最后 librosa"""
+    if orig_sr == target_sr:
+        return y
+    try:
+        import soxr
+        return soxr.resample(y, orig_sr, target_sr, quality="HQ").astype(np.float32, copy=False)
+    except ImportError:
+        pass
+    try:
+        from math import gcd
+        from scipy.signal import resample_poly
+        g = gcd(int(orig_sr), int(target_sr))
+        return resample_poly(y, target_sr // g, orig_sr // g).astype(np.float32, copy=False)
+    except ImportError:
+        import librosa
+        return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr)
+
+def _load_wav_fast(source):
+    """PCM16/float32 WAV 快速路径：16kHz 单声道 float32 直接返回视图；16kHz 多声道只做一次下混；
+    其他采样率在数据区视图上按块下混 + 流式重采样，峰值内存约为一份 16kHz 输出"""
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    try:
+        info = parse_wav_header(f)
+    finally:
+        f.close()
+    if info is None or info["channels"] < 1 or info["frames"] <= 0:
+        return None
+    data = _wav_samples(source, info)
+    if info["sample_rate"] == TARGET_SR:
+        return _to_float32_mono(data)
+    try:
+        import soxr  # noqa: F401
+    except ImportError:
+        return resample(_to_float32_mono(data), info["sample_rate"])
+    blocks = (_to_float32_mono(data[i:i + DECODE_BLOCK_FRAMES]) for i in range(0, len(data), DECODE_BLOCK_FRAMES))
+    return _resample_blocks(blocks, info["sample_rate"], info["frames"])
+
+def _resample_blocks(blocks, in_sr, frames, target_sr=TARGET_SR):
+    """逐块的单声道 float32 数据流式重采样，写入预分配的 target_sr float32 缓冲区"""
+    import soxr
+
+    if in_sr == target_sr:
+        resampler = None
+        capacity = frames
+    else:
+        resampler = soxr.ResampleStream(in_sr, target_sr, 1, dtype="float32")
+        capacity = int(np.ceil(frames * target_sr / in_sr)) + 64
+    out = np.empty(capacity, dtype=np.float32)
+    pos = 0
+
+    def write(chunk):
+        nonlocal out, pos
+        n = len(chunk)
+        if pos + n > len(out):
+            out = np.resize(out, pos + n)
+        out[pos:pos + n] = chunk
+        pos += n
+
+    for mono in blocks:
+        if resampler is not None:
+            mono = resampler.resample_chunk(mono, last=False)
+        write(mono)
+    if resampler is not None:
+        write(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+    return out[:pos]
+
+def _decode_blockwise(source, target_sr=TARGET_SR, block_frames=DECODE_BLOCK_FRAMES):
+    """按块解码 + 下混 + 流式重采样，写入预分配的 16kHz float32 缓冲区"""
+    with sf.SoundFile(_open_source(source)) as f:
+        in_sr, frames, channels = f.samplerate, f.frames, f.channels
+        if frames <= 0:
+            raise ValueError("unknown frame count")
+        blocks = (block[:, 0] if channels == 1 else block.mean(axis=1)
+                  for block in f.blocks(blocksize=block_frames, dtype="float32", always_2d=True))
+        return _resample_blocks(blocks, in_sr, frames, target_sr)
+
 # 新增：管线使用的加载函数，返回 (波形, 采样率, 时长)
-def load_audio(audio_bytes: bytes):
-    y, sr = librosa.load(io.BytesIO(audio_bytes), sr=16000, mono=True)
+# source 为音频字节或上传落盘后的文件路径。解码顺序：
+#   1) PCM16/float32 WAV：解析文件头，直接取数据区视图，非 16kHz 时在视图上按块重采样
+#   2) soundfile 可解码的格式（FLAC/OGG/MP3 等）：分块解码 + 流式重采样
+#   3) 其余格式回退 librosa（懒加载，避免启动时的导入开销）
+def load_audio(source):
+    y = None
+    try:
+        y = _load_wav_fast(source)
+    except Exception:
+        y = None
+    if y is None:
+        try:
+            y = _decode_blockwise(source)
+        except Exception:
+            import librosa
+            y, _ = librosa.load(_open_source(source), sr=TARGET_SR, mono=True)
+    sr = TARGET_SR
     duration = len(y) / sr
     return y, sr, duration
+
+# 新增：仅读取文件头估计时长（用于调度优先级），失败时按 128kbps 码率粗估
+def estimate_duration(source, fallback_bitrate=128000):
+    try:
+        info = sf.info(_open_source(source))
+        if info.samplerate and info.frames:
+            return info.frames / float(info.samplerate)
+    except Exception:
+        pass
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+    else:
+        size = len(source)
+    return size * 8.0 / fallback_bitrate
@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class _Request:
+    __slots__ = ("audio", "sample_rate", "task_id", "index", "duration", "enqueued_at", "future")
+
+    def __init__(self, audio, sample_rate, task_id, index):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.task_id = task_id
+        self.index = index
+        self.duration = len(audio) / float(sample_rate) if sample_rate else 0.0
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+
+class ASRBatchScheduler:
+    """跨任务的 ASR 动态微批调度器。
+
+    收集所有在途任务提交的分段，在 max_wait_ms 窗口内按时长分桶凑批，
+    调用一次批量推理后把结果按 (task_id, index) 回填到各自的 Future。
+    generate_fn(inputs, sample_rate) 接收波形列表，返回等长的文本列表。
+    """
+
+    def __init__(self, generate_fn, max_batch_size=8, max_wait_ms=20, length_bucket_s=2.0, max_batch_audio_s=240.0, stats_window=1024):
+        self.generate_fn = generate_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.length_bucket_s = max(1e-3, float(length_bucket_s))
+        self.max_batch_audio_s = float(max_batch_audio_s)
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        # 统计：批大小分布、排队等待时间（秒）
+        self._batches = 0
+        self._items = 0
+        self._batch_size_hist = {}
+        self._waits = deque(maxlen=stats_window)
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._fallbacks = 0
+
+    # ===== 提交 =====
+    def submit(self, audio, sample_rate=16000, task_id=None, index=None):
+        """提交单个分段，返回 Future，结果为识别文本"""
+        req = _Request(audio, sample_rate, task_id, index)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("batch scheduler stopped")
+            self._ensure_thread()
+            self._pending.append(req)
+            self._cond.notify()
+        return req.future
+
+    def submit_many(self, audios, sample_rate=16000, task_id=None):
+        """批量提交同一任务的多个分段，返回与输入顺序一致的 Future 列表"""
+        reqs = [_Request(a, sample_rate, task_id, i) for i, a in enumerate(audios)]
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("batch scheduler stopped")
+            self._ensure_thread()
+            self._pending.extend(reqs)
+            self._cond.notify()
+        return [r.future for r in reqs]
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="asr-batch-scheduler", daemon=True)
+            self._thread.start()
+
+    # ===== 调度循环 =====
+    def _bucket(self, req):
+        return (req.sample_rate, int(req.duration // self.length_bucket_s))
+
+    def _take_batch(self):
+        """以最早的请求所在分桶为准凑批；调用方需持有锁"""
+        oldest = self._pending[0]
+        key = self._bucket(oldest)
+        batch, rest, total_s = [], [], 0.0
+        for req in self._pending:
+            fits = (
+                len(batch) < self.max_batch_size
+                and self._bucket(req) == key
+                and (not batch or total_s + req.duration <= self.max_batch_audio_s)
+            )
+            if fits:
+                batch.append(req)
+                total_s += req.duration
+            else:
+                rest.append(req)
+        self._pending = rest
+        return batch
+
+    def _ready(self, now):
+        """最早请求等满窗口，或其分桶已凑满一批时出批"""
+        oldest = self._pending[0]
+        if now - oldest.enqueued_at >= self.max_wait:
+            return True
+        key = self._bucket(oldest)
+        return sum(1 for r in self._pending if self._bucket(r) == key) >= self.max_batch_size
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+                now = time.monotonic()
+                while not self._ready(now) and not self._stopped:
+                    self._cond.wait(timeout=max(0.0, self._pending[0].enqueued_at + self.max_wait - now))
+                    now = time.monotonic()
+                batch = self._take_batch()
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        # 未被取消的请求才进入推理
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self._record(batch, started)
+        try:
+            texts = self.generate_fn([r.audio for r in batch], batch[0].sample_rate)
+            if len(texts) != len(batch):
+                raise ValueError(f"batched generate returned {len(texts)} results for {len(batch)} inputs")
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # 批量失败时逐条回退，单条错误只影响对应分段
+            self._fallbacks += 1
+            for r in batch:
+                try:
+                    r.future.set_result(self.generate_fn([r.audio], r.sample_rate)[0])
+                except Exception as item_err:
+                    r.future.set_exception(item_err)
+            return
+        for r, text in zip(batch, texts):
+            r.future.set_result(text)
+
+    def _record(self, batch, started):
+        with self._cond:
+            n = len(batch)
+            self._batches += 1
+            self._items += n
+            self._batch_size_hist[n] = self._batch_size_hist.get(n, 0) + 1
+            self._batch_sizes.append(n)
+            for r in batch:
+                self._waits.append(started - r.enqueued_at)
+
+    # ===== 统计 =====
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            sizes = list(self._batch_sizes)
+            pending = len(self._pending)
+            hist = dict(sorted(self._batch_size_hist.items()))
+            batches, items, fallbacks = self._batches, self._items, self._fallbacks
+
+        def pct(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))] * 1000.0
+
+        return {
+            "batches": batches,
+            "items": items,
+            "pending": pending,
+            "fallbacks": fallbacks,
+            "avg_batch_size": (items / batches) if batches else 0.0,
+            "recent_avg_batch_size": (sum(sizes) / len(sizes)) if sizes else 0.0,
+            "batch_size_hist": hist,
+            "wait_ms": {
+                "avg": (sum(waits) / len(waits) * 1000.0) if waits else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "max": (waits[-1] * 1000.0) if waits else 0.0,
+            },
+            "config": {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "length_bucket_s": self.length_bucket_s,
+                "max_batch_audio_s": self.max_batch_audio_s,
+            },
+        }
@@ -0,0 +1,118 @@
+import numpy as np
+
+# 内置能量 VAD：未配置官方 VAD 模型时使用，全部计算基于 NumPy 向量化
+
+
+def frame_features(audio, sr, frame_ms=25, hop_ms=10, block_frames=4096):
+    """分帧计算对数能量（dB）与过零率，返回 (energy_db, zcr, hop)。
+
+    按 block_frames 帧分块向量化计算，长录音的中间数组大小有界。
+    """
+    frame = max(2, int(sr * frame_ms / 1000))
+    hop = max(1, int(sr * hop_ms / 1000))
+    audio = np.asarray(audio, dtype=np.float32)
+    if len(audio) < frame:
+        audio = np.pad(audio, (0, frame - len(audio)))
+    n_frames = 1 + (len(audio) - frame) // hop
+    energy_db = np.empty(n_frames, dtype=np.float64)
+    zcr = np.empty(n_frames, dtype=np.float64)
+    for i0 in range(0, n_frames, block_frames):
+        i1 = min(n_frames, i0 + block_frames)
+        chunk = audio[i0 * hop: (i1 - 1) * hop + frame]
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, frame)[::hop]
+        power = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+        energy_db[i0:i1] = 10.0 * np.log10(power + 1e-12)
+        signs = np.signbit(frames)
+        zcr[i0:i1] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(frame - 1)
+    return energy_db, zcr, hop
+
+
+def _runs(mask):
+    """返回布尔序列中连续 True 区间的 [start, end) 帧下标"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def _dilate(mask, radius):
+    """一维膨胀：每个语音帧向两侧延伸 radius 帧（拖尾平滑）"""
+    if radius <= 0 or not mask.any():
+        return mask
+    # 前缀和求 [i - radius, i + radius] 窗口内的语音帧数；窗口在两端截断，输出长度与输入一致
+    # （np.convolve 的 same 模式在序列短于卷积核时会返回核的长度）
+    n = len(mask)
+    csum = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    idx = np.arange(n)
+    counts = csum[np.minimum(idx + radius + 1, n)] - csum[np.maximum(idx - radius, 0)]
+    return counts > 0
+
+
+def energy_vad(audio, sr, frame_ms=25, hop_ms=10, margin_db=12.0, dynamic_range_db=30.0, min_energy_db=-55.0, zcr_threshold=0.25,
+               hangover_ms=300, min_speech_ms=200, pad_ms=100):
+    """基于帧能量 + 过零率的 VAD，返回 [{"start": s, "end": e}, ...]（秒）。
+
+    阈值按噪声底（能量 10% 分位）自适应；能量略低但过零率高的帧（清辅音）
+    也判为语音。拖尾 hangover_ms 内的短静音并入前后语音段，短于 min_speech_ms
+    的孤立语音段丢弃。
+    """
+    duration = len(audio) / float(sr)
+    if len(audio) == 0:
+        return []
+    energy_db, zcr, hop = frame_features(audio, sr, frame_ms, hop_ms)
+    hop_s = hop / float(sr)
+    # 噪声底取能量 10% 分位；语音占绝大部分时噪声底即语音电平，故阈值不超过峰值电平以下 dynamic_range_db
+    noise_floor, peak = np.percentile(energy_db, [10, 95])
+    threshold = max(min(noise_floor + margin_db, peak - dynamic_range_db), min_energy_db)
+    speech = (energy_db > threshold) | ((energy_db > threshold - 6.0) & (zcr > zcr_threshold))
+
+    # 先按半个拖尾膨胀填补短静音，再用同样半径腐蚀回原边界
+    radius = int(round(hangover_ms / 2 / hop_ms))
+    speech = ~_dilate(~_dilate(speech, radius), radius)
+
+    starts, ends = _runs(speech)
+    min_frames = int(round(min_speech_ms / hop_ms))
+    keep = (ends - starts) >= max(1, min_frames)
+    pad = pad_ms / 1000.0
+    segments = []
+    for s, e in zip(starts[keep], ends[keep]):
+        start = max(0.0, float(s) * hop_s - pad)
+        end = min(duration, float(e) * hop_s + frame_ms / 1000.0 + pad)
+        if segments and start <= segments[-1]["end"]:
+            segments[-1]["end"] = round(end, 3)
+        else:
+            segments.append({"start": round(start, 3), "end": round(end, 3)})
+    return segments
+
+
+def split_long_segments(segments, audio=None, sr=16000, max_segment_s=30.0, overlap_s=1.0, search_s=3.0):
+    """把超过 max_segment_s 的分段切成有界长度的子段，相邻子段重叠 overlap_s 秒。
+
+    提供 audio 时，切点选在每个窗口末尾 search_s 秒内能量最低的位置，尽量不切断词语。
+    """
+    if not max_segment_s or max_segment_s <= 0:
+        return list(segments)
+    overlap_s = max(0.0, min(overlap_s, max_segment_s / 2.0))
+    out = []
+    for seg in segments:
+        start, end = float(seg["start"]), float(seg["end"])
+        extra = {k: v for k, v in seg.items() if k not in ("start", "end")}
+        while end - start > max_segment_s:
+            cut = start + max_segment_s - overlap_s
+            if audio is not None:
+                cut = _quietest_point(audio, sr, max(start + max_segment_s / 2.0, cut - search_s), cut)
+            out.append({"start": round(start, 3), "end": round(min(end, cut + overlap_s), 3), **extra})
+            start = cut
+        out.append({"start": round(start, 3), "end": round(end, 3), **extra})
+    return out
+
+
+def _quietest_point(audio, sr, lo, hi, win_ms=20):
+    """在 [lo, hi] 秒区间内找能量最低的 win_ms 窗口中心"""
+    a, b = int(lo * sr), int(hi * sr)
+    win = max(1, int(sr * win_ms / 1000))
+    region = np.asarray(audio[a:b], dtype=np.float32)
+    if len(region) < 2 * win:
+        return hi
+    n = len(region) // win
+    power = np.square(region[: n * win]).reshape(n, win).mean(axis=1)
+    return (a + (int(np.argmin(power)) + 0.5) * win) / float(sr)
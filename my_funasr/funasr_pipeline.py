@@ -1,95 +1,227 @@
-import io, librosa
 import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import Future
 import numpy as np
 from funasr import AutoModel
 from my_funasr.audio_preprocess import load_audio
 from my_funasr.text_postprocess import combine_segments
+from my_funasr.batch_scheduler import ASRBatchScheduler
+from my_funasr.audio_cache import WaveformCache, audio_digest, file_digest
+from my_funasr.energy_vad import energy_vad, split_long_segments
+from my_funasr.model_registry import ModelRegistry
+from my_funasr.metrics import stage_timer, STAGE_SECONDS, ASR_SEGMENT_SECONDS, TASK_SECONDS, TASK_RTF, AUDIO_SECONDS
+import time
 
 class FunASRPipeline:
     def __init__(self, asr_model_dir, punc_model_dir=None, spk_model_dir=None, device="cpu", use_external_punc=False, use_diarization=None,
-                 sense_model_dir=None, vad_model_dir=None, enhance_model_dir=None):
-        print("🚀 Loading ASR model...")
-        # 设备处理：优先尝试使用传入设备（包括 mps），失败则回退到 cpu
-        def _load_with_device(model_dir):
-            try:
-                return AutoModel(model=model_dir, device=device)
-            except Exception as e:
-                if device == "mps":
-                    print(f"[device] MPS init failed for {model_dir}, fallback to CPU: {e}")
-                    return AutoModel(model=model_dir, device="cpu")
-                raise
-
-        self.asr_model = _load_with_device(asr_model_dir)
+                 sense_model_dir=None, vad_model_dir=None, enhance_model_dir=None,
+                 asr_batch_size=8, asr_batch_wait_ms=20, asr_batch_bucket_s=2.0, audio_cache_bytes=1 << 30,
+                 max_segment_s=30.0, segment_overlap_s=1.0, model_load_workers=4):
+        self.device = device
         self.use_external_punc = use_external_punc
         # 根据目录名自动判断是否是分离模型；若传入 False 则禁用
         self.use_diarization = use_diarization if use_diarization is not None else (
             spk_model_dir is not None and ("diar" in spk_model_dir or "speaker-diarization" in spk_model_dir)
         )
 
-        # 可选模型：SenseSmallVoice（替代 ASR 的 transformer 路线）、官方 VAD、增强
-        self.sense_model = None
+        # 模型登记到注册表，构造时不加载：preload_models() 后台并行加载，或在阶段首次使用时懒加载。
+        # 可选模型：SenseSmallVoice（替代 ASR 的 transformer 路线）、官方 VAD、增强；
+        # 标点与分离模型只在对应开关打开时登记，否则永远不会被加载
+        self.models = ModelRegistry(self._load_model, max_workers=model_load_workers)
+        self.models.register("asr", asr_model_dir, required=True)
         if sense_model_dir:
-            try:
-                self.sense_model = _load_with_device(sense_model_dir)
-            except Exception as e:
-                print(f"[transformer] skip loading SenseSmallVoice: {e}")
-        self.vad_model = None
+            self.models.register("sense", sense_model_dir)
         if vad_model_dir:
-            try:
-                self.vad_model = _load_with_device(vad_model_dir)
-            except Exception as e:
-                print(f"[vad] skip loading official VAD: {e}")
-        self.enhance_model = None
+            self.models.register("vad", vad_model_dir)
         if enhance_model_dir:
-            try:
-                self.enhance_model = _load_with_device(enhance_model_dir)
-            except Exception as e:
-                print(f"[enhance] skip loading mossformer2: {e}")
-
+            self.models.register("enhance", enhance_model_dir)
         if self.use_external_punc and punc_model_dir:
-            print("🔤 Loading punctuation model...")
-            self.punc_model = _load_with_device(punc_model_dir)
-        else:
-            self.punc_model = None
-
+            self.models.register("punc", punc_model_dir)
         if self.use_diarization and spk_model_dir:
-            print("🗣️ Loading diarization model...")
-            self.spk_model = _load_with_device(spk_model_dir)
-        else:
-            self.spk_model = None
-        print("✅ Models loaded.")
+            self.models.register("spk", spk_model_dir)
+
+        # 跨任务 ASR 微批：所有在途任务的分段在同一窗口内凑批推理
+        self.batch_scheduler = ASRBatchScheduler(
+            self._asr_generate_batch,
+            max_batch_size=asr_batch_size,
+            max_wait_ms=asr_batch_wait_ms,
+            length_bucket_s=asr_batch_bucket_s,
+        )
+        # 解码波形与派生产物（增强音频、VAD 分段）按音频内容哈希缓存，各阶段共享
+        self.audio_cache = WaveformCache(max_bytes=audio_cache_bytes)
+        # 分段长度上限与相邻切块的重叠（秒）；未配置官方 VAD 时使用内置能量 VAD
+        self.max_segment_s = max_segment_s
+        self.segment_overlap_s = segment_overlap_s
 
+    # ===== 模型加载 =====
+    def _load_model(self, name, model_dir):
+        """设备处理：优先尝试使用传入设备（包括 mps），失败则回退到 cpu"""
+        try:
+            model = AutoModel(model=model_dir, device=self.device)
+        except Exception as e:
+            if self.device != "mps":
+                raise
+            print(f"[device] MPS init failed for {model_dir}, fallback to CPU: {e}")
+            return AutoModel(model=model_dir, device="cpu")
         # MPS 设备预热：短音频触发内核编译，减少首次推理延迟
-        if device == "mps":
+        if self.device == "mps" and name in ("asr", "enhance"):
             try:
-                warm = np.zeros(8000, dtype=np.float32)  # 0.5s @16k
-                self.asr_model.generate(input=warm, sample_rate=16000)
-                if self.enhance_model:
-                    self.enhance_model.generate(input=warm, sample_rate=16000)
-                print("⚡ MPS warm-up done")
+                model.generate(input=np.zeros(8000, dtype=np.float32), sample_rate=16000)  # 0.5s @16k
             except Exception as e:
-                print(f"[mps] warm-up failed: {e}")
+                print(f"[mps] warm-up failed for {name}: {e}")
+        return model
+
+    def preload_models(self):
+        """后台并行加载全部已登记的模型，立即返回；加载状态见 models.status()"""
+        self.models.start()
+
+    def result_config(self):
+        """影响全流程识别结果的配置（模型与分段参数），作为结果缓存键的一部分"""
+        models = {name: m["model_dir"] for name, m in self.models.status().items() if name != "sense"}
+        return {"models": models, "use_diarization": bool(self.use_diarization),
+                "max_segment_s": self.max_segment_s, "segment_overlap_s": self.segment_overlap_s}
+
+    @property
+    def asr_model(self):
+        return self.models.get("asr")
+
+    @property
+    def sense_model(self):
+        return self.models.get("sense")
+
+    @property
+    def vad_model(self):
+        return self.models.get("vad")
+
+    @property
+    def enhance_model(self):
+        return self.models.get("enhance")
+
+    @property
+    def punc_model(self):
+        return self.models.get("punc")
+
+    @property
+    def spk_model(self):
+        return self.models.get("spk")
+
+    # ===== 音频与派生产物缓存 =====
+    @staticmethod
+    def _payload_source(payload):
+        """payload 中的音频来源：大文件上传为落盘路径，小文件为内存字节"""
+        if not payload:
+            return None
+        if payload.get("audio_path") is not None:
+            return payload["audio_path"]
+        return payload.get("audio_bytes")
+
+    @staticmethod
+    def _source_fields(source):
+        if isinstance(source, str):
+            return {"audio_path": source}
+        return {"audio_bytes": source}
+
+    def _audio_key(self, task_id, task_manager, source):
+        payload = task_manager.get_payload(task_id) or {}
+        key = payload.get("audio_hash")
+        if not key:
+            if source is None:
+                raise ValueError("audio payload released; please resubmit the file")
+            key = file_digest(source) if isinstance(source, str) else audio_digest(source)
+            task_manager.merge_payload(task_id, audio_hash=key)
+        return key
+
+    def _decode(self, key, source):
+        """解码 + 重采样只做一次，返回 (audio, sr, duration)"""
+        def compute():
+            # 任务结束后原始音频已释放，只能命中缓存
+            if source is None:
+                raise ValueError("audio payload released; please resubmit the file")
+            return load_audio(source)
+        return self.audio_cache.get_or_compute(key, "audio", compute)
+
+    def _enhance(self, key, audio, sr):
+        """增强结果按音频哈希缓存"""
+        def compute():
+            out = self.enhance_model.generate(input=audio, sample_rate=sr)
+            return out.get("audio", audio) if isinstance(out, dict) else audio
+        return self.audio_cache.get_or_compute(key, "enhanced", compute)
+
+    def _cached_enhanced(self, key, payload):
+        """已有增强结果时直接复用（payload 优先，其次缓存），否则返回 None"""
+        if payload and payload.get("enhanced") and payload.get("audio") is not None:
+            return payload["audio"]
+        return self.audio_cache.get(key, "enhanced")
+
+    def _vad(self, key, audio, sr, duration, source):
+        """VAD 分段按 (音频哈希, 输入来源) 缓存；source 为 raw 或 enhanced"""
+        def compute():
+            out = self.vad_model.generate(input=audio, sample_rate=sr)
+            segments = out.get("segments", []) if isinstance(out, dict) else []
+            return segments or [{"start": 0.0, "end": duration}]
+        return self.audio_cache.get_or_compute(key, f"vad@{source}", compute)
+
+    def _segment(self, key, audio, sr, duration, source):
+        """分段：官方 VAD 优先，否则内置能量 VAD；超长分段按上限切块（相邻块重叠）。返回 (segments, method)"""
+        if self.vad_model:
+            segments, method = self._vad(key, audio, sr, duration, source), "vad_model"
+        else:
+            segments = self.audio_cache.get_or_compute(key, f"energy_vad@{source}", lambda: energy_vad(audio, sr))
+            method = "energy_vad"
+        if not segments:
+            segments = [{"start": 0.0, "end": duration}]
+        return self._bound_segments(segments, audio, sr), method
+
+    def _bound_segments(self, segments, audio, sr):
+        return split_long_segments(segments, audio, sr, max_segment_s=self.max_segment_s, overlap_s=self.segment_overlap_s)
+
+    # ===== ASR 批量推理（供微批调度器调用） =====
+    def _asr_generate_batch(self, inputs, sample_rate):
+        started = time.perf_counter()
+        texts = self._asr_generate_batch_raw(inputs, sample_rate)
+        per_segment = (time.perf_counter() - started) / max(1, len(inputs))
+        for _ in inputs:
+            ASR_SEGMENT_SECONDS.observe(per_segment)
+        return texts
+
+    def _asr_generate_batch_raw(self, inputs, sample_rate):
+        if len(inputs) == 1:
+            out = self.asr_model.generate(input=inputs[0], sample_rate=sample_rate)
+            return [out[0]["text"] if isinstance(out, list) and len(out) else ""]
+        keys = [f"seg{i}" for i in range(len(inputs))]
+        out = self.asr_model.generate(input=list(inputs), key=keys, batch_size=len(inputs), sample_rate=sample_rate)
+        if not isinstance(out, list) or len(out) != len(inputs):
+            raise ValueError("unexpected batched ASR output")
+        # 优先按 key 回填，缺失 key 时按位置对应
+        by_key = {r.get("key"): r.get("text", "") for r in out if isinstance(r, dict)}
+        if all(k in by_key for k in keys):
+            return [by_key[k] for k in keys]
+        return [r.get("text", "") if isinstance(r, dict) else "" for r in out]
 
     # ===== 单阶段：增强 =====
     def _enhanced_sync(self, task_id, task_manager):
         try:
             task_manager.update_task(task_id, status="running", progress=0.05, message="enhance: loading audio")
             payload = task_manager.get_payload(task_id)
-            audio_bytes = payload.get("audio_bytes") if payload else None
-            audio, sr, duration = load_audio(audio_bytes)
+            source = self._payload_source(payload)
+            key = self._audio_key(task_id, task_manager, source)
+            with stage_timer("decode"):
+                audio, sr, duration = self._decode(key, source)
             task_manager.update_task(task_id, progress=0.10, message=f"enhance: audio loaded sr={sr} dur={duration:.2f}s")
 
             if not self.enhance_model:
                 task_manager.update_task(task_id, stage_name="enhanced", stage_status="error", stage_result={"error":"enhance model not configured"}, message="enhance: model missing")
                 return
 
-            out = self.enhance_model.generate(input=audio, sample_rate=sr)
-            enhanced_audio = out.get("audio", audio) if isinstance(out, dict) else audio
-            task_manager.update_task(task_id, stage_name="enhanced", stage_status="done", stage_result={"duration": duration})
+            with stage_timer("enhance") as t:
+                enhanced_audio = self._enhance(key, audio, sr)
+            task_manager.update_task(task_id, stage_name="enhanced", stage_status="done", stage_result={"duration": duration}, stage_elapsed=t.elapsed)
 
             # 覆盖 payload 中的音频以供后续阶段使用
-            new_payload = {"audio_bytes": audio_bytes, "audio": enhanced_audio, "sr": sr, "duration": duration}
-            task_manager.update_task(task_id, payload=new_payload, message="enhance: done")
+            task_manager.merge_payload(task_id, audio=enhanced_audio, enhanced=True, sr=sr, duration=duration)
+            task_manager.update_task(task_id, message="enhance: done")
         except Exception as e:
             task_manager.update_task(task_id, stage_name="enhanced", stage_status="error", stage_result={"error": str(e)}, message="enhance: error")
 
@@ -101,19 +233,20 @@ class FunASRPipeline:
         try:
             task_manager.update_task(task_id, status="running", progress=0.05, message="vad: loading audio")
             payload = task_manager.get_payload(task_id)
-            audio_bytes = payload.get("audio_bytes") if payload else None
-            audio, sr, duration = load_audio(audio_bytes)
+            source = self._payload_source(payload)
+            key = self._audio_key(task_id, task_manager, source)
+            with stage_timer("decode"):
+                audio, sr, duration = self._decode(key, source)
             task_manager.update_task(task_id, progress=0.10, message=f"vad: audio loaded sr={sr} dur={duration:.2f}s")
 
-            if not self.vad_model:
-                task_manager.update_task(task_id, stage_name="diarization", stage_status="error", stage_result={"error":"vad model not configured"}, message="vad: model missing")
-                return
-
-            out = self.vad_model.generate(input=audio, sample_rate=sr)
-            segments = out.get("segments", []) if isinstance(out, dict) else []
-            if not segments:
-                segments = [{"start": 0.0, "end": duration}]
-            task_manager.update_task(task_id, stage_name="diarization", stage_status="done", stage_result={"segments": segments}, message=f"vad: {len(segments)} segments")
+            # 已有增强结果时与全流程一致，在增强音频上分段；未配置官方 VAD 时使用内置能量 VAD
+            enhanced = self._cached_enhanced(key, payload)
+            with stage_timer("vad") as t:
+                if enhanced is not None:
+                    segments, method = self._segment(key, enhanced, sr, duration, "enhanced")
+                else:
+                    segments, method = self._segment(key, audio, sr, duration, "raw")
+            task_manager.update_task(task_id, stage_name="diarization", stage_status="done", stage_result={"segments": segments, "method": method}, stage_elapsed=t.elapsed, message=f"vad: {len(segments)} segments ({method})")
         except Exception as e:
             task_manager.update_task(task_id, stage_name="diarization", stage_status="error", stage_result={"error": str(e)}, message="vad: error")
 
@@ -125,18 +258,25 @@ class FunASRPipeline:
         try:
             task_manager.update_task(task_id, status="running", progress=0.05, message="transformer: loading audio")
             payload = task_manager.get_payload(task_id)
-            audio_bytes = payload.get("audio_bytes") if payload else None
-            audio, sr, duration = load_audio(audio_bytes)
-            task_manager.update_task(task_id, progress=0.10, message=f"transformer: audio loaded sr={sr} dur={duration:.2f}s")
+            source = self._payload_source(payload)
+            key = self._audio_key(task_id, task_manager, source)
+            with stage_timer("decode"):
+                audio, sr, duration = self._decode(key, source)
+            # 增强阶段已完成时识别增强后的音频
+            enhanced = self._cached_enhanced(key, payload)
+            if enhanced is not None:
+                audio = enhanced
+            task_manager.update_task(task_id, progress=0.10, message=f"transformer: audio loaded sr={sr} dur={duration:.2f}s enhanced={enhanced is not None}")
 
             model = self.sense_model if self.sense_model is not None else self.asr_model
             if model is None:
                 task_manager.update_task(task_id, stage_name="transformer", stage_status="error", stage_result={"error":"SenseSmallVoice not configured"}, message="transformer: model missing")
                 return
 
-            out = model.generate(input=audio, sample_rate=sr)
+            with stage_timer("transformer") as t:
+                out = model.generate(input=audio, sample_rate=sr)
             text = out[0]["text"] if isinstance(out, list) and len(out) else ""
-            task_manager.update_task(task_id, stage_name="transformer", stage_status="done", stage_result={"text": text, "duration": duration}, message="transformer: done")
+            task_manager.update_task(task_id, stage_name="transformer", stage_status="done", stage_result={"text": text, "duration": duration}, stage_elapsed=t.elapsed, message="transformer: done")
         except Exception as e:
             task_manager.update_task(task_id, stage_name="transformer", stage_status="error", stage_result={"error": str(e)}, message="transformer: error")
 
@@ -144,63 +284,229 @@ class FunASRPipeline:
         await asyncio.to_thread(self._transformer_sync, task_id, task_manager)
 
     # ===== 全流程：增强 ->（必要时）分离/分段 -> ASR =====
-    def _run_full_sync(self, task_id, audio_bytes, task_manager):
+    def _run_full_sync(self, task_id, audio_source, task_manager):
+        # 解码放在 _run_stages 内进行：波形只由该帧持有，阶段之间才能换成落盘后的 memmap
+        self._run_stages(task_id, lambda: self._load_task_audio(task_id, audio_source, task_manager), task_manager)
+
+    def _load_task_audio(self, task_id, audio_source, task_manager):
+        """全流程第 0 步：解码音频并登记到任务，返回 (key, audio, sr, duration)"""
+        task_manager.update_task(task_id, status="running", progress=0.05, message="loading audio")
+        with stage_timer("decode") as t:
+            key = self._audio_key(task_id, task_manager, audio_source)
+            audio, sr, duration = self._decode(key, audio_source)
+        task_manager.merge_payload(task_id, **self._source_fields(audio_source), audio=audio, enhanced=False, sr=sr, duration=duration)
+        task_manager.update_task(task_id, stage_name="decode", stage_status="done", stage_elapsed=t.elapsed, progress=0.10, message=f"audio loaded: sr={sr}, dur={duration:.2f}s")
+        return key, audio, sr, duration
+
+    def _run_decoded_sync(self, task_id, key, audio, sr, duration, task_manager, elapsed_before=0.0):
+        """全流程其余步骤：输入为已解码的 16kHz 波形（进程池模式下位于共享内存）"""
+        self._run_stages(task_id, lambda: (key, audio, sr, duration), task_manager, elapsed_before=elapsed_before)
+
+    def _run_stages(self, task_id, load, task_manager, elapsed_before=0.0):
+        """全流程：load() 返回 (key, audio, sr, duration)，随后增强、分段、（可选）分离、识别、合并"""
+        started = time.perf_counter() - elapsed_before
+        duration = None
         try:
-            task_manager.update_task(task_id, status="running", progress=0.05, message="loading audio")
-            audio, sr, duration = load_audio(audio_bytes)
-            task_manager.update_task(task_id, payload={"audio_bytes": audio_bytes, "audio": audio, "sr": sr, "duration": duration}, progress=0.10, message=f"audio loaded: sr={sr}, dur={duration:.2f}s")
-
-            # 1) 增强
-            if self.enhance_model:
-                try:
-                    enh_out = self.enhance_model.generate(input=audio, sample_rate=sr)
-                    audio = enh_out.get("audio", audio) if isinstance(enh_out, dict) else audio
-                    task_manager.update_task(task_id, stage_name="enhanced", stage_status="done", stage_result={"duration": duration}, message="enhance: done")
-                except Exception as e:
-                    task_manager.update_task(task_id, stage_name="enhanced", stage_status="error", stage_result={"error": str(e)}, message="enhance: error")
-
-            # 2) 分段（官方 VAD 优先）
-            segments = []
-            if self.vad_model:
-                try:
-                    out = self.vad_model.generate(input=audio, sample_rate=sr)
-                    segments = out.get("segments", []) if isinstance(out, dict) else []
-                    if not segments:
-                        segments = [{"start": 0.0, "end": duration}]
-                    task_manager.update_task(task_id, stage_name="diarization", stage_status="done", stage_result={"segments": segments}, message=f"vad: {len(segments)} segments")
-                except Exception as e:
-                    segments = [{"start": 0.0, "end": duration}]
-                    task_manager.update_task(task_id, stage_name="diarization", stage_status="error", stage_result={"error": str(e)}, message="vad: error; using full audio")
-            else:
-                segments = [{"start": 0.0, "end": duration}]
-                task_manager.update_task(task_id, message="vad: not configured; using full audio")
-
-            # 3) 若具备真实分离/分离模型则使用其输出（覆盖 segments）
+            key, audio, sr, duration = load()
+            audio = self._stage_audio(task_id, audio, "raw", task_manager)
+            audio, source = self._enhance_step(task_id, key, audio, sr, duration, task_manager)
+            audio = self._stage_audio(task_id, audio, source, task_manager)
+            segments = self._vad_step(task_id, key, audio, sr, duration, source, task_manager)
             if self.use_diarization and self.spk_model is not None:
-                try:
-                    diar_result = self.spk_model.generate(input=audio, sample_rate=sr)
-                    spk_segments = diar_result.get("segments", []) if isinstance(diar_result, dict) else []
-                    if spk_segments:
-                        segments = spk_segments
-                        task_manager.update_task(task_id, message=f"diarization: {len(segments)} segments with speakers")
-                except Exception as e:
-                    task_manager.update_task(task_id, message=f"diarization: failed {e}")
-
-            # 4) 分段识别
-            results = []
-            total = len(segments)
-            for i, seg in enumerate(segments):
-                seg_audio = audio[int(seg["start"]*sr): int(seg["end"]*sr)]
-                asr_out = self.asr_model.generate(input=seg_audio, sample_rate=sr)
-                text = asr_out[0]["text"] if isinstance(asr_out, list) and len(asr_out) else ""
-                results.append({"start": seg["start"], "end": seg["end"], "text": text})
+                audio = self._stage_audio(task_id, audio, source, task_manager)
+                segments = self._apply_diarization(task_id, segments, self._diarization_step(task_id, audio, sr, task_manager), audio, sr, task_manager)
+            audio = self._stage_audio(task_id, audio, source, task_manager)
+            texts, asr_elapsed = self._asr_step(task_id, audio, sr, segments, task_manager)
+            audio = None
+            self._finish_task(task_id, segments, texts, duration, task_manager, started, asr_elapsed)
+        except Exception as e:
+            task_manager.update_task(task_id, status="error", error=str(e), message="pipeline error")
+            self._observe_task("error", time.perf_counter() - started, duration)
+
+    @staticmethod
+    def _stage_audio(task_id, audio, source, task_manager):
+        """阶段之间换用任务表中的波形：超出内存预算时 TaskManager 会把运行中任务的波形落盘为只读 memmap，
+        换用后本线程不再引用原数组，内存才能释放。source 为 raw / enhanced，须与 payload 中的音频一致"""
+        # 只有带内存预算的 TaskManager 会落盘；sqlite 任务表与进程池代理不需要（也不应每阶段读 payload 文件）
+        if not getattr(task_manager, "max_memory_bytes", None):
+            return audio
+        payload = task_manager.get_payload(task_id) or {}
+        current = payload.get("audio")
+        if isinstance(current, np.memmap) and bool(payload.get("enhanced")) == (source == "enhanced") and current.shape == np.shape(audio):
+            return current
+        return audio
+
+    def _prepare_segments(self, task_id, key, audio, sr, duration, task_manager):
+        """批量任务 1~3 步：增强、分段、（可选）说话人分离，返回 (用于识别的音频, raw/enhanced, 分段)"""
+        audio, source = self._enhance_step(task_id, key, audio, sr, duration, task_manager)
+        segments = self._vad_step(task_id, key, audio, sr, duration, source, task_manager)
+        if self.use_diarization and self.spk_model is not None:
+            segments = self._apply_diarization(task_id, segments, self._diarization_step(task_id, audio, sr, task_manager), audio, sr, task_manager)
+        return audio, source, segments
+
+    def _enhance_step(self, task_id, key, audio, sr, duration, task_manager):
+        """1) 增强；未配置或失败时沿用原音频。返回 (audio, source)，source 为 raw 或 enhanced"""
+        if not self.enhance_model:
+            return audio, "raw"
+        with stage_timer("enhance") as t:
+            try:
+                enhanced = self._enhance(key, audio, sr)
+                enhance_error = None
+            except Exception as e:
+                enhance_error = e
+        if enhance_error is not None:
+            task_manager.update_task(task_id, stage_name="enhanced", stage_status="error", stage_result={"error": str(enhance_error)}, stage_elapsed=t.elapsed, message="enhance: error")
+            return audio, "raw"
+        task_manager.merge_payload(task_id, audio=enhanced, enhanced=True)
+        task_manager.update_task(task_id, stage_name="enhanced", stage_status="done", stage_result={"duration": duration}, stage_elapsed=t.elapsed, message="enhance: done")
+        return enhanced, "enhanced"
+
+    def _vad_step(self, task_id, key, audio, sr, duration, source, task_manager):
+        """2) 分段（官方 VAD 优先，否则内置能量 VAD），超长分段切成有重叠的有界子段；失败时退回定长切块"""
+        with stage_timer("vad") as t:
+            try:
+                segments, method = self._segment(key, audio, sr, duration, source)
+                vad_error = None
+            except Exception as e:
+                segments = self._bound_segments([{"start": 0.0, "end": duration}], audio, sr)
+                vad_error = e
+        if vad_error is None:
+            task_manager.update_task(task_id, stage_name="diarization", stage_status="done", stage_result={"segments": segments, "method": method}, stage_elapsed=t.elapsed, message=f"vad: {len(segments)} segments ({method})")
+        else:
+            task_manager.update_task(task_id, stage_name="diarization", stage_status="error", stage_result={"error": str(vad_error)}, stage_elapsed=t.elapsed, message="vad: error; using fixed-length chunks")
+        return segments
+
+    def _diarization_step(self, task_id, audio, sr, task_manager):
+        """3) 说话人分离，返回带说话人的分段（失败或无输出时为空列表）；只依赖音频，可与 VAD 并行"""
+        with stage_timer("speaker_diarization") as t:
+            try:
+                diar_result = self.spk_model.generate(input=audio, sample_rate=sr)
+                spk_segments = diar_result.get("segments", []) if isinstance(diar_result, dict) else []
+                diar_error = None
+            except Exception as e:
+                spk_segments, diar_error = [], e
+        if diar_error is None:
+            task_manager.update_task(task_id, stage_name="speaker_diarization", stage_status="done", stage_result={"segments": len(spk_segments)}, stage_elapsed=t.elapsed)
+        else:
+            task_manager.update_task(task_id, stage_name="speaker_diarization", stage_status="error", stage_result={"error": str(diar_error)}, stage_elapsed=t.elapsed, message=f"diarization: failed {diar_error}")
+        return spk_segments
+
+    def _apply_diarization(self, task_id, segments, spk_segments, audio, sr, task_manager):
+        """具备分离输出时以其分段覆盖 VAD 分段"""
+        if not spk_segments:
+            return segments
+        segments = self._bound_segments(spk_segments, audio, sr)
+        task_manager.update_task(task_id, message=f"diarization: {len(segments)} segments with speakers")
+        return segments
+
+    def _asr_step(self, task_id, audio, sr, segments, task_manager):
+        """4) 分段识别：全部分段交给微批调度器，与其他任务的分段一起凑批。返回 (texts, 耗时)"""
+        texts = []
+        total = len(segments)
+        with stage_timer("asr") as t:
+            seg_audios = [audio[int(seg["start"]*sr): int(seg["end"]*sr)] for seg in segments]
+            futures = self.batch_scheduler.submit_many(seg_audios, sample_rate=sr, task_id=task_id)
+            for i, fut in enumerate(futures):
+                texts.append(fut.result())
                 task_manager.update_task(task_id, progress=0.20 + 0.70*(i+1)/max(total,1), message=f"asr: {i+1}/{total}")
+        return texts, t.elapsed
 
-            # 5) 合并文本与时间戳
+    def _finish_task(self, task_id, segments, texts, duration, task_manager, started, asr_elapsed):
+        """全流程第 5 步：合并文本与时间戳（重叠切块的重复文字在合并时去除），写入最终结果"""
+        results = [{"start": seg["start"], "end": seg["end"], "text": text} for seg, text in zip(segments, texts)]
+        task_manager.update_task(task_id, stage_name="asr", stage_status="done", stage_result={"segments": len(results)}, stage_elapsed=asr_elapsed, progress=0.90)
+        with stage_timer("combine") as t:
             final_text = combine_segments(results)
-            task_manager.update_task(task_id, status="done", result={"text": final_text, "segments": results, "duration": duration}, message="done")
-        except Exception as e:
-            task_manager.update_task(task_id, status="error", error=str(e), message="pipeline error")
+        task_manager.update_task(task_id, stage_name="combine", stage_status="done", stage_elapsed=t.elapsed)
+        elapsed = time.perf_counter() - started
+        task_manager.update_task(task_id, status="done", result={"text": final_text, "segments": results, "duration": duration, "elapsed_s": round(elapsed, 3), "rtf": round(elapsed / duration, 4) if duration else None}, message="done")
+        self._observe_task("done", elapsed, duration)
+
+    # ===== 批量任务：跨文件统一调度分段 =====
+    def _run_batch_sync(self, children, task_manager, on_child_finished=None, window_audio_s=600.0):
+        """批量全流程。children 为 [(task_id, audio_source), ...]。
+
+        按窗口处理（窗口内音频总时长约 window_audio_s，限制同时驻留的波形）：先逐个解码、增强、分段，
+        再把窗口内所有文件的分段按时长从长到短统一提交给微批调度器，使同批分段长度接近、padding 最少。
+        某个文件的分段全部识别完即合并出结果并回调 on_child_finished(task_id)，不等整个窗口结束。
+        """
+        window, window_s = [], 0.0
+        for task_id, source in children:
+            started = time.perf_counter()
+            duration = None
+            try:
+                key, audio, sr, duration = self._load_task_audio(task_id, source, task_manager)
+                audio, source, segments = self._prepare_segments(task_id, key, audio, sr, duration, task_manager)
+            except Exception as e:
+                task_manager.update_task(task_id, status="error", error=str(e), message="pipeline error")
+                self._observe_task("error", time.perf_counter() - started, duration)
+                if on_child_finished:
+                    on_child_finished(task_id)
+                continue
+            task_manager.update_task(task_id, progress=0.20, message=f"asr: {len(segments)} segments queued with batch")
+            window.append({"task_id": task_id, "audio": audio, "source": source, "sr": sr, "duration": duration, "segments": segments, "started": started})
+            window_s += duration
+            if window_s >= window_audio_s:
+                self._recognize_window(window, task_manager, on_child_finished)
+                window, window_s = [], 0.0
+        if window:
+            self._recognize_window(window, task_manager, on_child_finished)
+
+    def _recognize_window(self, window, task_manager, on_child_finished):
+        completed = queue.Queue()
+        remaining = [len(child["segments"]) for child in window]
+        futures = [[None] * len(child["segments"]) for child in window]
+        lock = threading.Lock()
+
+        def on_done(ci, _fut):
+            with lock:
+                remaining[ci] -= 1
+                last = remaining[ci] == 0
+            if last:
+                completed.put(ci)
+
+        # 窗口内全部分段按时长降序提交
+        order = sorted(((seg["end"] - seg["start"], ci, si) for ci, child in enumerate(window) for si, seg in enumerate(child["segments"])),
+                       key=lambda e: -e[0])
+        asr_started = time.perf_counter()
+        for ci, child in enumerate(window):
+            if not child["segments"]:
+                completed.put(ci)
+        for child in window:
+            child["audio"] = self._stage_audio(child["task_id"], child["audio"], child["source"], task_manager)
+        for _, ci, si in order:
+            child = window[ci]
+            seg, sr = child["segments"][si], child["sr"]
+            try:
+                fut = self.batch_scheduler.submit(child["audio"][int(seg["start"]*sr): int(seg["end"]*sr)], sample_rate=sr, task_id=child["task_id"], index=si)
+            except Exception as e:
+                # 提交失败（如调度器已关闭）：该分段记为失败，计数照常递减，所属文件随后标记错误
+                fut = Future()
+                fut.set_exception(e)
+            futures[ci][si] = fut
+            fut.add_done_callback(functools.partial(on_done, ci))
+
+        for _ in range(len(window)):
+            ci = completed.get()
+            child = window[ci]
+            try:
+                texts = [fut.result() for fut in futures[ci]]
+                asr_elapsed = time.perf_counter() - asr_started
+                STAGE_SECONDS.observe(asr_elapsed, stage="asr")
+                self._finish_task(child["task_id"], child["segments"], texts, child["duration"], task_manager, child["started"], asr_elapsed)
+            except Exception as e:
+                task_manager.update_task(child["task_id"], status="error", error=str(e), message="pipeline error")
+                self._observe_task("error", time.perf_counter() - child["started"], child["duration"])
+            child["audio"] = None
+            if on_child_finished:
+                on_child_finished(child["task_id"])
+
+    @staticmethod
+    def _observe_task(status, elapsed, duration):
+        TASK_SECONDS.observe(elapsed, status=status)
+        if status == "done" and duration:
+            TASK_RTF.observe(elapsed / duration)
+            AUDIO_SECONDS.inc(duration)
 
-    async def run_full_task(self, task_id, audio_bytes, task_manager):
-        await asyncio.to_thread(self._run_full_sync, task_id, audio_bytes, task_manager)
+    async def run_full_task(self, task_id, audio_source, task_manager):
+        await asyncio.to_thread(self._run_full_sync, task_id, audio_source, task_manager)
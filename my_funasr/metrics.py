@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认耗时分桶（秒），覆盖毫秒级解码到分钟级长音频识别
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+
+def _fmt_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v):
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v)) if abs(v) < 1e15 else repr(v)
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # labels -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, ('le', _fmt_value(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """抓取时调用 fn 取值；fn 返回数值，或 {标签值元组: 数值}"""
+
+    type = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name, self.help, self.fn, self.labelnames = name, help, fn, tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"[metrics] {self.type} {self.name} failed: {e}")
+            return lines
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(float(v))}")
+        elif value is not None:
+            lines.append(f"{self.name} {_fmt_value(float(value))}")
+        return lines
+
+
+class CallbackCounter(CallbackGauge):
+    """抓取时从组件自身的累计统计取值的 counter（只增不减，名称以 _total 结尾），用法同 CallbackGauge"""
+
+    type = "counter"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # 重复注册（如 --reload 重新导入）时复用已有指标
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        """回调型 gauge；同名重复注册时替换回调"""
+        gauge = CallbackGauge(name, help, fn, labelnames)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def callback_counter(self, name, help, fn, labelnames=()):
+        """回调型 counter，用于组件内部已有的累计计数；同名重复注册时替换回调"""
+        counter = CallbackCounter(name, help, fn, labelnames)
+        with self._lock:
+            self._metrics[name] = counter
+        return counter
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram("funasr_stage_seconds", "Wall time per pipeline stage", ("stage",))
+ASR_SEGMENT_SECONDS = metrics.histogram("funasr_asr_segment_seconds", "ASR compute time per segment (batch time / batch size)")
+TASK_SECONDS = metrics.histogram("funasr_task_seconds", "End-to-end processing time of full pipeline tasks", ("status",))
+TASK_RTF = metrics.histogram("funasr_task_rtf", "Real-time factor of full pipeline tasks (processing time / audio duration)", buckets=RTF_BUCKETS)
+QUEUE_WAIT_SECONDS = metrics.histogram("funasr_queue_wait_seconds", "Time jobs spend queued before a worker picks them up", ("kind",))
+SUBMISSIONS = metrics.counter("funasr_submissions_total", "Full-pipeline submissions by outcome (new / cache_hit / coalesced)", ("outcome",))
+AUDIO_SECONDS = metrics.counter("funasr_audio_seconds_total", "Seconds of audio processed by full pipeline tasks")
+
+
+class StageTimer:
+    __slots__ = ("stage", "started", "elapsed")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+
+@contextmanager
+def stage_timer(stage, timings=None):
+    """用单调时钟计时一个阶段，写入 funasr_stage_seconds，并可记录到 timings[stage]"""
+    timer = StageTimer(stage)
+    try:
+        yield timer
+    finally:
+        timer.elapsed = time.perf_counter() - timer.started
+        STAGE_SECONDS.observe(timer.elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(timer.elapsed, 6)
@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class _ModelEntry:
+    __slots__ = ("name", "model_dir", "required", "state", "model", "error", "future", "started_at", "load_s")
+
+    def __init__(self, name, model_dir, required):
+        self.name = name
+        self.model_dir = model_dir
+        self.required = required
+        self.state = "pending"  # pending -> loading -> ready / error
+        self.model = None
+        self.error = None
+        self.future = None
+        self.started_at = None
+        self.load_s = None
+
+
+class ModelRegistry:
+    """模型注册表：按名字登记模型目录，后台并行加载或在首次使用时懒加载。
+
+    loader(name, model_dir) 返回模型实例。同一模型只加载一次，并发的 get
+    等待同一次加载。可选模型加载失败时 get 返回 None，必需模型则抛出原异常。
+    未登记的模型永远不会被加载。
+    """
+
+    def __init__(self, loader, max_workers=4):
+        self._loader = loader
+        self.max_workers = max(1, int(max_workers))
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, model_dir, required=False):
+        with self._lock:
+            self._entries[name] = _ModelEntry(name, model_dir, required)
+
+    def is_registered(self, name):
+        return name in self._entries
+
+    # ===== 加载 =====
+    def _claim(self, entry):
+        """取得加载权：返回 True 表示由调用方负责加载"""
+        with self._lock:
+            if entry.future is not None:
+                return False
+            entry.future = Future()
+            return True
+
+    def _load(self, entry):
+        entry.state = "loading"
+        entry.started_at = time.time()
+        started = time.perf_counter()
+        try:
+            model = self._loader(entry.name, entry.model_dir)
+        except Exception as e:
+            entry.load_s = time.perf_counter() - started
+            entry.state, entry.error = "error", str(e)
+            print(f"[models] {entry.name} failed to load after {entry.load_s:.1f}s: {e}")
+            entry.future.set_exception(e)
+            return
+        entry.load_s = time.perf_counter() - started
+        entry.model, entry.state = model, "ready"
+        print(f"[models] {entry.name} ready in {entry.load_s:.1f}s")
+        entry.future.set_result(model)
+
+    def start(self):
+        """后台并行加载所有尚未加载的模型，立即返回"""
+        with self._lock:
+            entries = list(self._entries.values())
+        todo = [e for e in entries if self._claim(e)]
+        if not todo:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo)), thread_name_prefix="model-load")
+        for entry in todo:
+            executor.submit(self._load, entry)
+        executor.shutdown(wait=False)
+
+    def get(self, name):
+        """取模型；尚未加载则在当前线程加载（或等待进行中的加载）。未登记或可选模型加载失败返回 None"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        if entry.state == "ready":
+            return entry.model
+        if self._claim(entry):
+            self._load(entry)
+        try:
+            return entry.future.result()
+        except Exception:
+            if entry.required:
+                raise
+            return None
+
+    def wait(self, timeout=None):
+        """等待所有已开始的加载结束，返回是否就绪"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for entry in list(self._entries.values()):
+            if entry.future is None:
+                continue
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                entry.future.exception(timeout=remaining)
+            except Exception:
+                break
+        return self.ready()
+
+    # ===== 状态 =====
+    def ready(self, lazy=False):
+        """必需模型全部加载完成（可选模型失败不影响就绪）。
+
+        lazy=True 用于懒加载模式：模型要等首个请求才加载，必需模型已登记且未加载失败即视为就绪，
+        否则按就绪状态放流量的编排系统永远不会发来第一个请求。
+        """
+        required = [e for e in self._entries.values() if e.required]
+        if lazy:
+            return bool(required) and all(e.state != "error" for e in required)
+        return all(e.state == "ready" for e in required)
+
+    def status(self):
+        return {
+            e.name: {
+                "state": e.state,
+                "required": e.required,
+                "model_dir": e.model_dir,
+                "load_s": round(e.load_s, 3) if e.load_s is not None else None,
+                "error": e.error,
+            }
+            for e in list(self._entries.values())
+        }
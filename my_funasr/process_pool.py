@@ -0,0 +1,334 @@
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from my_funasr.metrics import STAGE_SECONDS
+
+# 任务阶段名 -> funasr_stage_seconds 的 stage 标签（与线程模式下 stage_timer 的命名一致）
+_STAGE_LABELS = {"enhanced": "enhance", "diarization": "vad"}
+
+
+def _attach_shm(name):
+    """子进程挂载父进程创建的共享内存。spawn 出的子进程与父进程共用 resource_tracker，
+    重复登记无副作用；生命周期（unlink）始终由父进程负责"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class _TaskManagerProxy:
+    """worker 进程内的 TaskManager 替身：状态更新经事件队列回传父进程，payload 只保留在本地。
+
+    含波形数组的 merge_payload（如增强后的音频）不回传，避免跨进程序列化大数组。
+    """
+
+    def __init__(self, events, payload):
+        self._events = events
+        self._payload = payload
+
+    def update_task(self, task_id, **fields):
+        self._events.put(("update", task_id, fields))
+
+    def merge_payload(self, task_id, **fields):
+        self._payload.update(fields)
+        if not any(isinstance(v, np.ndarray) for v in fields.values()):
+            self._events.put(("merge", task_id, fields))
+
+    def get_payload(self, task_id):
+        return self._payload
+
+
+def _worker_main(index, pipeline_kwargs, torch_threads, jobs, events):
+    """worker 进程入口：限定线程数后构建独立的管线与模型副本，循环处理全流程任务"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    started = time.perf_counter()
+    try:
+        from my_funasr.funasr_pipeline import FunASRPipeline
+        pipeline = FunASRPipeline(**pipeline_kwargs)
+        pipeline.preload_models()
+        pipeline.models.wait()
+    except Exception as e:
+        events.put(("ready", index, os.getpid(), time.perf_counter() - started, str(e)))
+        return
+    events.put(("ready", index, os.getpid(), time.perf_counter() - started, None))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        task_id, shm_name, n_samples, sr, duration, key, elapsed_before = job
+        events.put(("start", index, task_id))
+        shm = None
+        try:
+            shm = _attach_shm(shm_name)
+            audio = np.ndarray((n_samples,), dtype=np.float32, buffer=shm.buf)
+            proxy = _TaskManagerProxy(events, {"audio_hash": key, "sr": sr, "duration": duration})
+            pipeline._run_decoded_sync(task_id, key, audio, sr, duration, proxy, elapsed_before=elapsed_before)
+        except Exception as e:
+            events.put(("update", task_id, {"status": "error", "error": str(e), "message": "worker error"}))
+        finally:
+            audio = proxy = None
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    # 仍有视图引用共享内存时只能等进程退出再释放映射；父进程照常 unlink
+                    pass
+            events.put(("finish", index, task_id))
+    pipeline.batch_scheduler.shutdown()
+
+
+class ProcessPoolRunner:
+    """多进程推理：每个 worker 进程持有一份模型，父进程负责解码与任务状态。
+
+    父进程把解码后的波形写入共享内存，只把共享内存名与元数据放进任务队列；
+    worker 的阶段进度与结果经事件队列回传，由监听线程写回 TaskManager。
+    run_full 在调用方线程中阻塞到任务结束，因此 JobScheduler 的 worker 数即并发上限。
+
+    超时：worker 开始处理任务后，超过 max(min_task_timeout_s, 音频时长 × task_timeout_factor)
+    仍未结束则杀掉该进程并重启，任务标记失败。进程意外退出后按指数退避重启，
+    连续 max_restarts 次未能加载完模型即标记为 error，不再重启；全部 worker 都为 error 时
+    在途任务立即失败。run_full 最多等待 max_queue_wait_s + 单任务超时，事件丢失时也不会永久阻塞。
+    """
+
+    def __init__(self, pipeline, pipeline_kwargs, task_manager, num_workers=2, torch_threads=None, worker_cache_bytes=0,
+                 task_timeout_factor=5.0, min_task_timeout_s=120.0, max_restarts=5, max_backoff_s=60.0, max_queue_wait_s=600.0):
+        self.pipeline = pipeline  # 父进程管线：只用于解码与波形缓存，不加载模型
+        self.task_manager = task_manager
+        self.num_workers = max(1, int(num_workers))
+        self.torch_threads = max(1, int(torch_threads or (os.cpu_count() or 1) // self.num_workers))
+        # worker 内的波形缓存默认关闭：解码结果在父进程缓存，且共享内存视图不能被缓存持有
+        self.pipeline_kwargs = dict(pipeline_kwargs, audio_cache_bytes=worker_cache_bytes)
+
+        self._ctx = mp.get_context("spawn")  # fork 与 torch 线程池不兼容
+        self._jobs = self._ctx.Queue()
+        self._events = self._ctx.Queue()
+        self._procs = [None] * self.num_workers
+        self._workers = [{"state": "stopped"} for _ in range(self.num_workers)]
+        self.task_timeout_factor = task_timeout_factor
+        self.min_task_timeout_s = min_task_timeout_s
+        self.max_restarts = max(1, int(max_restarts))
+        self.max_backoff_s = max_backoff_s
+        self.max_queue_wait_s = max_queue_wait_s
+        self._pending = {}  # task_id -> Future
+        self._timeouts = {}  # task_id -> 开始处理后允许的秒数
+        self._failures = [0] * self.num_workers  # 连续异常退出次数，加载完成后清零
+        self._lock = threading.Lock()
+        self._listener = None
+        self._closed = False
+
+    # ===== 生命周期 =====
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            for i in range(self.num_workers):
+                self._spawn_locked(i)
+            self._listener = threading.Thread(target=self._listen, name="process-pool-events", daemon=True)
+            self._listener.start()
+
+    def _spawn_locked(self, index):
+        proc = self._ctx.Process(target=_worker_main, name=f"asr-worker-{index}", daemon=True,
+                                 args=(index, self.pipeline_kwargs, self.torch_threads, self._jobs, self._events))
+        proc.start()
+        self._procs[index] = proc
+        self._workers[index] = {"state": "loading", "pid": proc.pid, "task_id": None, "deadline": None, "load_s": None, "error": None,
+                                "started_at": time.time(), "restarts": self._failures[index]}
+
+    def shutdown(self, timeout=5.0):
+        with self._lock:
+            self._closed = True
+            procs = [p for p in self._procs if p is not None]
+        for _ in procs:
+            self._jobs.put(None)
+        for p in procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+
+    # ===== 提交 =====
+    def run_full(self, task_id, audio_source):
+        """父进程解码 -> 写共享内存 -> 交给 worker 进程 -> 等待结束"""
+        tm = self.task_manager
+        started = time.perf_counter()
+        try:
+            key, audio, sr, duration = self.pipeline._load_task_audio(task_id, audio_source, tm)
+        except Exception as e:
+            tm.update_task(task_id, status="error", error=str(e), message="pipeline error")
+            self.pipeline._observe_task("error", time.perf_counter() - started, None)
+            return
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, audio.nbytes))
+        try:
+            np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+            future = Future()
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("process pool is shut down")
+                if all(w["state"] == "error" for w in self._workers):
+                    raise RuntimeError("no inference worker available: all workers failed to load models")
+                self._pending[task_id] = future
+                self._timeouts[task_id] = self.task_timeout(duration)
+            self._jobs.put((task_id, shm.name, len(audio), sr, duration, key, time.perf_counter() - started))
+            self._wait(task_id, future, duration)
+        except Exception as e:
+            tm.update_task(task_id, status="error", error=str(e), message="pipeline error")
+        finally:
+            with self._lock:
+                self._timeouts.pop(task_id, None)
+            shm.close()
+            shm.unlink()
+        task = tm.get_task(task_id) or {}
+        self.pipeline._observe_task(task.get("status", "error"), time.perf_counter() - started, duration)
+
+    def _wait(self, task_id, future, duration):
+        """等待任务结束；超过排队等待上限 + 单任务超时仍未结束（如 start/finish 事件丢失）时放弃"""
+        limit = self.max_queue_wait_s + self.task_timeout(duration)
+        try:
+            future.result(timeout=limit)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(task_id, None)
+            raise TimeoutError(f"inference task not finished within {limit:.0f}s")
+
+    def task_timeout(self, duration):
+        return max(self.min_task_timeout_s, (duration or 0.0) * self.task_timeout_factor)
+
+    # ===== 事件回传 =====
+    def _listen(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            try:
+                event = self._events.get(timeout=1.0)
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                return
+            if event is not None:
+                try:
+                    self._handle(event)
+                except Exception as e:
+                    print(f"[process-pool] failed to apply event {event[0]}: {e}")
+            if time.monotonic() - last_check >= 1.0:
+                last_check = time.monotonic()
+                self._check_workers()
+
+    def _handle(self, event):
+        kind = event[0]
+        if kind == "update":
+            _, task_id, fields = event
+            self.task_manager.update_task(task_id, **fields)
+            if fields.get("stage_elapsed") is not None and fields.get("stage_name"):
+                STAGE_SECONDS.observe(fields["stage_elapsed"], stage=_STAGE_LABELS.get(fields["stage_name"], fields["stage_name"]))
+        elif kind == "merge":
+            _, task_id, fields = event
+            self.task_manager.merge_payload(task_id, **fields)
+        elif kind == "ready":
+            _, index, pid, load_s, error = event
+            with self._lock:
+                self._workers[index].update(state="error" if error else "ready", pid=pid, load_s=round(load_s, 3), error=error)
+                if not error:
+                    self._failures[index] = 0
+            if error:
+                self._fail_pending_if_no_workers()
+            print(f"[process-pool] worker {index} (pid {pid}) " + (f"failed: {error}" if error else f"ready in {load_s:.1f}s"))
+        elif kind == "start":
+            _, index, task_id = event
+            with self._lock:
+                timeout = self._timeouts.get(task_id, self.min_task_timeout_s)
+                self._workers[index].update(task_id=task_id, deadline=time.monotonic() + timeout)
+        elif kind == "finish":
+            _, index, task_id = event
+            with self._lock:
+                self._workers[index].update(task_id=None, deadline=None)
+                future = self._pending.pop(task_id, None)
+            if future is not None:
+                future.set_result(True)
+
+    def _check_workers(self):
+        """巡检 worker：处理超时的进程被杀掉重启；意外退出的进程其在途任务标记失败，并按退避重启"""
+        now = time.monotonic()
+        hung = []
+        with self._lock:
+            if self._closed:
+                return
+            for i, proc in enumerate(self._procs):
+                worker = self._workers[i]
+                if proc is not None and proc.is_alive() and worker.get("deadline") is not None and now > worker["deadline"]:
+                    hung.append((i, proc, worker["task_id"]))
+        for i, proc, task_id in hung:
+            # 卡死（死锁、CUDA 调用不返回等）的进程不会自行退出，只能强制结束
+            print(f"[process-pool] worker {i} (pid {proc.pid}) exceeded the deadline for task {task_id}; killing")
+            proc.kill()
+            proc.join(5.0)
+            with self._lock:
+                future = self._pending.pop(task_id, None) if task_id else None
+                self._workers[i].update(task_id=None, deadline=None)
+            if future is not None:
+                future.set_exception(TimeoutError(f"inference worker timed out after {self._timeouts.get(task_id, self.min_task_timeout_s):.0f}s"))
+
+        with self._lock:
+            if self._closed:
+                return
+            for i, proc in enumerate(self._procs):
+                worker = self._workers[i]
+                if worker["state"] == "error":
+                    continue
+                if worker["state"] == "backoff":
+                    if now >= worker["restart_at"]:
+                        self._spawn_locked(i)
+                    continue
+                if proc is None or proc.is_alive():
+                    continue
+                task_id = worker.get("task_id")
+                future = self._pending.pop(task_id, None) if task_id else None
+                if future is not None:
+                    future.set_exception(RuntimeError(f"inference worker exited with code {proc.exitcode}"))
+                self._failures[i] += 1
+                if self._failures[i] >= self.max_restarts:
+                    # 连续多次未能加载完模型（导入失败、原生库崩溃等），不再重启
+                    print(f"[process-pool] worker {i} (pid {proc.pid}) exited with code {proc.exitcode}; giving up after {self._failures[i]} restarts")
+                    worker.update(state="error", task_id=None, deadline=None, error=f"exited with code {proc.exitcode} {self._failures[i]} times in a row")
+                    continue
+                delay = min(self.max_backoff_s, 2.0 ** (self._failures[i] - 1)) if self._failures[i] > 1 else 0.0
+                print(f"[process-pool] worker {i} (pid {proc.pid}) exited with code {proc.exitcode}; restarting in {delay:.0f}s")
+                if delay:
+                    worker.update(state="backoff", task_id=None, deadline=None, restart_at=now + delay)
+                else:
+                    self._spawn_locked(i)
+        self._fail_pending_if_no_workers()
+
+    def _fail_pending_if_no_workers(self):
+        """所有 worker 都已放弃（error）时，队列中的任务不会再被领取，让等待的 run_full 立即失败"""
+        with self._lock:
+            if not all(w["state"] == "error" for w in self._workers):
+                return
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("no inference worker available: all workers failed to load models"))
+
+    # ===== 状态 =====
+    def ready(self):
+        """至少一个 worker 已加载完模型"""
+        with self._lock:
+            return any(w["state"] == "ready" for w in self._workers)
+
+    def status(self):
+        with self._lock:
+            workers = [dict(w, alive=p is not None and p.is_alive()) for w, p in zip(self._workers, self._procs)]
+        return {"workers": workers, "torch_threads": self.torch_threads, "pending": len(self._pending)}
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def result_key(audio_hash, config):
+    """结果缓存键：音频内容哈希 + 影响识别结果的管线配置"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(audio_hash).encode("utf-8"))
+    h.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """识别结果缓存：内存 LRU + 可选的磁盘 JSON 文件，两层都有条目上限与 TTL。
+
+    内存未命中时查磁盘并回填内存，进程重启后磁盘上的结果仍可复用。
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400.0, cache_dir=None, max_disk_entries=10000):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir or None
+        self.max_disk_entries = max(1, int(max_disk_entries))
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "expired": 0}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _expired(self, stored_at, now):
+        return bool(self.ttl_seconds) and now - stored_at > self.ttl_seconds
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+                self._stats["expired"] += 1
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            self._put_memory_locked(key, entry[0], entry[1])
+            return entry[1]
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock:
+            self._put_memory_locked(key, now, result)
+            self._stats["stores"] += 1
+        self._write_disk(key, now, result)
+
+    def _put_memory_locked(self, key, stored_at, result):
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ===== 磁盘层 =====
+    def _read_disk(self, key, now):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(data.get("stored_at", 0), now):
+            self._remove(path)
+            with self._lock:
+                self._stats["expired"] += 1
+            return None
+        return data.get("stored_at", now), data.get("result")
+
+    def _write_disk(self, key, stored_at, result):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": stored_at, "result": result}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[result_cache] write {key} failed: {e}")
+            self._remove(tmp)
+            return
+        with self._disk_lock:
+            self._disk_writes += 1
+            # 每写入一定数量后整理一次，避免每次写入都扫描目录
+            prune = self._disk_writes % max(1, self.max_disk_entries // 10) == 0
+        if prune:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """删除过期文件，并按修改时间淘汰超出 max_disk_entries 的最旧条目"""
+        if not self.cache_dir:
+            return 0
+        now = time.time()
+        files = []
+        with self._disk_lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+            files.sort()
+            removed = 0
+            for i, (mtime, path) in enumerate(files):
+                if (self.ttl_seconds and now - mtime > self.ttl_seconds) or len(files) - i > self.max_disk_entries:
+                    self._remove(path)
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl_seconds": self.ttl_seconds,
+                    "disk": bool(self.cache_dir), **self._stats}
@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# 阶段顺序；enhance / segment / diarization / asr 各自对应一个模型，decode 与 combine 不占模型
+STAGES = ("decode", "enhance", "segment", "diarization", "asr", "combine")
+DEFAULT_STAGE_WORKERS = {"decode": 2, "enhance": 1, "segment": 1, "diarization": 1, "asr": 4, "combine": 1}
+
+
+def parse_stage_workers(spec):
+    """解析 "decode=2,asr=4" 形式的各阶段 worker 数，未写的阶段用默认值"""
+    workers = dict(DEFAULT_STAGE_WORKERS)
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in workers:
+            raise ValueError(f"unknown stage: {name}")
+        workers[name] = max(1, int(value))
+    return workers
+
+
+class _StageJob:
+    __slots__ = ("task_id", "source", "started", "future", "key", "audio", "sr", "duration", "audio_source",
+                 "segments", "spk_segments", "pending", "texts", "asr_elapsed", "failed")
+
+    def __init__(self, task_id, source):
+        self.task_id = task_id
+        self.source = source
+        self.started = time.perf_counter()
+        self.future = Future()
+        self.key = self.audio = self.sr = self.duration = None
+        self.audio_source = "raw"  # raw / enhanced，决定分段缓存键
+        self.segments = None
+        self.spk_segments = None
+        self.pending = 0  # 尚未完成的并行分支数（VAD 与说话人分离）
+        self.texts = None
+        self.asr_elapsed = None
+        self.failed = False
+
+
+class StagePipeline:
+    """按阶段流水线执行全流程任务：每个阶段一组 worker 线程，阶段之间用有界队列衔接。
+
+    不同任务在不同模型上重叠执行（如 A 在做 ASR 时 B 在做增强）；同一任务内
+    VAD 与说话人分离都只依赖增强后的音频，两者并行，全部完成后再进入 ASR。
+    下游队列满时上游 worker 阻塞在 put 上，形成反压。阶段实现复用 FunASRPipeline
+    的各步方法，任务状态与结果与线程模式一致。run_full 阻塞到任务结束，
+    因此 JobScheduler 的 worker 数即流水线中同时在途的任务数。
+    """
+
+    def __init__(self, pipeline, task_manager, workers=None, queue_size=8):
+        self.pipeline = pipeline
+        self.task_manager = task_manager
+        self.workers = {**DEFAULT_STAGE_WORKERS, **(workers or {})}
+        self.queue_size = max(1, int(queue_size))
+        self._queues = {name: queue.Queue(maxsize=self.queue_size) for name in STAGES}
+        self._handlers = {name: getattr(self, f"_{name}") for name in STAGES}
+        self._busy = {name: 0 for name in STAGES}
+        self._processed = {name: 0 for name in STAGES}
+        self._seconds = {name: 0.0 for name in STAGES}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+
+    # ===== 生命周期 =====
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for name in STAGES:
+                for i in range(self.workers[name]):
+                    t = threading.Thread(target=self._worker_loop, args=(name,), name=f"stage-{name}-{i}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        for name in STAGES:
+            for _ in range(self.workers[name]):
+                try:
+                    self._queues[name].put_nowait(None)
+                except queue.Full:
+                    pass
+        return threads
+
+    # ===== 提交 =====
+    def submit(self, task_id, audio_source):
+        """放入 decode 队列，返回任务结束时完成的 Future；队列满时阻塞"""
+        if self._closed:
+            raise RuntimeError("stage pipeline is shut down")
+        self.start()
+        job = _StageJob(task_id, audio_source)
+        self._queues["decode"].put(job)
+        return job.future
+
+    def run_full(self, task_id, audio_source):
+        self.submit(task_id, audio_source).result()
+
+    # ===== worker =====
+    def _worker_loop(self, name):
+        q = self._queues[name]
+        while True:
+            job = q.get()
+            if job is None:
+                return
+            if job.failed:
+                continue
+            with self._lock:
+                self._busy[name] += 1
+            started = time.perf_counter()
+            try:
+                self._handlers[name](job)
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                with self._lock:
+                    self._busy[name] -= 1
+                    self._processed[name] += 1
+                    self._seconds[name] += time.perf_counter() - started
+
+    def _fail(self, job, error):
+        with self._lock:
+            if job.failed:
+                return
+            job.failed = True
+        self.task_manager.update_task(job.task_id, status="error", error=str(error), message="pipeline error")
+        self.pipeline._observe_task("error", time.perf_counter() - job.started, job.duration)
+        job.audio = None
+        job.future.set_result(False)
+
+    # ===== 各阶段 =====
+    def _decode(self, job):
+        job.key, job.audio, job.sr, job.duration = self.pipeline._load_task_audio(job.task_id, job.source, self.task_manager)
+        if self.pipeline.enhance_model:
+            self._queues["enhance"].put(job)
+        else:
+            self._fork(job)
+
+    def _enhance(self, job):
+        job.audio, job.audio_source = self.pipeline._enhance_step(job.task_id, job.key, job.audio, job.sr, job.duration, self.task_manager)
+        self._fork(job)
+
+    def _fork(self, job):
+        """VAD 与说话人分离互不依赖：启用分离时同时放入两个队列"""
+        pipeline = self.pipeline
+        diarize = pipeline.use_diarization and pipeline.models.is_registered("spk")
+        job.pending = 2 if diarize else 1
+        self._queues["segment"].put(job)
+        if diarize:
+            self._queues["diarization"].put(job)
+
+    def _refresh_audio(self, job):
+        """阶段之间换用任务表中已落盘的 memmap（超出内存预算时），排队等待期间不再占用常驻内存"""
+        job.audio = self.pipeline._stage_audio(job.task_id, job.audio, job.audio_source, self.task_manager)
+
+    def _segment(self, job):
+        self._refresh_audio(job)
+        job.segments = self.pipeline._vad_step(job.task_id, job.key, job.audio, job.sr, job.duration, job.audio_source, self.task_manager)
+        self._join(job)
+
+    def _diarization(self, job):
+        if self.pipeline.spk_model is not None:
+            self._refresh_audio(job)
+            job.spk_segments = self.pipeline._diarization_step(job.task_id, job.audio, job.sr, self.task_manager)
+        self._join(job)
+
+    def _join(self, job):
+        """并行分支汇合：最后完成的分支负责合并分段并交给 ASR"""
+        with self._lock:
+            job.pending -= 1
+            if job.pending > 0 or job.failed:
+                return
+        job.segments = self.pipeline._apply_diarization(job.task_id, job.segments, job.spk_segments, job.audio, job.sr, self.task_manager)
+        self._queues["asr"].put(job)
+
+    def _asr(self, job):
+        self._refresh_audio(job)
+        job.texts, job.asr_elapsed = self.pipeline._asr_step(job.task_id, job.audio, job.sr, job.segments, self.task_manager)
+        job.audio = None
+        self._queues["combine"].put(job)
+
+    def _combine(self, job):
+        self.pipeline._finish_task(job.task_id, job.segments, job.texts, job.duration, self.task_manager, job.started, job.asr_elapsed)
+        job.future.set_result(True)
+
+    # ===== 状态 =====
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_size": self.queue_size,
+                "stages": {
+                    name: {
+                        "workers": self.workers[name],
+                        "queued": self._queues[name].qsize(),
+                        "busy": self._busy[name],
+                        "processed": self._processed[name],
+                        "busy_s": round(self._seconds[name], 3),
+                    }
+                    for name in STAGES
+                },
+            }
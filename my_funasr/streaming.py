@@ -0,0 +1,371 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+from my_funasr.text_postprocess import combine_segments
+
+
+class StreamingSegmenter:
+    """流式增量分段：环形缓冲保存最近 ring_seconds 秒音频，逐帧能量判决。
+
+    push() 写入新样本并返回本次闭合的分段 [{"index", "start", "end", "audio"}]，
+    时间均为自流开始的秒数。静音持续 min_silence_ms 或分段达到 max_segment_s
+    时闭合分段。
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, ring_seconds=60.0, max_segment_s=15.0, min_silence_ms=500,
+                 min_speech_ms=200, pad_ms=100, margin_db=10.0, min_energy_db=-50.0, noise_window_s=5.0):
+        self.sr = sample_rate
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.capacity = int(ring_seconds * sample_rate)
+        # 保证最长分段 + 前后补偿始终留在环形缓冲内
+        self.max_segment = min(int(max_segment_s * sample_rate), self.capacity // 2)
+        self.min_silence_frames = max(1, int(round(min_silence_ms / frame_ms)))
+        self.min_speech = int(min_speech_ms * sample_rate / 1000)
+        self.pad = int(pad_ms * sample_rate / 1000)
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+
+        self.ring = np.zeros(self.capacity, dtype=np.float32)
+        self.total = 0          # 已写入的样本总数（绝对位置）
+        self.frame_pos = 0      # 下一帧的起始绝对位置
+        # 噪声底：最近 noise_window_s 秒帧能量的最小值（最小值统计，语音持续时也能跟踪）
+        self._recent_energy = deque(maxlen=max(1, int(noise_window_s * 1000 / frame_ms)))
+        self.in_speech = False
+        self.seg_start = 0
+        self.last_speech_end = 0
+        self.silence_frames = 0
+        self.emitted_end = 0
+        self.index = 0
+
+    # ===== 环形缓冲 =====
+    def _write(self, samples):
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            self.total += n - self.capacity
+            n = self.capacity
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        self.ring[pos:pos + first] = samples[:first]
+        if first < n:
+            self.ring[:n - first] = samples[first:]
+        self.total += n
+
+    def read(self, start, end):
+        """按绝对样本位置读取 [start, end)，超出缓冲范围的部分被截掉"""
+        start = max(start, self.total - self.capacity, 0)
+        end = min(end, self.total)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        a, b = start % self.capacity, end % self.capacity
+        if a < b:
+            return self.ring[a:b].copy()
+        return np.concatenate((self.ring[a:], self.ring[:b]))
+
+    # ===== 分段 =====
+    def push(self, samples):
+        # 大块输入（如整段文件一次发来）按半个缓冲切片逐片处理，保证待判决的帧始终留在环形缓冲内
+        samples = np.asarray(samples, dtype=np.float32)
+        step = max(self.frame, self.capacity // 2)
+        closed = []
+        for i in range(0, len(samples), step):
+            self._write(samples[i:i + step])
+            self._process_frames(closed)
+        return closed
+
+    def _process_frames(self, closed):
+        n_frames = (self.total - self.frame_pos) // self.frame
+        if n_frames <= 0:
+            return
+        block = self.read(self.frame_pos, self.frame_pos + n_frames * self.frame).reshape(n_frames, self.frame)
+        energies = 10.0 * np.log10(np.einsum("ij,ij->i", block, block) / self.frame + 1e-12)
+        for e in energies:
+            self._step(float(e), closed)
+            self.frame_pos += self.frame
+
+    def _step(self, energy_db, closed):
+        self._recent_energy.append(energy_db)
+        threshold = max(min(self._recent_energy) + self.margin_db, self.min_energy_db)
+        frame_end = self.frame_pos + self.frame
+        is_speech = energy_db > threshold
+
+        if is_speech:
+            if not self.in_speech:
+                self.in_speech = True
+                self.seg_start = max(self.frame_pos - self.pad, self.emitted_end, self.total - self.capacity)
+            self.last_speech_end = frame_end
+            self.silence_frames = 0
+        elif self.in_speech:
+            self.silence_frames += 1
+            if self.silence_frames >= self.min_silence_frames:
+                self._close(min(self.last_speech_end + self.pad, frame_end), closed)
+                return
+        if self.in_speech and frame_end - self.seg_start >= self.max_segment:
+            # 超长分段强制切开，后续语音接着成为新分段
+            self._close(frame_end, closed)
+            self.in_speech = True
+            self.seg_start = frame_end
+            self.last_speech_end = frame_end
+
+    def _close(self, end, closed):
+        self.in_speech = False
+        self.silence_frames = 0
+        if end - self.seg_start >= self.min_speech:
+            closed.append({
+                "index": self.index,
+                "start": self.seg_start / self.sr,
+                "end": end / self.sr,
+                "audio": self.read(self.seg_start, end),
+            })
+            self.index += 1
+        self.emitted_end = end
+
+    def open_segment(self):
+        """当前未闭合分段 (index, start_s, end_s, audio)，无语音时返回 None"""
+        if not self.in_speech:
+            return None
+        return self.index, self.seg_start / self.sr, self.frame_pos / self.sr, self.read(self.seg_start, self.frame_pos)
+
+    def flush(self):
+        """流结束：闭合仍在进行的分段"""
+        closed = []
+        if self.in_speech:
+            self._close(min(self.last_speech_end + self.pad, self.total), closed)
+        return closed
+
+
+class StreamingStats:
+    """所有流式连接的聚合统计（仅在事件循环中更新）"""
+
+    def __init__(self, window=2048):
+        self.active = 0
+        self.sessions = 0
+        self.rejected = 0
+        self.audio_seconds = 0.0
+        self.finals = 0
+        self.partials = 0
+        self.skipped_partials = 0
+        self.latencies_ms = deque(maxlen=window)
+
+    def snapshot(self):
+        lat = sorted(self.latencies_ms)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(p * len(lat)))] if lat else 0.0
+
+        return {
+            "active": self.active,
+            "sessions": self.sessions,
+            "rejected": self.rejected,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "finals": self.finals,
+            "partials": self.partials,
+            "skipped_partials": self.skipped_partials,
+            "latency_ms": {
+                "avg": (sum(lat) / len(lat)) if lat else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "max": lat[-1] if lat else 0.0,
+            },
+        }
+
+
+class StreamingSession:
+    """单个 WebSocket 连接的流式识别会话。
+
+    协议：客户端发送 16kHz 单声道 PCM 二进制帧（int16 小端或 float32），
+    发送文本 {"type": "end"} 表示结束。服务端返回 JSON：
+      {"type": "partial", "segment": i, "start", "end", "text"}
+      {"type": "final", "segment": i, "start", "end", "text", "latency_ms"}
+      {"type": "done", "text", "segments", "latency_ms"}
+    latency_ms 为分段最后一段音频到达服务端至最终文本发出的耗时。
+
+    背压：收到的帧进入有界队列，队列满时停止读取套接字；未完成识别的分段
+    超过 max_inflight 时暂停分段处理；partial 结果在识别繁忙时直接跳过。
+    """
+
+    def __init__(self, websocket, batch_scheduler, stats=None, sample_rate=16000, dtype="int16", partial_interval_s=1.0,
+                 min_partial_s=0.5, max_pending_chunks=64, max_inflight=4, **segmenter_kwargs):
+        self.ws = websocket
+        self.scheduler = batch_scheduler
+        self.stats = stats or StreamingStats()
+        self.sr = sample_rate
+        self.dtype = np.dtype("<i2") if dtype == "int16" else np.dtype("<f4")
+        self.partial_interval_s = partial_interval_s
+        self.min_partial_s = min_partial_s
+        self.segmenter = StreamingSegmenter(sample_rate=sample_rate, **segmenter_kwargs)
+
+        self._inbox = asyncio.Queue(maxsize=max_pending_chunks)
+        self._finals = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._arrivals = deque()  # (绝对样本结束位置, 到达时间)
+        self._received = 0
+        self._partial_task = None
+        self._last_partial = 0.0
+        self._results = []
+        self._latencies = []
+
+    async def run(self):
+        self.stats.active += 1
+        self.stats.sessions += 1
+        tasks = [
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._process_loop()),
+            asyncio.create_task(self._finalize_loop()),
+        ]
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            # 发送循环收到结束标记（done 已发送）或连接断开时结束
+            await sender
+        finally:
+            for t in tasks + [self._partial_task]:
+                if t is not None and not t.done():
+                    t.cancel()
+            self.stats.active -= 1
+
+    # ===== 接收 =====
+    async def _receive_loop(self):
+        try:
+            while True:
+                msg = await self.ws.receive()
+                if msg.get("type") == "websocket.disconnect":
+                    break
+                if msg.get("bytes"):
+                    data = msg["bytes"]
+                    usable = len(data) - len(data) % self.dtype.itemsize
+                    samples = np.frombuffer(data[:usable], dtype=self.dtype)
+                    samples = samples.astype(np.float32) / 32768.0 if self.dtype.kind == "i" else samples.astype(np.float32)
+                    # 队列满时在此等待，不再读取套接字，形成端到端背压
+                    await self._inbox.put((samples, time.monotonic()))
+                elif msg.get("text"):
+                    try:
+                        ctrl = json.loads(msg["text"])
+                    except ValueError:
+                        ctrl = {"type": msg["text"].strip()}
+                    if ctrl.get("type") in ("end", "eof"):
+                        break
+        except Exception:
+            # 连接异常断开，按流结束处理
+            pass
+        finally:
+            await self._inbox.put(None)
+
+    # ===== 分段 =====
+    async def _process_loop(self):
+        try:
+            while True:
+                item = await self._inbox.get()
+                if item is None:
+                    for seg in self.segmenter.flush():
+                        await self._submit_final(seg)
+                    return
+                samples, arrived = item
+                self._received += len(samples)
+                self._arrivals.append((self._received, arrived))
+                self.stats.audio_seconds += len(samples) / self.sr
+                for seg in self.segmenter.push(samples):
+                    await self._submit_final(seg)
+                self._maybe_partial()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 分段出错：通知客户端，已提交的分段照常返回结果并以 done 结束，连接不会挂起
+            print(f"[stream] processing failed: {e}")
+            self._outbox.put_nowait({"type": "error", "error": str(e)})
+        finally:
+            self._finals.put_nowait(None)
+
+    def _arrival_time(self, end_sample):
+        """分段结束样本所在数据块的到达时间"""
+        while len(self._arrivals) > 1 and self._arrivals[0][0] < end_sample:
+            self._arrivals.popleft()
+        return self._arrivals[0][1] if self._arrivals else time.monotonic()
+
+    async def _submit_final(self, seg):
+        # 在途分段过多时暂停处理，inbox 随之积压并反压到接收端
+        await self._inflight.acquire()
+        try:
+            seg["arrived"] = self._arrival_time(int(round(seg["end"] * self.sr)))
+            fut = asyncio.wrap_future(self.scheduler.submit(seg.pop("audio"), sample_rate=self.sr, task_id="stream", index=seg["index"]))
+            await self._finals.put((seg, fut))
+        except BaseException:
+            # 未交给 finalize 循环的分段不会再释放名额，这里归还，避免提交失败后逐渐卡死
+            self._inflight.release()
+            raise
+
+    def _maybe_partial(self):
+        now = time.monotonic()
+        if now - self._last_partial < self.partial_interval_s:
+            return
+        current = self.segmenter.open_segment()
+        if current is None or current[2] - current[1] < self.min_partial_s:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            # 上一个 partial 仍在识别，跳过本次，避免抢占最终结果的算力
+            self.stats.skipped_partials += 1
+            return
+        self._last_partial = now
+        self._partial_task = asyncio.create_task(self._partial(*current))
+
+    async def _partial(self, index, start, end, audio):
+        try:
+            text = await asyncio.wrap_future(self.scheduler.submit(audio, sample_rate=self.sr, task_id="stream-partial", index=index))
+        except Exception:
+            return
+        # 分段已闭合则丢弃过期的 partial
+        if self.segmenter.index == index and self.segmenter.in_speech:
+            self.stats.partials += 1
+            await self._outbox.put({"type": "partial", "segment": index, "start": round(start, 3), "end": round(end, 3), "text": text})
+
+    # ===== 结果 =====
+    async def _finalize_loop(self):
+        while True:
+            item = await self._finals.get()
+            if item is None:
+                break
+            seg, fut = item
+            try:
+                text = await fut
+                error = None
+            except Exception as e:
+                text, error = "", str(e)
+            finally:
+                self._inflight.release()
+            latency_ms = (time.monotonic() - seg["arrived"]) * 1000.0
+            result = {"start": round(seg["start"], 3), "end": round(seg["end"], 3), "text": text}
+            self._results.append(result)
+            self._latencies.append(latency_ms)
+            self.stats.finals += 1
+            self.stats.latencies_ms.append(latency_ms)
+            msg = {"type": "final", "segment": seg["index"], **result, "latency_ms": round(latency_ms, 1)}
+            if error:
+                msg["error"] = error
+            await self._outbox.put(msg)
+        lat = sorted(self._latencies)
+        await self._outbox.put({
+            "type": "done",
+            "text": combine_segments(self._results),
+            "segments": self._results,
+            "latency_ms": {
+                "avg": round(sum(lat) / len(lat), 1) if lat else 0.0,
+                "p95": round(lat[min(len(lat) - 1, int(0.95 * len(lat)))], 1) if lat else 0.0,
+                "max": round(lat[-1], 1) if lat else 0.0,
+            },
+        })
+        await self._outbox.put(None)
+
+    async def _send_loop(self):
+        while True:
+            msg = await self._outbox.get()
+            if msg is None:
+                return
+            try:
+                await self.ws.send_json(msg)
+            except Exception:
+                # 客户端已断开
+                return
@@ -1,3 +1,6 @@
+import re
+from difflib import SequenceMatcher
+
 def combine(results):
     full_text = ""
     segments = []
@@ -14,13 +17,49 @@ def combine(results):
         t += dur
     return full_text.strip(), segments
 
+# SenseVoice 输出开头的语种/情感/事件标签，如 <|zh|><|NEUTRAL|><|Speech|><|woitn|>
+_TAG_PREFIX = re.compile(r"^(?:<\|[^|]*\|>)+")
+
+# 重叠区每秒最多对应的字符数（中英文混合取偏大值），用于限定去重搜索范围
+OVERLAP_CHARS_PER_SECOND = 20
+
+def merge_overlap(prev_text, next_text, max_overlap_chars=40, min_match=2):
+    """相邻分段时间上重叠时，去掉后一段开头与前一段结尾重复识别的文字。
+
+    先找 prev 后缀 == next 前缀 的最长精确匹配；两边识别略有出入时，退化为
+    在 prev 尾部与 next 头部之间找最长公共片段，以该片段为拼接点。
+    返回 (prev_kept, next_kept)，next_kept 保留原有的标签前缀。
+    """
+    tags = _TAG_PREFIX.match(next_text)
+    tags = tags.group(0) if tags else ""
+    body = next_text[len(tags):]
+    limit = min(len(prev_text), len(body), max_overlap_chars)
+    for k in range(limit, min_match - 1, -1):
+        if prev_text.endswith(body[:k]):
+            return prev_text, tags + body[k:]
+    tail = prev_text[-max_overlap_chars:]
+    head = body[:max_overlap_chars]
+    match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+    if match.size >= max(min_match, 3):
+        cut = len(prev_text) - len(tail) + match.a + match.size
+        return prev_text[:cut], tags + body[match.b + match.size:]
+    return prev_text, next_text
+
 # 新增：兼容 FunASR 管线的分段合并
 # 输入: results = [{"speaker": str, "start": float, "end": float, "text": str}, ...]
-# 输出: 合并后的整段文本字符串
+# 输出: 合并后的整段文本字符串；时间上重叠的相邻分段（长音频切块）会去掉重复文字
 def combine_segments(results):
     texts = []
+    prev = None
     for r in results:
         # 可选：在文本前标注说话人，例如 f"[{r['speaker']}] {r['text']}"
         # 当前为简洁输出，仅拼接文字
-        texts.append(r.get("text", ""))
+        text = r.get("text", "")
+        if prev is not None and texts and r.get("start") is not None and prev.get("end") is not None:
+            overlap = float(prev["end"]) - float(r["start"])
+            if overlap > 0:
+                max_chars = max(8, int(overlap * OVERLAP_CHARS_PER_SECOND))
+                texts[-1], text = merge_overlap(texts[-1], text, max_overlap_chars=max_chars)
+        texts.append(text)
+        prev = r
     return "".join(texts).strip()
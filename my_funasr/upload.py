@@ -0,0 +1,269 @@
+import io
+import os
+import tempfile
+import zipfile
+
+from my_funasr.audio_cache import new_audio_hasher
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+# 批量上传：zip 内按扩展名识别音频文件
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac")
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class UploadTooLargeError(Exception):
+    """上传超过允许的最大字节数"""
+
+    def __init__(self, limit):
+        super().__init__(f"upload exceeds {limit} bytes")
+        self.limit = limit
+
+
+class TooManyFilesError(Exception):
+    """批量上传的文件数超过上限"""
+
+    def __init__(self, limit):
+        super().__init__(f"batch exceeds {limit} files")
+        self.limit = limit
+
+
+class _Spool:
+    """边写边哈希的上传缓冲：不超过 memory_limit 时留在内存，超过后整体溢写到 spool_dir 下的临时文件"""
+
+    def __init__(self, max_bytes=None, spool_dir=None, memory_limit=4 << 20):
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self.memory_limit = memory_limit
+        self.hasher = new_audio_hasher()
+        self.chunks = []
+        self.size = 0
+        self.spooled = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        self.hasher.update(chunk)
+        if self.spooled is None and self.size > self.memory_limit:
+            if self.spool_dir:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            self.spooled = tempfile.NamedTemporaryFile(prefix="upload-", suffix=".audio", dir=self.spool_dir, delete=False)
+            for buffered in self.chunks:
+                self.spooled.write(buffered)
+            self.chunks = []
+        if self.spooled is not None:
+            self.spooled.write(chunk)
+        else:
+            self.chunks.append(chunk)
+
+    def abort(self):
+        if self.spooled is not None:
+            self.spooled.close()
+            os.remove(self.spooled.name)
+            self.spooled = None
+
+    def payload(self):
+        payload = {"audio_hash": self.hasher.hexdigest(), "upload_size": self.size}
+        if self.spooled is not None:
+            self.spooled.close()
+            payload["audio_path"] = self.spooled.name
+        else:
+            payload["audio_bytes"] = b"".join(self.chunks)
+        return payload
+
+
+class InvalidUploadError(Exception):
+    """请求体不是合法的 multipart/form-data"""
+
+
+class UploadedPart:
+    """multipart 中的一个文件字段；payload 为落入内存或临时文件后的任务负载"""
+
+    __slots__ = ("field", "filename", "content_type", "payload")
+
+    def __init__(self, field, filename, content_type, payload):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.payload = payload
+
+
+class _MultipartSpooler:
+    """multipart 解析回调：文件字段直接写入 _Spool，表单字段收集为字符串"""
+
+    def __init__(self, file_limit, spool_dir, memory_limit, max_files, max_field_bytes):
+        self.file_limit = file_limit
+        self.spool_dir = spool_dir
+        self.memory_limit = memory_limit
+        self.max_files = max_files
+        self.max_field_bytes = max_field_bytes
+        self.fields = {}
+        self.files = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part = None  # 当前字段的 UploadedPart（payload 在字段结束时填入）
+        self._spool = None
+        self._value = None
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header("_header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header("_header_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _append_header(self, attr, data):
+        setattr(self, attr, getattr(self, attr) + data)
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = self._spool = self._value = None
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        if filename is None:
+            self._value = bytearray()
+            self._part = UploadedPart(name, None, None, None)
+            return
+        if self.max_files is not None and len(self.files) >= self.max_files:
+            raise TooManyFilesError(self.max_files)
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        self._part = UploadedPart(name, filename.decode("utf-8", "replace"), content_type, None)
+        self._spool = _Spool(self.file_limit(self._part), self.spool_dir, self.memory_limit)
+
+    def _on_part_data(self, data, start, end):
+        if self._spool is not None:
+            self._spool.write(bytes(data[start:end]))
+        elif self._value is not None:
+            self._value += data[start:end]
+            if len(self._value) > self.max_field_bytes:
+                raise InvalidUploadError(f"form field {self._part.field!r} exceeds {self.max_field_bytes} bytes")
+
+    def _on_part_end(self):
+        part = self._part
+        if self._spool is not None:
+            part.payload = self._spool.payload()
+            self.files.append(part)
+        else:
+            self.fields[part.field] = self._value.decode("utf-8", "replace")
+        self._part = self._spool = self._value = None
+
+    def abort(self):
+        if self._spool is not None:
+            self._spool.abort()
+        for part in self.files:
+            discard_payload(part.payload)
+
+
+async def spool_multipart(headers, stream, max_file_bytes=None, max_body_bytes=None, spool_dir=None, memory_limit=4 << 20,
+                          max_files=None, max_field_bytes=64 << 10):
+    """直接解析 multipart/form-data 请求体流，文件字段边收边写入内存或 spool_dir 下的临时文件。
+
+    不经过框架的表单解析：每个上传只落盘一次，大小上限在接收过程中检查（分块传输、
+    没有 Content-Length 的请求同样受限），超限时立即停止读取。max_file_bytes 为单个文件上限，
+    也可以是 UploadedPart（payload 尚为 None）-> 上限 的函数；max_body_bytes 限制整个请求体。
+    返回 (表单字段 dict, [UploadedPart, ...])；失败时已落盘的临时文件全部删除。
+    """
+    content_type, options = parse_options_header(headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUploadError("expected multipart/form-data with a boundary")
+    file_limit = max_file_bytes if callable(max_file_bytes) else (lambda part: max_file_bytes)
+    spooler = _MultipartSpooler(file_limit, spool_dir, memory_limit, max_files, max_field_bytes)
+    parser = MultipartParser(boundary, spooler.callbacks())
+    received = 0
+    try:
+        async for chunk in stream:
+            received += len(chunk)
+            if max_body_bytes and received > max_body_bytes:
+                raise UploadTooLargeError(max_body_bytes)
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError as e:
+        spooler.abort()
+        raise InvalidUploadError(str(e)) from e
+    except BaseException:
+        spooler.abort()
+        raise
+    if spooler._part is not None:
+        spooler.abort()
+        raise InvalidUploadError("truncated multipart body")
+    return spooler.fields, spooler.files
+
+
+def is_zip_upload(file):
+    name = (getattr(file, "filename", None) or "").lower()
+    return name.endswith(".zip") or getattr(file, "content_type", None) in ZIP_CONTENT_TYPES
+
+
+def extract_zip(source, max_member_bytes=None, spool_dir=None, memory_limit=4 << 20, max_members=1000, chunk_size=UPLOAD_CHUNK_SIZE,
+                max_total_bytes=None, extracted_bytes=0):
+    """逐个解压 zip 中的音频文件（按扩展名过滤），返回 [(文件名, payload), ...]。
+
+    每个成员按与上传相同的策略流式落入内存或临时文件，并在解压过程中检查大小上限，
+    不信任 zip 目录里声明的大小。max_total_bytes 限制解压出的总字节数（从 extracted_bytes
+    起算，便于同一请求内多个 zip 共用额度），防止高压缩比的 zip 炸弹写满磁盘。
+    任一成员失败时已生成的临时文件全部删除。
+    """
+    archive = source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    members = []
+    total = extracted_bytes
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                base = os.path.basename(name)
+                if info.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX/"):
+                    continue
+                if os.path.splitext(base)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+                if len(members) >= max_members:
+                    raise TooManyFilesError(max_members)
+                spool = _Spool(max_member_bytes, spool_dir, memory_limit)
+                try:
+                    with zf.open(info) as f:
+                        while True:
+                            chunk = f.read(chunk_size)
+                            if not chunk:
+                                break
+                            total += len(chunk)
+                            if max_total_bytes and total > max_total_bytes:
+                                raise UploadTooLargeError(max_total_bytes)
+                            spool.write(chunk)
+                except BaseException:
+                    spool.abort()
+                    raise
+                members.append((name, spool.payload()))
+    except BaseException:
+        for _, payload in members:
+            discard_payload(payload)
+        raise
+    return members
+
+
+def discard_payload(payload):
+    """删除 payload 落盘的临时文件（未交给 TaskManager 的上传）"""
+    path = (payload or {}).get("audio_path")
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,60 +1,266 @@
+import asyncio
+import os
 import threading
+import time
+
+import numpy as np
+
+# 任务结束后保留的 payload 轻量字段；其余（原始字节、波形）视为重负载
+LIGHT_PAYLOAD_FIELDS = ("audio_hash", "sr", "duration", "enhanced", "upload_size", "result_key")
+# payload 中由任务独占的磁盘文件（上传落盘），随负载释放一起删除
+OWNED_FILE_FIELDS = ("audio_path",)
+FINISHED_STATUSES = ("done", "error")
+# 客户端可见字段：记录每个字段最后一次变化时的任务版本号，用于增量推送
+PUBLIC_FIELDS = ("status", "progress", "message", "error", "result")
+
+
+def _payload_nbytes(value):
+    """payload 字段占用的常驻内存字节数；memmap 由页缓存管理，不计入"""
+    if isinstance(value, np.memmap):
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+def _payload_total(payload):
+    return sum(_payload_nbytes(v) for v in (payload or {}).values())
+
+
+def new_task(status="pending", payload=None, cache_hit=False, now=None):
+    """新任务字典（内存与持久化任务表共用同一结构）"""
+    now = time.time() if now is None else now
+    return {
+        "status": status,
+        "result": None,
+        "progress": 0.0,
+        "error": None,
+        "message": None,
+        "payload": payload,  # e.g., {"audio_bytes": ..., "audio": ndarray, "sr": 16000, "duration": 12.3}
+        "stages": {},        # per-stage results/status, e.g., {"enhanced": {...}, "vad": {...}}
+        "cache_hit": cache_hit,  # 结果直接取自结果缓存
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None,
+        "version": 1,
+        "field_versions": {name: 1 for name in PUBLIC_FIELDS},
+        "stage_versions": {},
+    }
+
+
+def apply_update(task, now, status=None, result=None, progress=None, error=None, message=None, stage_name=None, stage_result=None, stage_status=None, stage_elapsed=None):
+    """把一次 update_task 应用到任务字典上；返回 (是否有客户端可见变化, 是否进入结束态)"""
+    task["updated_at"] = now
+    changed = []
+    finished = False
+    if status is not None:
+        if status != task["status"]:
+            changed.append("status")
+        task["status"] = status
+        if status in FINISHED_STATUSES:
+            task["finished_at"] = now
+            finished = True
+    if result is not None:
+        task["result"] = result
+        changed.append("result")
+    if progress is not None:
+        # clamp to [0.0, 1.0]
+        try:
+            p = float(progress)
+        except Exception:
+            p = task.get("progress", 0.0)
+        p = max(0.0, min(1.0, p))
+        if p != task["progress"]:
+            changed.append("progress")
+        task["progress"] = p
+    if error is not None:
+        task["error"] = error
+        changed.append("error")
+    if message is not None:
+        if message != task["message"]:
+            changed.append("message")
+        task["message"] = message
+    # per-stage structured updates
+    if stage_name is not None:
+        stages = task.setdefault("stages", {})
+        stage_entry = stages.setdefault(stage_name, {})
+        if stage_result is not None:
+            stage_entry["result"] = stage_result
+        if stage_status is not None:
+            stage_entry["status"] = stage_status
+        if stage_elapsed is not None:
+            stage_entry["elapsed_s"] = round(stage_elapsed, 6)
+    # 版本号只随客户端可见的变化递增（payload 不计）
+    if changed or stage_name is not None:
+        task["version"] += 1
+        for name in changed:
+            task["field_versions"][name] = task["version"]
+        if stage_name is not None:
+            task["stage_versions"][stage_name] = task["version"]
+        return True, finished
+    return False, finished
+
+
+def task_changes(task, version=0):
+    """version 之后变化的字段与阶段（始终包含当前 version 与 status）"""
+    since = version or 0
+    out = {"version": task["version"], "status": task["status"]}
+    for name, v in task["field_versions"].items():
+        if v > since:
+            out[name] = task.get(name)
+    stages = {name: dict(task["stages"][name]) for name, v in task["stage_versions"].items() if v > since}
+    if stages:
+        out["stages"] = stages
+    return out
+
+
+def wake_waiters(waiters):
+    """在各等待者自己的事件循环中置位（更新通常发生在推理线程）"""
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
 
 class TaskManager:
-    def __init__(self):
+    """任务表 + 保留策略。
+
+    - release_payload_on_finish：任务进入 done/error 后释放重负载，只保留轻量字段
+    - ttl_seconds：已结束任务超过 TTL 后整体删除
+    - max_memory_bytes：payload 常驻内存超过预算时，把波形/原始字节落盘为 .npy
+      并以只读 memmap 替换。运行中任务的波形同样落盘：管线在阶段之间从 payload
+      重新取音频（FunASRPipeline._stage_audio），换用 memmap 后放开原数组；
+      on_spill(payload, field, value) 回调用于让其他持有者（如波形缓存）同时放手
+
+    变更通知：客户端可见字段或阶段变化时任务 version 加一，并唤醒 wait_for_version
+    的等待者；changes_since 只返回某版本之后变化的字段与阶段。
+    """
+
+    def __init__(self, ttl_seconds=None, max_memory_bytes=None, spill_dir=None, release_payload_on_finish=True, sweep_interval=30.0, on_spill=None):
         self.tasks = {}
         self.lock = threading.Lock()
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.release_payload_on_finish = release_payload_on_finish
+        self.sweep_interval = sweep_interval
+        self.on_spill = on_spill
+        self._resident = 0  # payload 常驻字节数，随每次 payload 变更增量维护
+        self._spill_files = {}  # task_id -> [path, ...]
+        self._spill_lock = threading.Lock()
+        self._budget_lock = threading.Lock()
+        self._janitor = None
+        self._waiters = {}  # task_id -> {(loop, asyncio.Event), ...}
+        self._stats = {"expired": 0, "released": 0, "spilled": 0, "spilled_bytes": 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _set_payload_locked(self, task, payload):
+        self._resident += _payload_total(payload) - _payload_total(task.get("payload"))
+        task["payload"] = payload
 
-    def create_task(self, task_id, status="pending", payload=None):
+    def create_task(self, task_id, status="pending", payload=None, cache_hit=False):
         with self.lock:
-            self.tasks[task_id] = {
-                "status": status,
-                "result": None,
-                "progress": 0.0,
-                "error": None,
-                "message": None,
-                "payload": payload,  # e.g., {"audio_bytes": ..., "audio": ndarray, "sr": 16000, "duration": 12.3}
-                "stages": {},        # per-stage results/status, e.g., {"enhanced": {...}, "vad": {...}}
-            }
-
-    def update_task(self, task_id, status=None, result=None, progress=None, error=None, message=None, payload=None, stage_name=None, stage_result=None, stage_status=None):
+            old = self.tasks.get(task_id)
+            if old is not None:
+                self._resident -= _payload_total(old.get("payload"))
+            self.tasks[task_id] = new_task(status, payload, cache_hit)
+            self._resident += _payload_total(payload)
+            waiters = self._waiters.pop(task_id, ())
+        wake_waiters(waiters)
+        self._maybe_enforce_budget()
+
+    def update_task(self, task_id, status=None, result=None, progress=None, error=None, message=None, payload=None, stage_name=None, stage_result=None, stage_status=None, stage_elapsed=None):
+        released = None
+        waiters = ()
         with self.lock:
             if task_id not in self.tasks:
                 return
-            if status is not None:
-                self.tasks[task_id]["status"] = status
-            if result is not None:
-                self.tasks[task_id]["result"] = result
-            if progress is not None:
-                # clamp to [0.0, 1.0]
-                try:
-                    p = float(progress)
-                except Exception:
-                    p = self.tasks[task_id].get("progress", 0.0)
-                self.tasks[task_id]["progress"] = max(0.0, min(1.0, p))
-            if error is not None:
-                self.tasks[task_id]["error"] = error
-            if message is not None:
-                self.tasks[task_id]["message"] = message
+            task = self.tasks[task_id]
+            changed, finished = apply_update(task, time.time(), status=status, result=result, progress=progress, error=error, message=message,
+                                             stage_name=stage_name, stage_result=stage_result, stage_status=stage_status, stage_elapsed=stage_elapsed)
+            if finished and self.release_payload_on_finish:
+                released = self._release_payload_locked(task_id)
             if payload is not None:
-                self.tasks[task_id]["payload"] = payload
-            # per-stage structured updates
-            if stage_name is not None:
-                stages = self.tasks[task_id].setdefault("stages", {})
-                stage_entry = stages.setdefault(stage_name, {})
-                if stage_result is not None:
-                    stage_entry["result"] = stage_result
-                if stage_status is not None:
-                    stage_entry["status"] = stage_status
+                self._set_payload_locked(task, payload)
+            if changed:
+                waiters = self._waiters.pop(task_id, ())
+        wake_waiters(waiters)
+        if released:
+            self._remove_files(released)
+        if payload is not None:
+            self._maybe_enforce_budget()
+
+    def delete_task(self, task_id):
+        with self.lock:
+            task = self.tasks.pop(task_id, None)
+            if task is not None:
+                self._resident -= _payload_total(task.get("payload"))
+            owned = self._owned_files(task)
+            waiters = self._waiters.pop(task_id, ())
+        wake_waiters(waiters)
+        self._remove_files(owned + self._pop_spill_files(task_id))
+        return task
 
     def get_task(self, task_id):
         with self.lock:
             return self.tasks.get(task_id)
 
+    # ===== 变更通知 =====
+    def changes_since(self, task_id, version=0):
+        """返回 version 之后变化的字段与阶段（始终包含当前 version 与 status）；任务不存在返回 None"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None
+            return task_changes(task, version)
+
+    async def wait_for_version(self, task_id, version, timeout=None):
+        """等待任务版本超过 version 或超时，返回当前版本；任务不存在（或等待期间被删除）返回 None"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None
+            if task["version"] > version:
+                return task["version"]
+            self._waiters.setdefault(task_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                waiters = self._waiters.get(task_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[task_id]
+        with self.lock:
+            task = self.tasks.get(task_id)
+            return task["version"] if task is not None else None
+
     def set_payload(self, task_id, payload):
         with self.lock:
             if task_id in self.tasks:
-                self.tasks[task_id]["payload"] = payload
+                self._set_payload_locked(self.tasks[task_id], payload)
+        self._maybe_enforce_budget()
+
+    def merge_payload(self, task_id, **fields):
+        """原子地合并 payload 字段，避免并发阶段读改写互相覆盖"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            payload = dict(task.get("payload") or {})
+            payload.update(fields)
+            self._set_payload_locked(task, payload)
+        self._maybe_enforce_budget()
 
     def get_payload(self, task_id):
         with self.lock:
@@ -62,3 +268,136 @@ class TaskManager:
             if not task:
                 return None
             return task.get("payload")
+
+    # ===== 保留策略 =====
+    def _release_payload_locked(self, task_id):
+        """去掉重负载，仅保留轻量字段；返回需要删除的落盘文件"""
+        task = self.tasks[task_id]
+        payload = task.get("payload")
+        owned = self._owned_files(task)
+        if payload:
+            self._set_payload_locked(task, {k: payload[k] for k in LIGHT_PAYLOAD_FIELDS if k in payload})
+            self._stats["released"] += 1
+        return owned + self._pop_spill_files(task_id)
+
+    @staticmethod
+    def _owned_files(task):
+        payload = (task or {}).get("payload") or {}
+        return [payload[k] for k in OWNED_FILE_FIELDS if payload.get(k)]
+
+    def _pop_spill_files(self, task_id):
+        with self._spill_lock:
+            return self._spill_files.pop(task_id, [])
+
+    def _remove_files(self, paths):
+        for path in paths or []:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def sweep(self):
+        """删除超过 TTL 的已结束任务，并执行内存预算检查"""
+        expired, files = [], []
+        if self.ttl_seconds:
+            cutoff = time.time() - self.ttl_seconds
+            with self.lock:
+                for task_id, task in list(self.tasks.items()):
+                    finished_at = task.get("finished_at")
+                    if finished_at is not None and finished_at < cutoff:
+                        files.extend(self._owned_files(task))
+                        self._resident -= _payload_total(task.get("payload"))
+                        del self.tasks[task_id]
+                        expired.append(task_id)
+                self._stats["expired"] += len(expired)
+                waiters = [w for task_id in expired for w in self._waiters.pop(task_id, ())]
+            wake_waiters(waiters)
+        for task_id in expired:
+            files.extend(self._pop_spill_files(task_id))
+        self._remove_files(files)
+        self.enforce_memory_budget()
+        return expired
+
+    def start_janitor(self):
+        """后台周期清理线程"""
+        if self._janitor is not None:
+            return
+        def loop():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[task_manager] sweep failed: {e}")
+        self._janitor = threading.Thread(target=loop, name="task-janitor", daemon=True)
+        self._janitor.start()
+
+    def memory_usage(self):
+        """payload 常驻内存字节数与已落盘字节数"""
+        with self.lock:
+            resident = self._resident
+            n_tasks = len(self.tasks)
+        return {"tasks": n_tasks, "resident_bytes": resident, "max_memory_bytes": self.max_memory_bytes, **self._stats}
+
+    def _maybe_enforce_budget(self):
+        # 只在常驻总量越过预算时才扫描任务表
+        if self.max_memory_bytes and self.spill_dir and self._resident > self.max_memory_bytes:
+            self.enforce_memory_budget()
+
+    def enforce_memory_budget(self):
+        """超出预算时按任务创建先后把大字段落盘为 memmap，直到回到预算内"""
+        if not (self.max_memory_bytes and self.spill_dir):
+            return 0
+        # 同一时刻只允许一个线程执行落盘，其余调用直接跳过
+        if not self._budget_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._spill_over_budget()
+        finally:
+            self._budget_lock.release()
+
+    def _spill_over_budget(self):
+        with self.lock:
+            if self._resident <= self.max_memory_bytes:
+                return 0
+            candidates = []
+            for task_id, task in self.tasks.items():
+                for field, value in (task.get("payload") or {}).items():
+                    nbytes = _payload_nbytes(value)
+                    if nbytes:
+                        candidates.append((task["created_at"], task_id, field, value, nbytes))
+        spilled = 0
+        for _, task_id, field, value, nbytes in sorted(candidates, key=lambda c: c[0]):
+            if self._resident <= self.max_memory_bytes:
+                break
+            # 文件写入在锁外进行；写完后仅当字段未被替换时才换成 memmap
+            path = os.path.join(self.spill_dir, f"{task_id}.{field}.npy")
+            array = value if isinstance(value, np.ndarray) else np.frombuffer(value, dtype=np.uint8)
+            try:
+                np.save(path, array)
+                mapped = np.load(path, mmap_mode="r")
+            except Exception as e:
+                print(f"[task_manager] spill {task_id}.{field} failed: {e}")
+                continue
+            swapped = False
+            with self.lock:
+                task = self.tasks.get(task_id)
+                payload = task.get("payload") if task else None
+                if payload is not None and payload.get(field) is value:
+                    self._set_payload_locked(task, {**payload, field: mapped})
+                    swapped = True
+            if swapped:
+                with self._spill_lock:
+                    self._spill_files.setdefault(task_id, []).append(path)
+                if self.on_spill is not None:
+                    try:
+                        self.on_spill(payload, field, value)
+                    except Exception as e:
+                        print(f"[task_manager] on_spill {task_id}.{field} failed: {e}")
+                spilled += nbytes
+                self._stats["spilled"] += 1
+                self._stats["spilled_bytes"] += nbytes
+            else:
+                del mapped
+                self._remove_files([path])
+        return spilled
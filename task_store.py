@@ -0,0 +1,560 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+
+import numpy as np
+
+from task_manager import FINISHED_STATUSES, LIGHT_PAYLOAD_FIELDS, OWNED_FILE_FIELDS, apply_update, new_task, task_changes, wake_waiters
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL,
+    message TEXT,
+    error TEXT,
+    result TEXT,
+    stages TEXT NOT NULL,
+    cache_hit INTEGER NOT NULL,
+    payload TEXT,
+    payload_files TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    version INTEGER NOT NULL,
+    field_versions TEXT NOT NULL,
+    stage_versions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_finished_at ON tasks(finished_at);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    est_duration REAL,
+    submitted_at REAL NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT,
+    started_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(state, rank, job_id);
+"""
+
+# 任务字段 -> 列；JSON 列在读写时编解码
+_JSON_COLUMNS = ("result", "stages", "field_versions", "stage_versions")
+_COLUMNS = ("status", "progress", "message", "error", "result", "stages", "cache_hit", "created_at", "updated_at",
+            "finished_at", "version", "field_versions", "stage_versions")
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def _is_heavy(value):
+    """波形与原始字节写成文件，其余 payload 字段以 JSON 存在行内"""
+    return isinstance(value, (np.ndarray, bytes, bytearray))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteTaskStore:
+    """持久化任务表：SQLite（WAL 模式）+ 数据库旁的 payload 文件目录，接口与 TaskManager 一致。
+
+    多个 uvicorn worker 或同机多副本共用同一个数据库文件，任一进程都能查询任意任务，
+    重启后任务与排队中的作业仍在。波形/原始字节写成 payload 目录下的 .npy/.bin 文件，
+    行内只存轻量字段与文件路径；状态查询是单行主键读，WAL 下读不阻塞写。
+
+    同时提供共享作业队列（jobs 表），JobScheduler 以 job_store 方式接入：
+    领取作业在 BEGIN IMMEDIATE 事务内完成，同一作业只会被一个 worker 领取。
+    wait_for_version 对本进程的更新立即唤醒；其他进程的更新由每进程一个的后台线程
+    按 poll_interval 批量查询被等待任务的版本后唤醒，等待者本身不在事件循环上轮询数据库。
+    """
+
+    def __init__(self, db_path, payload_dir=None, ttl_seconds=None, release_payload_on_finish=True, sweep_interval=30.0, poll_interval=0.25, busy_timeout_s=10.0):
+        self.db_path = db_path
+        self.payload_dir = payload_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "payloads")
+        self.ttl_seconds = ttl_seconds
+        self.release_payload_on_finish = release_payload_on_finish
+        self.sweep_interval = sweep_interval
+        self.poll_interval = poll_interval
+        self.busy_timeout_s = busy_timeout_s
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waiters = {}  # task_id -> {(loop, asyncio.Event): 等待超过的版本}，仅本进程
+        self._watcher = None
+        # 本进程已写入/读出的 payload 文件：路径 -> 数组弱引用或 (字节数, crc32)，重复合并同一内容时不再重写
+        self._heavy_refs = {}
+        self._janitor = None
+        self._stats = {"expired": 0, "released": 0, "spilled": 0, "spilled_bytes": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(self.payload_dir, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    # ===== 连接 =====
+    def _conn(self):
+        """每个线程一个连接；autocommit，需要读改写的操作显式 BEGIN IMMEDIATE"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_s, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """在写事务中执行 fn(conn)；BEGIN IMMEDIATE 保证读改写期间不被其他进程插入写入"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return out
+
+    # ===== 行 <-> 任务字典 =====
+    @staticmethod
+    def _row_to_task(row):
+        task = {name: row[name] for name in _COLUMNS}
+        for name in _JSON_COLUMNS:
+            task[name] = json.loads(row[name]) if row[name] is not None else None
+        task["cache_hit"] = bool(task["cache_hit"])
+        return task
+
+    @staticmethod
+    def _task_values(task):
+        return [(_dumps(task[name]) if name in _JSON_COLUMNS and task[name] is not None else task[name]) for name in _COLUMNS]
+
+    def _save_task(self, conn, task_id, task):
+        conn.execute(f"UPDATE tasks SET {', '.join(f'{name} = ?' for name in _COLUMNS)} WHERE task_id = ?", (*self._task_values(task), task_id))
+
+    def _load_row(self, conn, task_id, columns="*"):
+        return conn.execute(f"SELECT {columns} FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+
+    # ===== payload 文件 =====
+    def _heavy_path(self, task_id, field, value):
+        suffix = "npy" if isinstance(value, np.ndarray) else "bin"
+        return os.path.join(self.payload_dir, f"{task_id}.{field}.{suffix}")
+
+    def _remember(self, path, value):
+        ref = weakref.ref(value) if isinstance(value, np.ndarray) else (len(value), zlib.crc32(value))
+        with self._lock:
+            self._heavy_refs[path] = ref
+
+    def _unchanged(self, path, value):
+        """path 已是 value 的内容：数组为本进程写入或读出的同一对象（payload 数组按不可变处理），字节按长度与 crc32 比较"""
+        with self._lock:
+            ref = self._heavy_refs.get(path)
+        if ref is None or not os.path.exists(path):
+            return False
+        if isinstance(value, np.ndarray):
+            return isinstance(ref, weakref.ref) and ref() is value
+        return isinstance(ref, tuple) and ref[0] == len(value) and ref[1] == zlib.crc32(value)
+
+    def _write_heavy(self, task_id, fields):
+        """把重负载字段写成文件（先写临时文件再改名），返回 {字段: 路径}；内容未变的字段不重写"""
+        paths = {}
+        for field, value in fields.items():
+            path = self._heavy_path(task_id, field, value)
+            paths[field] = path
+            if self._unchanged(path, value):
+                continue
+            if isinstance(value, np.ndarray):
+                tmp = f"{path}.{threading.get_ident()}.tmp.npy"
+                np.save(tmp, value)
+                nbytes = value.nbytes
+            else:
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(value)
+                nbytes = len(value)
+            os.replace(tmp, path)
+            self._remember(path, value)
+            with self._lock:
+                self._stats["spilled"] += 1
+                self._stats["spilled_bytes"] += nbytes
+        return paths
+
+    def _read_heavy(self, path):
+        if path.endswith(".npy"):
+            value = np.load(path, mmap_mode="r")
+            # 读出的 memmap 原样合并回来时（如解码阶段回写音频）无需重写
+            self._remember(path, value)
+            return value
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _split_payload(payload):
+        payload = payload or {}
+        light = {k: v for k, v in payload.items() if not _is_heavy(v)}
+        heavy = {k: v for k, v in payload.items() if _is_heavy(v)}
+        return light, heavy
+
+    def _owned_files(self, row):
+        """行上记录的全部文件：payload 文件 + 任务独占的上传落盘文件"""
+        payload = json.loads(row["payload"]) if row["payload"] else {}
+        files = list(json.loads(row["payload_files"]).values())
+        return files + [payload[k] for k in OWNED_FILE_FIELDS if payload.get(k)]
+
+    def _remove_files(self, paths):
+        for path in paths or []:
+            with self._lock:
+                self._heavy_refs.pop(path, None)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # ===== 任务 =====
+    def create_task(self, task_id, status="pending", payload=None, cache_hit=False):
+        light, heavy = self._split_payload(payload)
+        files = self._write_heavy(task_id, heavy)
+        task = new_task(status, payload, cache_hit)
+
+        def insert(conn):
+            old = self._load_row(conn, task_id, "payload, payload_files")
+            columns = ("task_id", "payload", "payload_files") + _COLUMNS
+            conn.execute(f"INSERT OR REPLACE INTO tasks ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                         (task_id, _dumps(light) if payload is not None else None, _dumps(files), *self._task_values(task)))
+            return old
+
+        old = self._write(insert)
+        if old is not None:
+            self._remove_files([p for p in self._owned_files(old) if p not in files.values()])
+        self._notify(task_id)
+
+    def update_task(self, task_id, status=None, result=None, progress=None, error=None, message=None, payload=None, stage_name=None, stage_result=None, stage_status=None, stage_elapsed=None):
+        def update(conn):
+            row = self._load_row(conn, task_id)
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+            changed, finished = apply_update(task, time.time(), status=status, result=result, progress=progress, error=error, message=message,
+                                             stage_name=stage_name, stage_result=stage_result, stage_status=stage_status, stage_elapsed=stage_elapsed)
+            self._save_task(conn, task_id, task)
+            released = []
+            if finished and self.release_payload_on_finish:
+                released = self._release_payload(conn, task_id, row)
+            return changed, released
+
+        if payload is not None:
+            self.set_payload(task_id, payload)
+        out = self._write(update)
+        if out is None:
+            return
+        changed, released = out
+        if released:
+            self._remove_files(released)
+        if changed:
+            self._notify(task_id)
+
+    def _release_payload(self, conn, task_id, row):
+        """结束态：payload 只保留轻量字段，返回需要删除的文件"""
+        if not row["payload"]:
+            return []
+        payload = json.loads(row["payload"])
+        light = {k: payload[k] for k in LIGHT_PAYLOAD_FIELDS if k in payload}
+        conn.execute("UPDATE tasks SET payload = ?, payload_files = '{}' WHERE task_id = ?", (_dumps(light), task_id))
+        with self._lock:
+            self._stats["released"] += 1
+        return self._owned_files(row)
+
+    def delete_task(self, task_id):
+        def delete(conn):
+            row = self._load_row(conn, task_id)
+            if row is not None:
+                conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            return row
+
+        row = self._write(delete)
+        self._notify(task_id)
+        if row is None:
+            return None
+        self._remove_files(self._owned_files(row))
+        return self._row_to_task(row)
+
+    def get_task(self, task_id):
+        """任务快照；payload 只含行内轻量字段，波形/原始字节请用 get_payload"""
+        row = self._load_row(self._conn(), task_id)
+        if row is None:
+            return None
+        task = self._row_to_task(row)
+        task["payload"] = json.loads(row["payload"]) if row["payload"] else None
+        return task
+
+    # ===== payload =====
+    def get_payload(self, task_id):
+        row = self._load_row(self._conn(), task_id, "payload, payload_files")
+        if row is None or row["payload"] is None:
+            return None
+        payload = json.loads(row["payload"])
+        for field, path in json.loads(row["payload_files"]).items():
+            try:
+                payload[field] = self._read_heavy(path)
+            except OSError:
+                continue
+        return payload
+
+    def set_payload(self, task_id, payload):
+        light, heavy = self._split_payload(payload)
+        files = self._write_heavy(task_id, heavy)
+
+        def replace(conn):
+            row = self._load_row(conn, task_id, "payload_files")
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET payload = ?, payload_files = ? WHERE task_id = ?", (_dumps(light), _dumps(files), task_id))
+            return list(json.loads(row["payload_files"]).values())
+
+        old = self._write(replace)
+        stale = list(files.values()) if old is None else [p for p in old if p not in files.values()]
+        self._remove_files(stale)
+
+    def merge_payload(self, task_id, **fields):
+        """原子地合并 payload 字段；重负载先写文件，再在事务中合并行内字段与文件表"""
+        light, heavy = self._split_payload(fields)
+        files = self._write_heavy(task_id, heavy)
+
+        def merge(conn):
+            row = self._load_row(conn, task_id, "payload, payload_files")
+            if row is None:
+                return None
+            payload = json.loads(row["payload"]) if row["payload"] else {}
+            payload_files = json.loads(row["payload_files"])
+            for field in heavy:
+                payload.pop(field, None)
+                if payload_files.get(field) not in (None, files[field]):
+                    stale.append(payload_files[field])
+            for field in light:
+                if field in payload_files:
+                    stale.append(payload_files.pop(field))
+            payload.update(light)
+            payload_files.update(files)
+            conn.execute("UPDATE tasks SET payload = ?, payload_files = ? WHERE task_id = ?", (_dumps(payload), _dumps(payload_files), task_id))
+            return True
+
+        stale = []
+        if self._write(merge) is None:
+            stale = list(files.values())
+        self._remove_files(stale)
+
+    # ===== 变更通知 =====
+    def changes_since(self, task_id, version=0):
+        row = self._load_row(self._conn(), task_id, "status, progress, message, error, result, stages, version, field_versions, stage_versions")
+        if row is None:
+            return None
+        task = {name: row[name] for name in row.keys()}
+        for name in _JSON_COLUMNS:
+            task[name] = json.loads(row[name]) if row[name] is not None else None
+        return task_changes(task, version)
+
+    def _version(self, task_id):
+        row = self._load_row(self._conn(), task_id, "version")
+        return row["version"] if row is not None else None
+
+    async def wait_for_version(self, task_id, version, timeout=None):
+        """等待任务版本超过 version 或超时；本进程的更新立即唤醒，其他进程的更新最迟 poll_interval 后可见。
+
+        版本查询在线程池中执行；等待期间不访问数据库，由 _watch_loop 统一查询后唤醒。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        self._start_watcher()
+        while True:
+            event = asyncio.Event()
+            waiter = (loop, event)
+            with self._lock:
+                self._waiters.setdefault(task_id, {})[waiter] = version
+            try:
+                current = await asyncio.to_thread(self._version, task_id)
+                remaining = None if deadline is None else deadline - loop.time()
+                if current is None or current > version or (remaining is not None and remaining <= 0):
+                    return current
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(task_id)
+                    if waiters is not None:
+                        waiters.pop(waiter, None)
+                        if not waiters:
+                            del self._waiters[task_id]
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch_loop, name="task-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self):
+        """每 poll_interval 一次批量查询所有被等待任务的版本，唤醒版本已超过（或任务已删除）的等待者"""
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                watched = list(self._waiters)
+            if not watched:
+                continue
+            try:
+                versions = self._versions(watched)
+            except Exception as e:
+                print(f"[task_store] watch versions failed: {e}")
+                continue
+            wake = []
+            with self._lock:
+                for task_id in watched:
+                    current = versions.get(task_id)
+                    for waiter, version in (self._waiters.get(task_id) or {}).items():
+                        if current is None or current > version:
+                            wake.append(waiter)
+            wake_waiters(wake)
+
+    def _versions(self, task_ids):
+        conn = self._conn()
+        versions = {}
+        # 分批查询，避免超过 SQLite 的参数个数上限
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            rows = conn.execute(f"SELECT task_id, version FROM tasks WHERE task_id IN ({', '.join('?' for _ in chunk)})", chunk).fetchall()
+            versions.update((row["task_id"], row["version"]) for row in rows)
+        return versions
+
+    def _notify(self, task_id):
+        with self._lock:
+            waiters = self._waiters.pop(task_id, ())
+        wake_waiters(waiters)
+
+    # ===== 共享作业队列（供 JobScheduler 使用）=====
+    def enqueue_job(self, task_id, kind, priority, rank, est_duration, submitted_at, max_queue):
+        """排队作业；等待中的作业已达 max_queue 时返回 None，否则返回 job_id"""
+        def enqueue(conn):
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+            if queued >= max_queue:
+                return None
+            cur = conn.execute("INSERT INTO jobs (task_id, kind, priority, rank, est_duration, submitted_at, state) VALUES (?, ?, ?, ?, ?, ?, 'queued')",
+                               (task_id, kind, priority, rank, est_duration, submitted_at))
+            return cur.lastrowid
+
+        return self._write(enqueue)
+
+    def claim_job(self):
+        """原子地领取优先级最高、最早提交的作业；没有可领取的作业返回 None"""
+        conn = self._conn()
+        # 先做一次不加写锁的检查，空闲轮询不与任务更新争抢写锁
+        if conn.execute("SELECT 1 FROM jobs WHERE state = 'queued' LIMIT 1").fetchone() is None:
+            return None
+
+        def claim(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE state = 'queued' ORDER BY rank, job_id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            started_at = time.time()
+            conn.execute("UPDATE jobs SET state = 'running', owner = ?, started_at = ? WHERE job_id = ?", (self.owner, started_at, row["job_id"]))
+            return dict(row, state="running", owner=self.owner, started_at=started_at)
+
+        return self._write(claim)
+
+    def finish_job(self, job_id):
+        self._conn().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def list_jobs(self, state):
+        """某状态的全部作业（queued 按领取顺序排列）"""
+        rows = self._conn().execute("SELECT * FROM jobs WHERE state = ? ORDER BY rank, job_id", (state,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_orphaned_jobs(self):
+        """本机上已退出的进程领取的作业重新排队（如 worker 崩溃或重启），返回重新排队的数量"""
+        host = self.owner.rsplit(":", 1)[0]
+
+        def requeue(conn):
+            orphaned = []
+            for row in conn.execute("SELECT job_id, owner FROM jobs WHERE state = 'running'").fetchall():
+                owner_host, _, pid = (row["owner"] or "").rpartition(":")
+                if owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                    orphaned.append(row["job_id"])
+            for job_id in orphaned:
+                conn.execute("UPDATE jobs SET state = 'queued', owner = NULL, started_at = NULL WHERE job_id = ?", (job_id,))
+            return len(orphaned)
+
+        n = self._write(requeue)
+        if n:
+            print(f"[task_store] requeued {n} job(s) from exited workers")
+        return n
+
+    # ===== 保留策略 =====
+    def sweep(self):
+        """删除超过 TTL 的已结束任务及其文件"""
+        if not self.ttl_seconds:
+            return []
+        cutoff = time.time() - self.ttl_seconds
+
+        def expire(conn):
+            rows = conn.execute(f"SELECT task_id, payload, payload_files FROM tasks WHERE finished_at IS NOT NULL AND finished_at < ? AND status IN ({', '.join('?' for _ in FINISHED_STATUSES)})",
+                                (cutoff, *FINISHED_STATUSES)).fetchall()
+            conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(row["task_id"],) for row in rows])
+            return rows
+
+        rows = self._write(expire)
+        files = [path for row in rows for path in self._owned_files(row)]
+        self._remove_files(files)
+        expired = [row["task_id"] for row in rows]
+        with self._lock:
+            self._stats["expired"] += len(expired)
+        for task_id in expired:
+            self._notify(task_id)
+        return expired
+
+    def start_janitor(self):
+        """后台周期清理线程（多进程各自运行，删除操作在事务内进行，互不冲突）"""
+        if self._janitor is not None:
+            return
+        def loop():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.sweep()
+                    self.requeue_orphaned_jobs()
+                except Exception as e:
+                    print(f"[task_store] sweep failed: {e}")
+        self._janitor = threading.Thread(target=loop, name="task-janitor", daemon=True)
+        self._janitor.start()
+
+    def enforce_memory_budget(self):
+        """payload 本就落盘，不占常驻内存"""
+        return 0
+
+    def memory_usage(self):
+        """任务数；payload 以文件形式存放，resident_bytes 恒为 0，spilled_* 为本进程写入的 payload 文件累计"""
+        n_tasks = self._conn().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        with self._lock:
+            stats = dict(self._stats)
+        return {"tasks": n_tasks, "resident_bytes": 0, "max_memory_bytes": None, "store": "sqlite", "db_path": self.db_path, **stats}
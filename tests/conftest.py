@@ -0,0 +1,11 @@
+"""测试统一使用 benchmarks/stub_models 中的桩模型：在导入管线之前注册假 funasr 模块，不需要模型权重"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import stub_models  # noqa: E402
+
+stub_models.install()
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+
+from my_funasr.audio_cache import WaveformCache, audio_digest
+
+
+def test_concurrent_misses_compute_once():
+    cache = WaveformCache(max_bytes=1 << 20)
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return np.ones(16, dtype=np.float32)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("h", "audio", compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert len(results) == 8 and all(r is results[0] for r in results)
+    stats = cache.stats()["by_artifact"]["audio"]
+    assert stats["misses"] == 1
+
+
+def test_failed_compute_lets_waiter_retry():
+    cache = WaveformCache(max_bytes=1 << 20)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("decode failed")
+
+    errors, results = [], []
+
+    def owner():
+        try:
+            cache.get_or_compute("h", "audio", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    t1 = threading.Thread(target=owner)
+    t1.start()
+    started.wait(5)
+    t2 = threading.Thread(target=lambda: results.append(cache.get_or_compute("h", "audio", lambda: "decoded")))
+    t2.start()
+    release.set()
+    t1.join(5)
+    t2.join(5)
+    # 计算方的异常只抛给它自己，等待方重新计算
+    assert len(errors) == 1 and results == ["decoded"]
+    assert cache.peek("h", "audio") == "decoded"
+
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = WaveformCache(max_bytes=2500)
+    for name in ("a", "b"):
+        cache.put(name, "audio", np.zeros(250, dtype=np.float32))
+    cache.get("a", "audio")
+    cache.put("c", "audio", np.zeros(250, dtype=np.float32))
+    assert cache.peek("b", "audio") is None
+    assert cache.peek("a", "audio") is not None and cache.peek("c", "audio") is not None
+    assert cache.stats()["evictions"] == 1
+    # 超过整体预算的单个条目不缓存
+    cache.put("big", "audio", np.zeros(1000, dtype=np.float32))
+    assert cache.peek("big", "audio") is None
+
+
+def test_audio_digest_is_content_addressed():
+    assert audio_digest(b"RIFF1234") == audio_digest(bytes(bytearray(b"RIFF1234")))
+    assert audio_digest(b"RIFF1234") != audio_digest(b"RIFF1235")
@@ -0,0 +1,41 @@
+import io
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from my_funasr.audio_preprocess import TARGET_SR, load_audio
+
+
+def _wav(seconds, sample_rate, channels):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    y = 0.3 * np.sin(2 * np.pi * 440 * t)
+    data = np.stack([y] * channels, axis=1) if channels > 1 else y
+    buf = io.BytesIO()
+    sf.write(buf, data.astype(np.float32), sample_rate, format="WAV", subtype="PCM_16")
+    return buf.getvalue(), y.astype(np.float32)
+
+
+def test_wav_44k_stereo_resampled_blockwise():
+    data, mono = _wav(20, 44100, 2)
+    tracemalloc.start()
+    try:
+        y, sr, duration = load_audio(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert sr == TARGET_SR
+    assert abs(duration - 20) < 0.01
+    # 峰值内存约为一份 16kHz 输出，不再有输入采样率下的整段 float32 副本
+    assert peak < 1.5 * y.nbytes
+    expected = soxr.resample(mono, 44100, TARGET_SR, quality="HQ")
+    n = min(len(y), len(expected))
+    assert np.max(np.abs(y[1000:n - 1000] - expected[1000:n - 1000])) < 1e-3
+
+
+def test_wav_16k_mono_returns_float32():
+    data, mono = _wav(2, TARGET_SR, 1)
+    y, sr, duration = load_audio(data)
+    assert y.dtype == np.float32 and len(y) == len(mono)
+    np.testing.assert_allclose(y, mono, atol=1e-4)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from my_funasr.batch_scheduler import ASRBatchScheduler
+
+SR = 16000
+
+
+def _audio(seconds, value=0.0):
+    return np.full(int(seconds * SR), value, dtype=np.float32)
+
+
+def _recording_generate(calls):
+    def generate(inputs, sample_rate):
+        calls.append([len(a) for a in inputs])
+        return [f"{len(a) / sample_rate:.1f}s" for a in inputs]
+    return generate
+
+
+def test_segments_are_batched_by_length_bucket():
+    calls = []
+    scheduler = ASRBatchScheduler(_recording_generate(calls), max_batch_size=8, max_wait_ms=50, length_bucket_s=2.0)
+    try:
+        futures = scheduler.submit_many([_audio(1.0), _audio(5.0), _audio(1.5), _audio(5.5), _audio(0.5)], SR, task_id="t1")
+        assert [f.result(timeout=5) for f in futures] == ["1.0s", "5.0s", "1.5s", "5.5s", "0.5s"]
+    finally:
+        scheduler.shutdown()
+    # 短分段与长分段各自成批，不混在同一批里补齐
+    assert sorted(calls) == sorted([[16000, 24000, 8000], [80000, 88000]])
+    assert scheduler.stats()["batch_size_hist"] == {2: 1, 3: 1}
+
+
+def test_lone_request_flushes_after_max_wait():
+    calls = []
+    scheduler = ASRBatchScheduler(_recording_generate(calls), max_batch_size=8, max_wait_ms=100)
+    try:
+        started = time.monotonic()
+        future = scheduler.submit(_audio(1.0), SR)
+        assert future.result(timeout=5) == "1.0s"
+        assert time.monotonic() - started >= 0.09
+    finally:
+        scheduler.shutdown()
+    assert calls == [[16000]]
+
+
+def test_full_bucket_flushes_without_waiting():
+    calls = []
+    scheduler = ASRBatchScheduler(_recording_generate(calls), max_batch_size=2, max_wait_ms=10_000)
+    try:
+        started = time.monotonic()
+        futures = scheduler.submit_many([_audio(1.0), _audio(1.0)], SR)
+        assert [f.result(timeout=5) for f in futures] == ["1.0s", "1.0s"]
+        assert time.monotonic() - started < 5
+    finally:
+        scheduler.shutdown()
+    assert calls == [[16000, 16000]]
+
+
+def test_batch_failure_falls_back_per_item():
+    calls = []
+    lock = threading.Lock()
+
+    def generate(inputs, sample_rate):
+        with lock:
+            calls.append(len(inputs))
+        if any(a[0] < 0 for a in inputs):
+            raise ValueError("bad segment")
+        return ["ok"] * len(inputs)
+
+    scheduler = ASRBatchScheduler(generate, max_batch_size=8, max_wait_ms=20)
+    try:
+        futures = scheduler.submit_many([_audio(1.0), _audio(1.0, -1.0), _audio(1.0)], SR)
+        assert futures[0].result(timeout=5) == "ok"
+        assert futures[2].result(timeout=5) == "ok"
+        with pytest.raises(ValueError, match="bad segment"):
+            futures[1].result(timeout=5)
+    finally:
+        scheduler.shutdown()
+    # 一次整批调用失败后逐条重试，只有坏分段报错
+    assert calls == [3, 1, 1, 1]
+    assert scheduler.stats()["fallbacks"] == 1
+
+
+def test_submit_after_shutdown_raises():
+    scheduler = ASRBatchScheduler(_recording_generate([]))
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(_audio(1.0), SR)
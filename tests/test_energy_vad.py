@@ -0,0 +1,57 @@
+import numpy as np
+
+from my_funasr.energy_vad import _dilate, energy_vad, split_long_segments
+
+SR = 16000
+
+
+def _tone(seconds, amp=0.3):
+    t = np.arange(int(seconds * SR)) / SR
+    return (amp * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+
+
+def _silence(seconds, seed=0):
+    return (1e-4 * np.random.default_rng(seed).standard_normal(int(seconds * SR))).astype(np.float32)
+
+
+def test_dilate_keeps_length_for_masks_shorter_than_kernel():
+    mask = np.zeros(10, dtype=bool)
+    mask[2] = True
+    out = _dilate(mask, 15)
+    assert len(out) == 10 and out.all()
+    mask = np.zeros(40, dtype=bool)
+    mask[5] = True
+    np.testing.assert_array_equal(np.flatnonzero(_dilate(mask, 2)), [3, 4, 5, 6, 7])
+
+
+def test_short_clip_segments_stay_inside_audio():
+    audio = np.concatenate([_silence(0.1), _tone(0.15), _silence(0.05)])
+    duration = len(audio) / SR
+    segments = energy_vad(audio, SR, min_speech_ms=50)
+    assert segments
+    for seg in segments:
+        assert 0.0 <= seg["start"] < seg["end"] <= duration
+
+
+def test_speech_runs_separated_by_silence():
+    audio = np.concatenate([_silence(1.0), _tone(1.0), _silence(1.0, 1), _tone(1.0), _silence(1.0, 2)])
+    segments = energy_vad(audio, SR)
+    assert len(segments) == 2
+    assert abs(segments[0]["start"] - 1.0) < 0.15 and abs(segments[0]["end"] - 2.0) < 0.15
+    assert abs(segments[1]["start"] - 3.0) < 0.15 and abs(segments[1]["end"] - 4.0) < 0.15
+
+
+def test_forced_split_cuts_at_longest_silence():
+    # 0~24.5s 有声，24.5~25s 静音，之后有声到 40s：第一个切点落在静音处
+    audio = np.concatenate([_tone(24.5), _silence(0.5), _tone(15.0)])
+    pieces = split_long_segments([{"start": 0.0, "end": 40.0, "speaker": "spk0"}], audio, SR, max_segment_s=30.0, overlap_s=1.0, search_s=6.0)
+    assert len(pieces) == 2
+    cut = pieces[1]["start"]
+    assert 24.5 <= cut <= 25.0
+    assert pieces[0]["end"] == round(cut + 1.0, 3)
+    assert all(p["end"] - p["start"] <= 30.0 and p["speaker"] == "spk0" for p in pieces)
+
+
+def test_split_without_audio_uses_fixed_windows():
+    pieces = split_long_segments([{"start": 0.0, "end": 65.0}], max_segment_s=30.0, overlap_s=1.0)
+    assert [(p["start"], p["end"]) for p in pieces] == [(0.0, 30.0), (29.0, 59.0), (58.0, 65.0)]
@@ -0,0 +1,38 @@
+import io
+import threading
+
+import numpy as np
+import soundfile as sf
+
+from my_funasr.funasr_pipeline import FunASRPipeline
+from task_manager import TaskManager
+
+
+def _wav(seconds, seed=0):
+    t = np.arange(int(seconds * 16000)) / 16000
+    y = 0.3 * np.sin(2 * np.pi * 200 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    y += 1e-3 * np.random.default_rng(seed).standard_normal(len(t))
+    buf = io.BytesIO()
+    sf.write(buf, y.astype(np.float32), 16000, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def _pipeline(**kwargs):
+    return FunASRPipeline(asr_model_dir="stub/asr", audio_cache_bytes=64 << 20, **kwargs)
+
+
+def test_batch_window_finishes_when_segment_submit_fails():
+    pipeline = _pipeline()
+    pipeline.batch_scheduler.shutdown()
+    manager = TaskManager()
+    children = []
+    for i in range(2):
+        manager.create_task(f"t{i}", status="running", payload={})
+        children.append((f"t{i}", _wav(4, seed=i)))
+    finished = []
+    runner = threading.Thread(target=pipeline._run_batch_sync, args=(children, manager), kwargs={"on_child_finished": finished.append}, daemon=True)
+    runner.start()
+    runner.join(5)
+    assert not runner.is_alive()
+    assert sorted(finished) == ["t0", "t1"]
+    assert all(manager.get_task(t)["status"] == "error" for t in finished)
@@ -0,0 +1,54 @@
+import threading
+
+from job_scheduler import JobScheduler
+
+
+class _SlowStore:
+    """claim_job 阻塞在 release 上，模拟数据库写锁被其他进程占用"""
+
+    def __init__(self):
+        self.claiming = threading.Event()
+        self.release = threading.Event()
+
+    def requeue_orphaned_jobs(self):
+        return 0
+
+    def claim_job(self):
+        self.claiming.set()
+        self.release.wait()
+        return None
+
+    def list_jobs(self, state):
+        return []
+
+    def enqueue_job(self, *args):
+        return None
+
+    def finish_job(self, job_id):
+        pass
+
+
+def test_slow_claim_does_not_block_queries():
+    store = _SlowStore()
+    scheduler = JobScheduler({"full": lambda task_id: None}, num_workers=1, job_store=store, poll_interval=0.01)
+    scheduler.start()
+    try:
+        assert store.claiming.wait(2)
+        results = []
+        query = threading.Thread(target=lambda: results.extend([scheduler.queue_info("t1"), scheduler.stats()["queued"]]), daemon=True)
+        query.start()
+        query.join(0.5)
+        assert results == [None, 0]
+    finally:
+        store.release.set()
+        scheduler.shutdown()
+
+
+def test_in_process_queue_runs_submitted_jobs():
+    done = threading.Event()
+    scheduler = JobScheduler({"full": lambda task_id: done.set()}, num_workers=2)
+    scheduler.submit("t1", "full", est_duration=5.0)
+    try:
+        assert done.wait(2)
+    finally:
+        scheduler.shutdown()
@@ -0,0 +1,17 @@
+from my_funasr.metrics import MetricsRegistry
+
+
+def test_callback_counter_renders_counter_type():
+    registry = MetricsRegistry()
+    stats = {"hits": 3, "misses": 1}
+    registry.callback_counter("funasr_cache_lookups_total", "Cache lookups", lambda: {(k,): v for k, v in stats.items()}, ("result",))
+    registry.gauge("funasr_cache_bytes", "Bytes held", lambda: 1024)
+    assert registry.render().splitlines() == [
+        "# HELP funasr_cache_lookups_total Cache lookups",
+        "# TYPE funasr_cache_lookups_total counter",
+        'funasr_cache_lookups_total{result="hits"} 3',
+        'funasr_cache_lookups_total{result="misses"} 1',
+        "# HELP funasr_cache_bytes Bytes held",
+        "# TYPE funasr_cache_bytes gauge",
+        "funasr_cache_bytes 1024",
+    ]
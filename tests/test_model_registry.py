@@ -0,0 +1,25 @@
+from my_funasr.model_registry import ModelRegistry
+
+
+def test_lazy_registry_is_ready_before_first_load():
+    calls = []
+    registry = ModelRegistry(lambda name, model_dir: calls.append(name) or object())
+    registry.register("asr", "asr-dir", required=True)
+    assert not registry.ready()
+    assert registry.ready(lazy=True)
+    assert calls == []
+    assert registry.get("asr") is not None
+    assert registry.ready()
+
+
+def test_lazy_registry_not_ready_after_required_model_fails():
+    def loader(name, model_dir):
+        raise RuntimeError("broken model")
+
+    registry = ModelRegistry(loader)
+    registry.register("asr", "asr-dir", required=True)
+    try:
+        registry.get("asr")
+    except RuntimeError:
+        pass
+    assert not registry.ready(lazy=True)
@@ -0,0 +1,33 @@
+from concurrent.futures import Future
+
+import pytest
+
+from my_funasr.process_pool import ProcessPoolRunner
+
+
+def _pool(**kwargs):
+    return ProcessPoolRunner(None, {}, None, num_workers=2, **kwargs)
+
+
+def test_pending_jobs_fail_when_last_worker_gives_up():
+    pool = _pool()
+    future = Future()
+    pool._pending["t1"] = future
+    pool._workers[0]["state"] = "error"
+    pool._fail_pending_if_no_workers()
+    assert not future.done()  # 仍有 worker 可能领取
+
+    pool._workers[1]["state"] = "error"
+    pool._fail_pending_if_no_workers()
+    with pytest.raises(RuntimeError, match="no inference worker"):
+        future.result(timeout=0)
+    assert pool._pending == {}
+
+
+def test_wait_gives_up_when_task_never_finishes():
+    pool = _pool(min_task_timeout_s=0.05, max_queue_wait_s=0.05)
+    future = Future()
+    pool._pending["t1"] = future
+    with pytest.raises(TimeoutError):
+        pool._wait("t1", future, duration=None)
+    assert "t1" not in pool._pending
@@ -0,0 +1,93 @@
+import io
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from my_funasr import result_cache as result_cache_module
+from my_funasr.result_cache import ResultCache, result_key
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(result_cache_module.time, "time", clock)
+    return clock
+
+
+def test_memory_entries_expire_after_ttl(clock):
+    cache = ResultCache(max_entries=4, ttl_seconds=60)
+    cache.put("k", {"text": "你好"})
+    clock.now += 59
+    assert cache.get("k") == {"text": "你好"}
+    clock.now += 2
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"], stats["entries"]) == (1, 1, 1, 0)
+
+
+def test_disk_layer_survives_restart_and_honours_ttl(clock, tmp_path):
+    ResultCache(ttl_seconds=60, cache_dir=str(tmp_path)).put("k", {"text": "你好"})
+    # 新实例（相当于进程重启）从磁盘命中并回填内存
+    restarted = ResultCache(ttl_seconds=60, cache_dir=str(tmp_path))
+    assert restarted.get("k") == {"text": "你好"}
+    assert restarted.stats()["disk_hits"] == 1
+    clock.now += 61
+    assert ResultCache(ttl_seconds=60, cache_dir=str(tmp_path)).get("k") is None
+    assert not os.path.exists(tmp_path / "k.json")
+
+
+def test_lru_bound_and_key_depends_on_config():
+    cache = ResultCache(max_entries=2, ttl_seconds=None)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    assert cache.get("a") is None and cache.get("c") == "c"
+    assert result_key("h", {"asr": "x", "vad": None}) == result_key("h", {"vad": None, "asr": "x"})
+    assert result_key("h", {"asr": "x"}) != result_key("h", {"asr": "y"})
+
+
+def _wav_bytes():
+    buf = io.BytesIO()
+    sf.write(buf, (0.1 * np.sin(np.arange(16000) / 10.0)).astype(np.float32), 16000, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def app_module(monkeypatch, tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("fastapi")
+    monkeypatch.setenv("TASK_STORE", "memory")
+    monkeypatch.setenv("TASK_SPILL_DIR", str(tmp_path / "spill"))
+    monkeypatch.setenv("RESULT_CACHE_DIR", "")
+    import app
+    # 只登记不执行，任务保持在途
+    monkeypatch.setattr(app, "_enqueue", lambda task_id, kind, priority=None, est_duration=None: {"position": 0})
+    app.result_cache._entries.clear()
+    app._inflight.clear()
+    return app
+
+
+def test_duplicate_submissions_coalesce_then_hit_cache(app_module):
+    app = app_module
+    wav = _wav_bytes()
+    first = app._register_submission({"audio_hash": "h1", "audio_bytes": wav}, None)
+    second = app._register_submission({"audio_hash": "h1", "audio_bytes": wav}, None)
+    # 相同音频在途时挂到已有任务上，不再新建
+    assert second["coalesced"] is True and second["task_id"] == first["task_id"]
+    assert app.task_manager.get_task(first["task_id"])["status"] == "queued"
+
+    app.task_manager.update_task(first["task_id"], status="done", result={"text": "你好"}, progress=1.0)
+    app._finish_inflight(first["task_id"])
+    assert app._inflight == {}
+    third = app._register_submission({"audio_hash": "h1", "audio_bytes": wav}, None)
+    assert third["cache_hit"] is True and third["task_id"] != first["task_id"]
+    assert app.task_manager.get_task(third["task_id"])["result"] == {"text": "你好"}
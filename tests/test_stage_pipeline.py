@@ -0,0 +1,101 @@
+import io
+import threading
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from my_funasr.funasr_pipeline import FunASRPipeline
+from my_funasr.stage_pipeline import StagePipeline, parse_stage_workers
+from task_manager import TaskManager
+
+ONE_WORKER = {name: 1 for name in ("decode", "enhance", "segment", "diarization", "asr", "combine")}
+
+
+def _wav(seconds, seed=0):
+    t = np.arange(int(seconds * 16000)) / 16000
+    y = 0.3 * np.sin(2 * np.pi * 200 * t) + 1e-3 * np.random.default_rng(seed).standard_normal(len(t))
+    buf = io.BytesIO()
+    sf.write(buf, y.astype(np.float32), 16000, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = FunASRPipeline(asr_model_dir="stub/asr", audio_cache_bytes=64 << 20)
+    yield pipeline
+    pipeline.batch_scheduler.shutdown()
+
+
+def _create(manager, task_id, wav):
+    manager.create_task(task_id, status="queued", payload={"audio_bytes": wav})
+    return wav
+
+
+def test_full_downstream_queue_blocks_submit(pipeline):
+    manager = TaskManager()
+    stages = StagePipeline(pipeline, manager, workers=ONE_WORKER, queue_size=1)
+    release = threading.Event()
+    asr_step = pipeline._asr_step
+    pipeline._asr_step = lambda *args: release.wait(10) and asr_step(*args)
+
+    accepted, futures = [], []
+
+    def submit_all():
+        for i in range(10):
+            futures.append(stages.submit(f"t{i}", _create(manager, f"t{i}", _wav(1, seed=i))))
+            accepted.append(i)
+
+    submitter = threading.Thread(target=submit_all, daemon=True)
+    submitter.start()
+    time.sleep(0.5)
+    # ASR 卡住时：asr / segment / decode 各一个 worker 加各一格队列，第 7 个提交阻塞在 decode 队列上
+    assert len(accepted) == 6
+    assert stages.stats()["stages"]["asr"]["busy"] == 1
+    release.set()
+    submitter.join(10)
+    assert len(accepted) == 10
+    assert all(f.result(timeout=10) is True for f in futures)
+    assert all(manager.get_task(f"t{i}")["status"] == "done" for i in range(10))
+    stages.shutdown()
+
+
+def test_stage_failure_fails_only_that_task(pipeline):
+    manager = TaskManager()
+    stages = StagePipeline(pipeline, manager, workers=ONE_WORKER, queue_size=2)
+    vad_step = pipeline._vad_step
+    asr_calls = []
+    asr_step = pipeline._asr_step
+
+    def vad(task_id, *args):
+        if task_id == "bad":
+            raise RuntimeError("vad exploded")
+        return vad_step(task_id, *args)
+
+    pipeline._vad_step = vad
+    pipeline._asr_step = lambda task_id, *args: asr_calls.append(task_id) or asr_step(task_id, *args)
+    bad = stages.submit("bad", _create(manager, "bad", _wav(1)))
+    good = stages.submit("good", _create(manager, "good", _wav(1, seed=1)))
+    assert bad.result(timeout=10) is False
+    assert good.result(timeout=10) is True
+    task = manager.get_task("bad")
+    assert task["status"] == "error" and "vad exploded" in task["error"]
+    assert manager.get_task("good")["status"] == "done"
+    # 失败的任务不再进入后续阶段
+    assert asr_calls == ["good"]
+    stages.shutdown()
+
+
+def test_submit_after_shutdown_raises(pipeline):
+    stages = StagePipeline(pipeline, TaskManager(), workers=ONE_WORKER)
+    stages.shutdown()
+    with pytest.raises(RuntimeError):
+        stages.submit("t1", b"")
+
+
+def test_parse_stage_workers():
+    workers = parse_stage_workers("decode=3, asr=0")
+    assert workers["decode"] == 3 and workers["asr"] == 1 and workers["enhance"] == 1
+    with pytest.raises(ValueError):
+        parse_stage_workers("bogus=2")
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from my_funasr.streaming import StreamingSegmenter, StreamingSession
+
+SR = 16000
+
+
+def _speech(seconds, seed=0):
+    """200Hz 正弦，每 2 秒中前 1 秒有声，便于产生多个分段"""
+    t = np.arange(int(seconds * SR)) / SR
+    rng = np.random.default_rng(seed)
+    return (0.3 * np.sin(2 * np.pi * 200 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0) + 1e-4 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def test_push_frame_longer_than_ring_buffer():
+    seg = StreamingSegmenter(sample_rate=SR, ring_seconds=60.0)
+    audio = _speech(70)
+    closed = seg.push(audio[:50])  # 不足一帧的残片
+    closed += seg.push(audio[50:])  # 单块超过整个环形缓冲
+    closed += seg.flush()
+    assert len(closed) >= 30
+    assert closed[-1]["end"] > 60.0
+    assert all(len(s["audio"]) > 0 for s in closed)
+
+
+class _FakeWebSocket:
+    def __init__(self, messages):
+        self._messages = list(messages)
+        self.sent = []
+
+    async def receive(self):
+        if self._messages:
+            return self._messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send_json(self, msg):
+        self.sent.append(msg)
+
+
+class _FakeScheduler:
+    def submit(self, audio, sample_rate=16000, task_id=None, index=None):
+        fut = Future()
+        fut.set_result(f"seg{index}")
+        return fut
+
+
+def test_session_with_one_large_frame_finishes():
+    pcm = (_speech(61) * 32767).astype("<i2").tobytes()
+    ws = _FakeWebSocket([
+        {"type": "websocket.receive", "bytes": pcm[:960]},
+        {"type": "websocket.receive", "bytes": pcm[960:]},
+        {"type": "websocket.receive", "text": '{"type": "end"}'},
+    ])
+    session = StreamingSession(ws, _FakeScheduler(), sample_rate=SR, dtype="int16")
+    asyncio.run(asyncio.wait_for(session.run(), timeout=30))
+    assert ws.sent[-1]["type"] == "done"
+    assert not [m for m in ws.sent if m["type"] == "error"]
+    assert len(ws.sent[-1]["segments"]) >= 25
+
+
+class _StoppedScheduler:
+    def submit(self, audio, sample_rate=16000, task_id=None, index=None):
+        raise RuntimeError("batch scheduler stopped")
+
+
+def test_failed_submit_returns_inflight_permit():
+    async def submit_twice():
+        session = StreamingSession(_FakeWebSocket([]), _StoppedScheduler(), sample_rate=SR, max_inflight=1)
+        for index in range(2):
+            seg = {"index": index, "start": 0.0, "end": 1.0, "audio": _speech(1)}
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(session._submit_final(seg), timeout=1)
+        return session._inflight.locked()
+
+    assert asyncio.run(submit_twice()) is False
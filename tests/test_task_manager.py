@@ -0,0 +1,120 @@
+import asyncio
+import gc
+import io
+import weakref
+
+import numpy as np
+import soundfile as sf
+
+from my_funasr.audio_cache import WaveformCache
+from task_manager import TaskManager
+
+
+def _manager(tmp_path, cache, budget):
+    return TaskManager(
+        max_memory_bytes=budget,
+        spill_dir=str(tmp_path),
+        on_spill=lambda payload, field, value: cache.discard_value(payload.get("audio_hash"), value),
+    )
+
+
+def test_spill_releases_array_held_by_cache(tmp_path):
+    cache = WaveformCache(max_bytes=64 << 20)
+    audio = np.ones(1 << 20, dtype=np.float32)  # 4MB
+    cache.put("h", "enhanced", audio)
+    ref = weakref.ref(audio)
+    manager = _manager(tmp_path, cache, budget=6 << 20)
+    manager.create_task("t1", status="queued", payload={"audio_hash": "h", "audio": audio})
+    del audio
+    assert manager.memory_usage()["resident_bytes"] == 4 << 20
+
+    # 未超预算时不落盘；调低预算后落盘
+    assert manager.enforce_memory_budget() == 0
+    manager.max_memory_bytes = 1 << 20
+    assert manager.enforce_memory_budget() == 4 << 20
+    gc.collect()
+    # 任务表与缓存都不再引用原数组，内存真正释放
+    assert ref() is None
+    assert cache.stats()["bytes"] == 0
+    assert manager.memory_usage()["resident_bytes"] == 0
+    assert isinstance(manager.get_task("t1")["payload"]["audio"], np.memmap)
+
+
+def test_running_task_waveform_is_spilled(tmp_path):
+    cache = WaveformCache(max_bytes=64 << 20)
+    manager = _manager(tmp_path, cache, budget=1 << 20)
+    manager.create_task("t1", status="running", payload={"audio_hash": "h"})
+    # 阶段结束写回波形时超出预算，立即落盘
+    manager.merge_payload("t1", audio=np.ones(1 << 20, dtype=np.float32), enhanced=True)
+    assert isinstance(manager.get_payload("t1")["audio"], np.memmap)
+    assert manager.memory_usage()["resident_bytes"] == 0
+
+
+def test_pipeline_reads_spilled_waveform_between_stages(tmp_path):
+    from my_funasr.funasr_pipeline import FunASRPipeline
+
+    pipeline = FunASRPipeline(asr_model_dir="stub/asr", enhance_model_dir="stub/enhance", audio_cache_bytes=64 << 20)
+    manager = TaskManager(max_memory_bytes=64 << 10, spill_dir=str(tmp_path),
+                          on_spill=lambda payload, field, value: pipeline.audio_cache.discard_value(payload.get("audio_hash"), value))
+    seen = []
+    asr_step = pipeline._asr_step
+    pipeline._asr_step = lambda task_id, audio, *args: seen.append(audio) or asr_step(task_id, audio, *args)
+    buf = io.BytesIO()
+    sf.write(buf, (0.1 * np.sin(np.arange(16000 * 3) / 10.0)).astype(np.float32), 16000, format="WAV", subtype="PCM_16")
+    try:
+        manager.create_task("t1", status="queued", payload={"audio_hash": "h"})
+        pipeline._run_full_sync("t1", buf.getvalue(), manager)
+    finally:
+        pipeline.batch_scheduler.shutdown()
+    assert manager.get_task("t1")["status"] == "done"
+    # 识别阶段读的是落盘后的增强音频，增强结果也不再留在波形缓存中
+    assert isinstance(seen[0], np.memmap)
+    assert pipeline.audio_cache.peek("h", "enhanced") is None
+
+
+def test_resident_total_tracks_payload_changes(tmp_path):
+    manager = TaskManager(max_memory_bytes=64 << 20, spill_dir=str(tmp_path))
+    manager.create_task("t1", status="queued", payload={"audio_bytes": b"x" * 1000})
+    manager.merge_payload("t1", audio=np.zeros(250, dtype=np.float32))
+    assert manager.memory_usage()["resident_bytes"] == 2000
+    manager.update_task("t1", status="done")
+    manager.delete_task("t1")
+    assert manager.memory_usage()["resident_bytes"] == 0
+
+
+def test_changes_since_returns_only_newer_fields_and_stages(tmp_path):
+    manager = TaskManager(spill_dir=str(tmp_path))
+    manager.create_task("t1", status="queued")
+    manager.update_task("t1", status="running", progress=0.2)
+    v = manager.changes_since("t1")["version"]
+    manager.update_task("t1", stage_name="vad", stage_status="done", stage_elapsed=0.5)
+    # 仅 payload 变化不递增版本
+    manager.merge_payload("t1", duration=3.0)
+    manager.update_task("t1", progress=0.2)
+    changes = manager.changes_since("t1", v)
+    assert changes == {"version": v + 1, "status": "running", "stages": {"vad": {"status": "done", "elapsed_s": 0.5}}}
+    assert set(manager.changes_since("t1", 0)) >= {"status", "progress", "message", "error", "result", "stages"}
+    assert manager.changes_since("missing") is None
+
+
+def test_wait_for_version_wakes_on_update_from_worker_thread(tmp_path):
+    manager = TaskManager(spill_dir=str(tmp_path))
+    manager.create_task("t1", status="queued")
+
+    async def wait():
+        # 已有更新的版本时立即返回
+        assert await manager.wait_for_version("t1", 0, timeout=1) == 1
+        task = asyncio.ensure_future(manager.wait_for_version("t1", 1, timeout=5))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        await asyncio.to_thread(manager.update_task, "t1", status="running")
+        version = await asyncio.wait_for(task, 1)
+        # 超时返回当前版本；删除任务唤醒等待者并返回 None
+        timed_out = await manager.wait_for_version("t1", version, timeout=0.05)
+        gone = asyncio.ensure_future(manager.wait_for_version("t1", version, timeout=5))
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(manager.delete_task, "t1")
+        return version, timed_out, await asyncio.wait_for(gone, 1)
+
+    assert asyncio.run(wait()) == (2, 2, None)
+    assert manager._waiters == {}
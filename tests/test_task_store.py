@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import numpy as np
+
+from task_store import SQLiteTaskStore
+
+
+def _store(tmp_path):
+    return SQLiteTaskStore(str(tmp_path / "tasks.db"), payload_dir=str(tmp_path / "payloads"))
+
+
+def test_merge_payload_writes_waveform_once(tmp_path):
+    store = _store(tmp_path)
+    store.create_task("t1", status="queued", payload={"audio_bytes": b"RIFF" * 1000})
+    audio = np.arange(16000, dtype=np.float32)
+    store.merge_payload("t1", audio=audio, enhanced=False, sr=16000)
+    path = os.path.join(store.payload_dir, "t1.audio.npy")
+    mtime = os.stat(path).st_mtime_ns
+    written = store.memory_usage()["spilled"]
+
+    # 同一数组、读出的 memmap、重复的原始字节再次合并时只更新轻量字段
+    store.merge_payload("t1", audio=audio, duration=1.0)
+    store.merge_payload("t1", audio=store.get_payload("t1")["audio"], audio_bytes=b"RIFF" * 1000, enhanced=True)
+    assert os.stat(path).st_mtime_ns == mtime
+    assert store.memory_usage()["spilled"] == written
+    payload = store.get_payload("t1")
+    assert payload["enhanced"] is True and payload["duration"] == 1.0
+    np.testing.assert_array_equal(payload["audio"], audio)
+
+    # 新数组照常覆盖
+    store.merge_payload("t1", audio=audio * 2)
+    np.testing.assert_array_equal(store.get_payload("t1")["audio"], audio * 2)
+
+
+def test_wait_for_version_wakes_on_other_process_update(tmp_path):
+    waiting = _store(tmp_path)
+    waiting.poll_interval = 0.05
+    other = _store(tmp_path)  # 同一数据库的另一个连接，相当于另一个进程
+    other.create_task("t1", status="queued")
+    reads = []
+    version = waiting._version
+    waiting._version = lambda task_id: reads.append(task_id) or version(task_id)
+
+    async def wait():
+        task = asyncio.ensure_future(waiting.wait_for_version("t1", 1, timeout=5))
+        await asyncio.sleep(0.3)
+        # 等待期间事件循环上不再逐个轮询版本
+        assert len(reads) == 1
+        await asyncio.to_thread(other.update_task, "t1", status="running")
+        return await asyncio.wait_for(task, 2)
+
+    assert asyncio.run(wait()) == 2
+    assert len(reads) == 2
+
+
+def test_changes_since_matches_memory_manager(tmp_path):
+    store = _store(tmp_path)
+    store.create_task("t1", status="queued")
+    store.update_task("t1", status="running", progress=0.5)
+    v = store.changes_since("t1")["version"]
+    store.update_task("t1", stage_name="asr", stage_status="done")
+    store.update_task("t1", message="识别中")
+    changes = store.changes_since("t1", v)
+    assert changes == {"version": v + 2, "status": "running", "message": "识别中", "stages": {"asr": {"status": "done"}}}
+    assert store.changes_since("missing") is None
@@ -0,0 +1,25 @@
+from my_funasr.text_postprocess import combine_segments, merge_overlap
+
+
+def test_merge_overlap_drops_repeated_prefix():
+    assert merge_overlap("今天天气很好我们", "我们去公园") == ("今天天气很好我们", "去公园")
+
+
+def test_merge_overlap_keeps_tags_and_handles_fuzzy_overlap():
+    # 两段对重叠部分的识别略有出入（园/圆），以最长公共片段为拼接点
+    prev, nxt = merge_overlap("我们明天上午去公园散步了", "<|zh|><|NEUTRAL|>去公圆散步了然后回家", max_overlap_chars=10)
+    assert prev == "我们明天上午去公园散步了"
+    assert nxt == "<|zh|><|NEUTRAL|>然后回家"
+
+
+def test_merge_overlap_without_common_text_is_unchanged():
+    assert merge_overlap("你好", "世界") == ("你好", "世界")
+
+
+def test_combine_segments_dedupes_only_overlapping_chunks():
+    chunks = [
+        {"start": 0.0, "end": 30.0, "text": "第一段结尾的话"},
+        {"start": 29.0, "end": 59.0, "text": "结尾的话第二段"},
+        {"start": 60.0, "end": 62.0, "text": "话第三段"},
+    ]
+    assert combine_segments(chunks) == "第一段结尾的话第二段话第三段"
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import os
+import zipfile
+
+import pytest
+
+from my_funasr.audio_cache import audio_digest
+from my_funasr.upload import InvalidUploadError, UploadTooLargeError, extract_zip, spool_multipart
+
+BOUNDARY = "testboundary"
+HEADERS = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+def _zip_of_zeros(n_members, member_bytes):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i in range(n_members):
+            zf.writestr(f"clip{i}.wav", b"\0" * member_bytes)
+    return buf.getvalue()
+
+
+def test_extract_zip_limits_total_decompressed_bytes(tmp_path):
+    data = _zip_of_zeros(50, 1 << 20)  # 50MB 解压后，压缩包只有几十 KB
+    assert len(data) < 1 << 20
+    with pytest.raises(UploadTooLargeError) as exc:
+        extract_zip(data, max_member_bytes=2 << 20, spool_dir=str(tmp_path), memory_limit=1 << 16, max_total_bytes=8 << 20)
+    assert exc.value.limit == 8 << 20
+    # 已落盘的成员全部清理
+    assert os.listdir(tmp_path) == []
+
+
+def test_extract_zip_total_limit_counts_earlier_files(tmp_path):
+    data = _zip_of_zeros(3, 1 << 20)
+    members = extract_zip(data, spool_dir=str(tmp_path), memory_limit=1 << 16, max_total_bytes=4 << 20)
+    assert len(members) == 3
+    with pytest.raises(UploadTooLargeError):
+        extract_zip(data, spool_dir=str(tmp_path), memory_limit=1 << 16, max_total_bytes=4 << 20, extracted_bytes=2 << 20)
+    for _, payload in members:
+        os.remove(payload["audio_path"])
+
+
+def _form(fields, files):
+    body = b""
+    for name, value in fields.items():
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, filename, content_type, data in files:
+        body += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f"Content-Type: {content_type}\r\n\r\n").encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+async def _chunks(body, size=1000, consumed=None):
+    # 分块传输、没有 Content-Length 的请求体
+    for i in range(0, len(body), size):
+        if consumed is not None:
+            consumed.append(size)
+        yield body[i:i + size]
+
+
+def test_spool_multipart_writes_large_upload_to_disk_once(tmp_path):
+    audio = os.urandom(300_000)
+    body = _form({"priority": "high"}, [("file", "a.wav", "audio/wav", audio), ("file", "b.wav", "audio/wav", b"RIFFsmall")])
+    fields, files = asyncio.run(spool_multipart(HEADERS, _chunks(body), spool_dir=str(tmp_path), memory_limit=64 << 10))
+    assert fields == {"priority": "high"}
+    assert [(f.field, f.filename, f.content_type) for f in files] == [("file", "a.wav", "audio/wav"), ("file", "b.wav", "audio/wav")]
+    big, small = files[0].payload, files[1].payload
+    # 大文件直接落盘（只有这一份临时文件），小文件留在内存
+    assert os.listdir(tmp_path) == [os.path.basename(big["audio_path"])]
+    with open(big["audio_path"], "rb") as f:
+        assert f.read() == audio
+    assert big["audio_hash"] == audio_digest(audio) and big["upload_size"] == len(audio)
+    assert small["audio_bytes"] == b"RIFFsmall"
+
+
+def test_spool_multipart_stops_reading_at_the_cap(tmp_path):
+    body = _form({}, [("file", "a.wav", "audio/wav", b"\0" * (4 << 20))])
+    consumed = []
+    with pytest.raises(UploadTooLargeError) as exc:
+        asyncio.run(spool_multipart(HEADERS, _chunks(body, 64 << 10, consumed), max_file_bytes=1 << 20,
+                                    spool_dir=str(tmp_path), memory_limit=64 << 10))
+    assert exc.value.limit == 1 << 20
+    # 超限后不再读取剩余请求体，已写的临时文件被删除
+    assert sum(consumed) <= (1 << 20) + (128 << 10)
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(spool_multipart(HEADERS, _chunks(body, 64 << 10), max_body_bytes=2 << 20, spool_dir=str(tmp_path)))
+
+
+def test_spool_multipart_per_file_limit_and_bad_requests(tmp_path):
+    body = _form({}, [("files", "a.zip", "application/zip", b"\0" * 5000), ("files", "b.wav", "audio/wav", b"\0" * 5000)])
+    limit = lambda part: 10_000 if part.filename.endswith(".zip") else 4000
+    with pytest.raises(UploadTooLargeError) as exc:
+        asyncio.run(spool_multipart(HEADERS, _chunks(body), max_file_bytes=limit, spool_dir=str(tmp_path), memory_limit=1000))
+    assert exc.value.limit == 4000
+    assert os.listdir(tmp_path) == []
+    with pytest.raises(InvalidUploadError):
+        asyncio.run(spool_multipart({"content-type": "application/json"}, _chunks(b"{}")))
+    with pytest.raises(InvalidUploadError):
+        asyncio.run(spool_multipart(HEADERS, _chunks(body[:7000]), spool_dir=str(tmp_path), memory_limit=1000))
+    assert os.listdir(tmp_path) == []